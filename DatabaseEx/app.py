@@ -1,43 +1,71 @@
-from flask import Flask, send_from_directory
-from routes.users import users_bp
-from routes.products import products_bp
-from routes.orders import orders_bp
-from routes.cart import cart_bp
-from routes.reviews import reviews_bp
-from routes.average_ratings import average_ratings_bp
-from routes.admin import logs_bp
-from flask_jwt_extended import JWTManager
-from flask_cors import CORS  # 导入 Flask-CORS
-
-import os
-
-app = Flask(__name__, static_folder='static')  # 指定静态文件夹路径
-
-# 配置 JWT
-app.config['JWT_SECRET_KEY'] = 'your_secret_key_here'  # 设定 JWT 秘钥
-jwt = JWTManager(app)
-
-# 精确配置 CORS 允许的来源和请求方式
-CORS(app, resources={r"/*": {"origins": ["http://127.0.0.1:5000", "http://192.168.50.207:5000"]}})
-
-# 注册蓝图
-app.register_blueprint(users_bp, url_prefix='/api')
-app.register_blueprint(products_bp, url_prefix='/api')
-app.register_blueprint(orders_bp, url_prefix='/api')
-app.register_blueprint(cart_bp, url_prefix='/api')
-app.register_blueprint(reviews_bp, url_prefix='/api')
-app.register_blueprint(average_ratings_bp, url_prefix='/api')
-app.register_blueprint(logs_bp, url_prefix='/api')
-
-# 提供 HTML 文件服务
-@app.route('/')
-def index():
-    return send_from_directory(os.getcwd(), 'login.html')  # 从项目根目录加载 login.html
-
-# 如果有其他 HTML 页面，可以类似这样添加路由
-@app.route('/<path:filename>')
-def serve_file(filename):
-    return send_from_directory(os.getcwd(), filename)  # 从项目根目录加载指定文件
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)  # 绑定到所有网络接口以允许局域网访问
+from flask import Flask, send_from_directory
+from routes.users import users_bp
+from routes.products import products_bp
+from routes.orders import orders_bp
+from routes.cart import cart_bp
+from routes.reviews import reviews_bp
+from routes.average_ratings import average_ratings_bp, ensure_on_startup
+from routes.admin import logs_bp
+from flask_jwt_extended import JWTManager
+from flask_cors import CORS  # 导入 Flask-CORS
+import db
+import json_provider
+import metrics
+import search_index
+import leaderboard
+import recommender
+import cart_store
+
+import os
+
+app = Flask(__name__, static_folder='static')  # 指定静态文件夹路径
+
+# JSON 序列化（Decimal、datetime、date，安装了 orjson 时使用 orjson）
+json_provider.init_app(app)
+
+# 配置 JWT
+app.config['JWT_SECRET_KEY'] = 'your_secret_key_here'  # 设定 JWT 秘钥
+jwt = JWTManager(app)
+
+# 请求指标（Prometheus 格式，GET /metrics）
+metrics.init_app(app)
+
+# 精确配置 CORS 允许的来源和请求方式
+CORS(app, resources={r"/*": {"origins": ["http://127.0.0.1:5000", "http://192.168.50.207:5000"],
+                             "expose_headers": ["X-Next-Cursor"]}})
+
+# 注册蓝图
+app.register_blueprint(users_bp, url_prefix='/api')
+app.register_blueprint(products_bp, url_prefix='/api')
+app.register_blueprint(orders_bp, url_prefix='/api')
+app.register_blueprint(cart_bp, url_prefix='/api')
+app.register_blueprint(reviews_bp, url_prefix='/api')
+app.register_blueprint(average_ratings_bp, url_prefix='/api')
+app.register_blueprint(logs_bp, url_prefix='/api')
+
+# 请求结束时归还请求级数据库连接
+db.init_app(app)
+
+# 搜索和推荐按排序分数从 average_ratings 出发，缺行或缺触发器时自动迁移
+ensure_on_startup()
+
+# 恢复上次未写回数据库的购物车修改
+cart_store.recover_on_startup()
+
+# 后台构建商品搜索索引、销量排行榜和推荐索引
+search_index.rebuild_in_background()
+leaderboard.rebuild_in_background()
+recommender.rebuild_in_background()
+
+# 提供 HTML 文件服务
+@app.route('/')
+def index():
+    return send_from_directory(os.getcwd(), 'login.html')  # 从项目根目录加载 login.html
+
+# 如果有其他 HTML 页面，可以类似这样添加路由
+@app.route('/<path:filename>')
+def serve_file(filename):
+    return send_from_directory(os.getcwd(), filename)  # 从项目根目录加载指定文件
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)  # 绑定到所有网络接口以允许局域网访问
@@ -0,0 +1,76 @@
+"""身份解析微基准：对比旧做法（装饰器和处理函数各 json.loads 一次 identity）
+与请求级缓存的 CurrentUser，统计每个请求的身份解析开销
+
+不需要数据库。在 DatabaseEx 目录下运行：
+
+    python benchmarks/identity_bench.py --requests 100000 --lookups 2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import g  # noqa: E402
+from flask_jwt_extended import create_access_token, get_jwt_identity, verify_jwt_in_request  # noqa: E402
+
+from app import app  # noqa: E402
+from routes.permissions import create_user_token, current_user  # noqa: E402
+
+
+def legacy_request(lookups):
+    """旧做法：role_required 解析一次，处理函数每次取用户信息再解析一次"""
+    if json.loads(get_jwt_identity()).get('role') != 'buyer':
+        raise RuntimeError('角色不符')
+    for _ in range(lookups):
+        json.loads(get_jwt_identity())['user_id']
+
+
+def cached_request(lookups):
+    """新做法：首次访问解析声明并缓存在 g 上，之后直接读属性"""
+    g.pop('_current_user', None)  # 模拟新请求
+    if current_user().role != 'buyer':
+        raise RuntimeError('角色不符')
+    for _ in range(lookups):
+        current_user().user_id
+
+
+def measure(func, token, requests, lookups):
+    headers = {'Authorization': f'Bearer {token}'}
+    with app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        func(lookups)  # 预热
+        start = time.perf_counter()
+        for _ in range(requests):
+            func(lookups)
+        elapsed = time.perf_counter() - start
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JWT 身份解析微基准')
+    parser.add_argument('--requests', type=int, default=100000, help='模拟的请求数')
+    parser.add_argument('--lookups', type=int, default=1, help='每个请求中处理函数读取用户信息的次数')
+    args = parser.parse_args()
+
+    with app.app_context():
+        legacy_token = create_access_token(identity=json.dumps({'user_id': 1, 'role': 'buyer'}))
+        token = create_user_token(1, 'buyer')
+
+    legacy_us = measure(legacy_request, legacy_token, args.requests, args.lookups)
+    cached_us = measure(cached_request, token, args.requests, args.lookups)
+    report = {
+        'requests': args.requests,
+        'lookups_per_request': args.lookups,
+        'legacy_us_per_request': round(legacy_us, 3),
+        'cached_us_per_request': round(cached_us, 3),
+        'saved_us_per_request': round(legacy_us - cached_us, 3),
+        'speedup': round(legacy_us / cached_us, 2) if cached_us else None
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
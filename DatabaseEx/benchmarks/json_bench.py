@@ -0,0 +1,107 @@
+"""JSON 序列化基准：用 get_products 形状的结果行（含 Decimal 价格与评分）对比
+Flask 默认 JSON、FastJSONProvider 的标准库后端和 orjson 后端生成响应的耗时
+
+不需要数据库。在 DatabaseEx 目录下运行：
+
+    python benchmarks/json_bench.py --rows 100000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from json_provider import FastJSONProvider, orjson  # noqa: E402
+
+
+def product_rows(count, seed=1, with_timestamps=False):
+    """与 products.list 相同字段的结果行；with_timestamps 时附加一列 datetime"""
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    rows = []
+    for product_id in range(1, count + 1):
+        row = {
+            'product_id': product_id,
+            'name': f'商品{product_id}',
+            'price': Decimal(rng.randrange(100, 1000000)) / 100,
+            'stock': rng.randrange(0, 10000),
+            'seller_name': f'seller{rng.randrange(1, 500)}',
+            'average_rating': Decimal(rng.randrange(0, 501)) / 100,
+            'rating_count': rng.randrange(0, 1000)
+        }
+        if with_timestamps:
+            row['created_at'] = base + timedelta(seconds=rng.randrange(0, 86400 * 365))
+        rows.append(row)
+    return rows
+
+
+def measure(app, rows, repeat):
+    """在请求上下文中调用 app.json.response，返回 (最快一次的毫秒数, 响应体)"""
+    best = None
+    body = None
+    with app.test_request_context():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = app.json.response(rows).get_data()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, body
+
+
+def make_app(provider):
+    app = Flask(__name__)
+    if provider is not None:
+        app.json = provider(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 序列化基准')
+    parser.add_argument('--rows', type=int, default=100000, help='结果行数')
+    parser.add_argument('--repeat', type=int, default=5, help='每种实现重复次数，取最快一次')
+    parser.add_argument('--timestamps', action='store_true', help='每行附加一列 datetime')
+    parser.add_argument('--decimal', choices=('str', 'float'), default='str', help='Decimal 输出方式')
+    args = parser.parse_args()
+
+    rows = product_rows(args.rows, with_timestamps=args.timestamps)
+    variants = [('flask_default', DefaultJSONProvider)]
+    variants.append(('fast_json', lambda app: FastJSONProvider(app, backend='json', decimal=args.decimal)))
+    if orjson is not None:
+        variants.append(('fast_orjson', lambda app: FastJSONProvider(app, backend='orjson', decimal=args.decimal)))
+
+    results = {}
+    bodies = {}
+    for name, provider in variants:
+        elapsed_ms, body = measure(make_app(provider), rows, args.repeat)
+        results[name] = {'ms': round(elapsed_ms, 2), 'bytes': len(body)}
+        bodies[name] = body
+
+    # 两个后端的输出必须一致；与 Flask 默认实现相比只有格式差异（键顺序、转义、日期格式）
+    fast = [name for name in bodies if name.startswith('fast_')]
+    identical = all(json.loads(bodies[name]) == json.loads(bodies[fast[0]]) for name in fast)
+
+    baseline = results['flask_default']['ms']
+    for result in results.values():
+        result['speedup'] = round(baseline / result['ms'], 2) if result['ms'] else None
+    report = {
+        'rows': args.rows,
+        'repeat': args.repeat,
+        'timestamps': args.timestamps,
+        'decimal': args.decimal,
+        'orjson_installed': orjson is not None,
+        'fast_backends_identical': identical,
+        'results': results
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
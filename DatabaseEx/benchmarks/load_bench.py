@@ -0,0 +1,339 @@
+"""端到端负载压测：在进程内启动 app，按比例混合买家、卖家、管理员会话驱动全部主要接口，
+输出每个接口的吞吐量与 p50/p95/p99 延迟（JSON），便于在不同提交之间对比
+
+需要本地可用的数据库（默认 config.DB_CONFIG，可用 --database 指向专门的压测库），
+或用 --sqlite 指定一个 SQLite 文件，首次运行时自动建表，无需安装 MySQL。
+在 DatabaseEx 目录下运行：
+
+    python benchmarks/load_bench.py --sessions 300 --workers 16 --seed 1 --output before.json --cleanup
+
+同一 --seed 下每个会话的角色、账号、商品和操作顺序都相同，结果可以直接比较。
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+PASSWORD = 'bench'
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Recorder:
+    """按接口汇总每次调用的状态码和耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # 接口 -> [(状态码, 耗时)]
+
+    def add(self, endpoint, status, elapsed):
+        with self._lock:
+            self._calls.setdefault(endpoint, []).append((status, elapsed))
+
+    def report(self, elapsed):
+        endpoints = {}
+        all_latencies = []
+        total_errors = 0
+        for endpoint, calls in sorted(self._calls.items()):
+            latencies = [latency for _, latency in calls]
+            statuses = {}
+            for status, _ in calls:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            errors = sum(1 for status, _ in calls if status >= 500)
+            endpoints[endpoint] = {
+                'requests': len(calls),
+                'throughput_rps': round(len(calls) / elapsed, 1) if elapsed else None,
+                'errors': errors,
+                'status_counts': statuses,
+                'latency_ms': latency_summary(latencies)
+            }
+            all_latencies.extend(latencies)
+            total_errors += errors
+        return {
+            'requests': len(all_latencies),
+            'throughput_rps': round(len(all_latencies) / elapsed, 1) if elapsed else None,
+            'errors': total_errors,
+            'latency_ms': latency_summary(all_latencies),
+            'endpoints': endpoints
+        }
+
+
+def latency_summary(latencies):
+    return {
+        'p50': round(percentile(latencies, 50) * 1000, 2),
+        'p95': round(percentile(latencies, 95) * 1000, 2),
+        'p99': round(percentile(latencies, 99) * 1000, 2),
+        'max': round(max(latencies) * 1000, 2) if latencies else 0.0
+    }
+
+
+class Session:
+    """一个登录用户的会话：固定来源 IP，调用时按接口名记录耗时"""
+
+    def __init__(self, app, recorder, account):
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.account = account
+        self.environ = {'REMOTE_ADDR': account['ip']}
+        self.headers = {}
+
+    def call(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        response = self.client.open(url, method=method, headers=self.headers,
+                                    environ_base=self.environ, **kwargs)
+        self.recorder.add(endpoint, response.status_code, time.perf_counter() - start)
+        return response
+
+    def login(self):
+        response = self.call('POST /api/users/login', 'POST', '/api/users/login',
+                             json={'username': self.account['username'], 'password': PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f"登录失败 {self.account['username']}: {response.get_json()}")
+        self.headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+def buyer_session(session, rng, fixture):
+    session.login()
+    session.call('GET /api/products', 'GET', '/api/products')
+    product = rng.choice(fixture['products'])
+    session.call('GET /api/products/search', 'GET', '/api/products/search',
+                 query_string={'name': product['name'][-3:]})
+    session.call('GET /api/products/recommend', 'GET', '/api/products/recommend')
+    for item in rng.sample(fixture['products'], k=min(3, len(fixture['products']))):
+        session.call('POST /api/cart', 'POST', '/api/cart',
+                     json={'product_id': item['product_id'], 'quantity': rng.randint(1, 3)})
+    session.call('GET /api/cart', 'GET', '/api/cart')
+    session.call('POST /api/cart/checkout', 'POST', '/api/cart/checkout')
+    session.call('POST /api/orders', 'POST', '/api/orders',
+                 json={'product_id': product['product_id'], 'quantity': 1})
+    session.call('POST /api/reviews', 'POST', '/api/reviews',
+                 json={'product_id': product['product_id'], 'stars': rng.randint(1, 5), 'comment': '压测评价'})
+    session.call('GET /api/reviews/<product_id>', 'GET', f"/api/reviews/{product['product_id']}")
+    session.call('GET /api/orders/my', 'GET', '/api/orders/my')
+
+
+def seller_session(session, rng, fixture):
+    session.login()
+    seller_products = fixture['by_seller'][session.account['user_id']]
+    session.call('GET /api/products/seller', 'GET', '/api/products/seller')
+    product = rng.choice(seller_products)
+    session.call('PUT /api/products/<product_id>', 'PUT', f"/api/products/{product['product_id']}",
+                 json={'name': product['name'], 'price': round(rng.uniform(1, 100), 2), 'stock': 1000000})
+    session.call('GET /api/orders/sales', 'GET', '/api/orders/sales')
+    session.call('GET /api/reviews/seller', 'GET', '/api/reviews/seller')
+
+
+def admin_session(session, rng, fixture):
+    session.login()
+    for name in ('users', 'products', 'orders', 'top-products', 'logs'):
+        session.call(f'GET /api/admin/stats/{name}', 'GET', f'/api/admin/stats/{name}')
+    session.call('GET /api/admin/logs', 'GET', '/api/admin/logs', query_string={'limit': 50})
+    session.call('GET /api/orders', 'GET', '/api/orders')
+
+
+SCRIPTS = {'buyer': buyer_session, 'seller': seller_session, 'admin': admin_session}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        if role not in SCRIPTS:
+            raise argparse.ArgumentTypeError(f'未知角色: {role}')
+        mix[role] = float(weight)
+    return mix
+
+
+def setup(app, args, prefix):
+    """通过接口创建压测账号和商品；管理员账号只能直接写库"""
+    from db import get_connection
+    from queries import execute
+    from counters import platform_counters
+
+    accounts = {'buyer': [], 'seller': [], 'admin': []}
+    client = app.test_client()
+    for role, count in (('buyer', args.buyers), ('seller', args.sellers)):
+        for i in range(count):
+            username = f'{prefix}_{role}_{i}'
+            response = client.post('/api/users/register',
+                                    json={'username': username, 'password': PASSWORD, 'role': role})
+            if response.status_code != 201:
+                raise RuntimeError(f'注册失败 {username}: {response.get_json()}')
+            accounts[role].append({'username': username})
+
+    admin_name = f'{prefix}_admin'
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            execute(cursor, 'users.insert', (admin_name, PASSWORD, 'admin'))
+            platform_counters.apply(cursor, {'total_users': 1})
+            conn.commit()
+            names = [account['username'] for accounts_of_role in accounts.values() for account in accounts_of_role]
+            cursor.execute(
+                f"SELECT user_id, username FROM users WHERE username IN ({', '.join(['%s'] * (len(names) + 1))})",
+                names + [admin_name]
+            )
+            ids = {row['username']: row['user_id'] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+    accounts['admin'].append({'username': admin_name})
+
+    for index, account in enumerate(account for role in ('buyer', 'seller', 'admin') for account in accounts[role]):
+        account['user_id'] = ids[account['username']]
+        account['ip'] = f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}'
+
+    fixture = {'products': [], 'by_seller': {}}
+    for seller in accounts['seller']:
+        session = Session(app, Recorder(), seller)
+        session.login()
+        for i in range(args.products):
+            response = session.call('setup', 'POST', '/api/products', json={
+                'name': f"{prefix}商品{seller['user_id']}_{i}", 'price': 9.9, 'stock': 1000000
+            })
+            if response.status_code != 201:
+                raise RuntimeError(f'创建商品失败: {response.get_json()}')
+        products = session.call('setup', 'GET', '/api/products/seller').get_json()
+        fixture['by_seller'][seller['user_id']] = products
+        fixture['products'].extend(products)
+    return accounts, fixture
+
+
+def cleanup(accounts):
+    """删除压测数据：先清购物车，删除商品时触发器会级联删除订单、评价和平均星级"""
+    from db import get_connection
+    from counters import platform_counters
+    from cart_store import cart_store
+
+    # 先把内存购物车写回，之后删除的 cart 行不会再被后台写回
+    cart_store.flush()
+    buyer_ids = [account['user_id'] for account in accounts['buyer']]
+    seller_ids = [account['user_id'] for account in accounts['seller']]
+    all_ids = [account['user_id'] for role in accounts.values() for account in role]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            if buyer_ids:
+                cursor.execute(f"DELETE FROM cart WHERE user_id IN ({', '.join(['%s'] * len(buyer_ids))})", buyer_ids)
+            if seller_ids:
+                cursor.execute(f"SELECT product_id FROM products WHERE seller_id IN ({', '.join(['%s'] * len(seller_ids))})",
+                               seller_ids)
+                for row in cursor.fetchall():
+                    cursor.execute("DELETE FROM products WHERE product_id = %s", (row['product_id'],))
+            cursor.execute(f"DELETE FROM users WHERE user_id IN ({', '.join(['%s'] * len(all_ids))})", all_ids)
+            conn.commit()
+    finally:
+        conn.close()
+    platform_counters.reconcile()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端接口负载压测')
+    parser.add_argument('--sessions', type=int, default=200, help='会话总数')
+    parser.add_argument('--workers', type=int, default=16, help='并发线程数')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('buyer=70,seller=20,admin=10'),
+                        help='角色比例，如 buyer=70,seller=20,admin=10')
+    parser.add_argument('--buyers', type=int, default=20, help='压测买家账号数')
+    parser.add_argument('--sellers', type=int, default=5, help='压测卖家账号数')
+    parser.add_argument('--products', type=int, default=10, help='每个卖家的商品数')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子，相同种子产生相同的会话序列')
+    parser.add_argument('--database', help='覆盖 DB_CONFIG 中的数据库名，建议使用专门的压测库')
+    parser.add_argument('--sqlite', metavar='PATH', help='改用 SQLite 后端，数据库文件不存在时自动创建')
+    parser.add_argument('--output', help='报告写入的文件，默认输出到标准输出')
+    parser.add_argument('--cleanup', action='store_true', help='结束后删除压测数据并校正平台计数器')
+    args = parser.parse_args()
+
+    if args.database:
+        config.DB_CONFIG['database'] = args.database
+    if args.sqlite:
+        config.DB_CONFIG['backend'] = 'sqlite'
+        config.DB_CONFIG['sqlite_path'] = args.sqlite
+    # 端点执行的语句条数超过声明的上限时按 500 计入错误
+    config.QUERY_BUDGET_CONFIG['enforce'] = True
+
+    from app import app
+    from log_writer import get_log_writer
+    from queries import query_stats, query_budgets
+
+    prefix = f'lb{int(time.time())}_{os.getpid()}'
+    accounts, fixture = setup(app, args, prefix)
+    query_stats.reset()
+    query_budgets.reset()
+
+    # 预先按种子生成每个会话的角色、账号和随机数种子，与线程调度无关
+    plan_rng = random.Random(args.seed)
+    roles = list(args.mix)
+    weights = [args.mix[role] for role in roles]
+    plan = []
+    for _ in range(args.sessions):
+        role = plan_rng.choices(roles, weights)[0]
+        plan.append((role, plan_rng.choice(accounts[role]), plan_rng.randrange(2 ** 32)))
+
+    recorder = Recorder()
+    failures = []
+
+    def run_session(item):
+        role, account, seed = item
+        try:
+            SCRIPTS[role](Session(app, recorder, account), random.Random(seed), fixture)
+        except Exception as e:
+            failures.append(f'{role}: {e}')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(run_session, plan))
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'revision': git_revision(),
+        'config': {
+            'sessions': args.sessions,
+            'workers': args.workers,
+            'mix': args.mix,
+            'buyers': args.buyers,
+            'sellers': args.sellers,
+            'products_per_seller': args.products,
+            'seed': args.seed
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'session_failures': failures[:20],
+        **recorder.report(elapsed),
+        'queries': query_stats.snapshot(),
+        'query_budgets': query_budgets.snapshot()
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    get_log_writer().stop()
+    if args.cleanup:
+        cleanup(accounts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""并发下单压测：N 个并发请求同时购买同一商品，统计吞吐量与超卖数量
+
+需要本地可用的数据库（config.DB_CONFIG）。在 DatabaseEx 目录下运行：
+
+    python benchmarks/oversell_bench.py --orders 500 --stock 100 --workers 32
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from db import get_connection  # noqa: E402
+from counters import platform_counters  # noqa: E402
+from log_writer import get_log_writer  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def login(client, username, password, role):
+    client.post('/api/users/register', json={'username': username, 'password': password, 'role': role})
+    response = client.post('/api/users/login', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        raise RuntimeError(f'登录失败: {response.get_json()}')
+    return response.get_json()['token']
+
+
+def setup(stock):
+    """通过接口创建压测用的卖家、买家和商品，返回 (product_id, 买家 token, 卖家 ID, 买家 ID)"""
+    client = app.test_client()
+    suffix = f'{int(time.time())}_{os.getpid()}'
+    seller_token = login(client, f'bench_seller_{suffix}', 'bench', 'seller')
+    buyer_token = login(client, f'bench_buyer_{suffix}', 'bench', 'buyer')
+
+    response = client.post(
+        '/api/products',
+        json={'name': f'压测商品_{suffix}', 'price': 1.00, 'stock': stock},
+        headers={'Authorization': f'Bearer {seller_token}'}
+    )
+    if response.status_code != 201:
+        raise RuntimeError(f'创建商品失败: {response.get_json()}')
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT user_id, username FROM users WHERE username IN (%s, %s)",
+                (f'bench_seller_{suffix}', f'bench_buyer_{suffix}')
+            )
+            ids = {row['username']: row['user_id'] for row in cursor.fetchall()}
+            seller_id = ids[f'bench_seller_{suffix}']
+            cursor.execute("SELECT product_id FROM products WHERE seller_id = %s", (seller_id,))
+            product_id = cursor.fetchone()['product_id']
+    finally:
+        conn.close()
+    return product_id, buyer_token, seller_id, ids[f'bench_buyer_{suffix}']
+
+
+def run(product_id, token, orders, workers):
+    local = threading.local()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def place_order(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/api/orders', json={'product_id': product_id, 'quantity': 1}, headers=headers)
+        return response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(place_order, range(orders)))
+    return results, time.perf_counter() - start
+
+
+def inspect(product_id):
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT stock FROM products WHERE product_id = %s", (product_id,))
+            final_stock = cursor.fetchone()['stock']
+            cursor.execute(
+                "SELECT IFNULL(SUM(quantity), 0) AS sold FROM orders WHERE product_id = %s AND status = '已支付'",
+                (product_id,)
+            )
+            sold = int(cursor.fetchone()['sold'])
+    finally:
+        conn.close()
+    return final_stock, sold
+
+
+def cleanup(product_id, user_ids):
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            # 删除商品会由触发器级联删除订单、评价和平均星级
+            cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+            cursor.execute(
+                f"DELETE FROM users WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})",
+                user_ids
+            )
+            conn.commit()
+    finally:
+        conn.close()
+    platform_counters.reconcile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发下单超卖压测')
+    parser.add_argument('--orders', type=int, default=200, help='并发下单请求总数')
+    parser.add_argument('--stock', type=int, default=50, help='商品初始库存')
+    parser.add_argument('--workers', type=int, default=32, help='并发线程数')
+    parser.add_argument('--cleanup', action='store_true', help='结束后删除压测数据并校正平台计数器')
+    args = parser.parse_args()
+
+    product_id, token, seller_id, buyer_id = setup(args.stock)
+    results, elapsed = run(product_id, token, args.orders, args.workers)
+    final_stock, sold = inspect(product_id)
+
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    latencies = [latency for _, latency in results]
+
+    report = {
+        'orders': args.orders,
+        'workers': args.workers,
+        'initial_stock': args.stock,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(args.orders / elapsed, 1) if elapsed else None,
+        'status_counts': statuses,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2)
+        },
+        'sold': sold,
+        'final_stock': final_stock,
+        'oversell': max(0, sold - args.stock),
+        'stock_consistent': final_stock == args.stock - sold and final_stock >= 0
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    get_log_writer().stop()
+    if args.cleanup:
+        cleanup(product_id, [seller_id, buyer_id])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import CART_CONFIG
+from db import get_connection
+from queries import execute, placeholders, repeat
+
+
+class _Cart:
+    """单个用户的购物车：items 为 product_id -> 数量，按加入顺序排列"""
+    __slots__ = ('items', 'version', 'persisted', 'lock', 'persist_lock')
+
+    def __init__(self, items):
+        self.items = OrderedDict(items)
+        self.version = 0        # 每次修改加一
+        self.persisted = 0      # 已写入数据库的版本
+        self.lock = threading.Lock()          # 保护 items 的读写，只在内存操作期间持有
+        self.persist_lock = threading.Lock()  # 同一用户的落库（后台刷新、结算）串行执行
+
+    @property
+    def dirty(self):
+        return self.version != self.persisted
+
+
+class CartStore:
+    """写回式购物车存储
+
+    购物车的增删改只修改内存并追加一行本地日志文件（journal），由后台线程按 flush_interval
+    把有改动的用户合并成一次 DELETE + 一次多行 INSERT 写入 cart 表，同一用户在一个周期内的多次修改
+    只落库一次。结算时在下单事务内同步写入该用户的购物车。
+
+    journal 记录每次修改后该用户购物车的完整内容，进程崩溃后重启时按每个用户最后一条记录恢复，
+    再由后台线程补写数据库。每次刷新前把当前 journal 轮换为编号段（journal_path.N），
+    段中每个用户记录的版本都已落库后按从旧到新的顺序删除，持续有写入时 journal 也不会无限增长。
+    内存中的购物车是唯一的权威数据，多进程部署时需要按用户把请求固定到同一进程。
+    """
+
+    def __init__(self, flush_interval=1.0, batch_users=200, max_users=100000, idle_ttl=1800,
+                 journal_path='cart_journal.jsonl', journal_fsync=False):
+        self.flush_interval = flush_interval
+        self.batch_users = batch_users
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.journal_path = journal_path
+        self.journal_fsync = journal_fsync
+
+        self._lock = threading.Lock()            # 保护 _carts、_dirty、_last_used
+        self._carts = {}                         # user_id -> _Cart
+        self._last_used = OrderedDict()          # user_id -> 最近访问时间，按 LRU 排列
+        self._dirty = set()                      # 有未落库修改的用户
+        self._journal_lock = threading.Lock()    # journal 追加与轮换互斥，修改标记脏与追加在同一临界区
+        self._journal = None
+        self._journal_users = set()              # 当前 journal 中有记录的用户
+        self._segments = []                      # 已轮换的段 [(路径, [(user_id, 购物车, 需落库的版本)])]，从旧到新
+        self._segment_seq = 0
+        self._counters = {
+            'loads': 0,
+            'edits': 0,
+            'flushes': 0,
+            'flushed_users': 0,
+            'flush_failures': 0,
+            'evicted': 0,
+            'recovered_users': 0
+        }
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    # ---- 读写接口 ----
+
+    def items(self, user_id):
+        """当前购物车内容 [(product_id, 数量)]"""
+        cart = self._get(user_id)
+        with cart.lock:
+            return list(cart.items.items())
+
+    def quantity(self, user_id, product_id):
+        cart = self._get(user_id)
+        with cart.lock:
+            return cart.items.get(product_id)
+
+    def add(self, user_id, product_id, quantity):
+        """加入购物车，已存在时累加数量，返回累加后的数量"""
+        return self._edit(user_id, lambda items: items.get(product_id, 0) + quantity, product_id)
+
+    def set(self, user_id, product_id, quantity):
+        """修改购物车中已有商品的数量；商品不在购物车中时返回 None"""
+        return self._edit(user_id, lambda items: quantity if product_id in items else None, product_id)
+
+    def remove(self, user_id, product_id):
+        """移除商品，返回是否存在"""
+        return self._edit(user_id, lambda items: 0 if product_id in items else None, product_id) is not None
+
+    def discard_products(self, user_id, product_ids):
+        """从内存购物车中去掉已不存在的商品"""
+        def drop(items):
+            removed = [product_id for product_id in product_ids if product_id in items]
+            for product_id in removed:
+                del items[product_id]
+            return removed
+        return self._modify(user_id, drop)
+
+    def _edit(self, user_id, compute, product_id):
+        """compute(items) 返回新数量；None 表示不修改，0 表示移除"""
+        def apply(items):
+            quantity = compute(items)
+            if quantity is not None:
+                if quantity:
+                    items[product_id] = quantity
+                else:
+                    items.pop(product_id, None)
+            return quantity
+        return self._modify(user_id, apply)
+
+    def _modify(self, user_id, change):
+        """在用户购物车锁内执行 change(items)，返回值为真或为 0 时记为一次修改"""
+        while True:
+            cart = self._get(user_id)
+            with cart.lock:
+                # 取出后到加锁前可能已被淘汰，淘汰的对象不能再修改
+                if self._carts.get(user_id) is not cart:
+                    continue
+                result = change(cart.items)
+                if result or result == 0:
+                    self._changed(user_id, cart)
+            if result or result == 0:
+                self._ensure_flusher()
+            return result
+
+    def _changed(self, user_id, cart):
+        """在 cart.lock 内调用：版本加一、写 journal、标记为待落库"""
+        cart.version += 1
+        with self._journal_lock:
+            self._append_journal(user_id, cart.items)
+            with self._lock:
+                self._dirty.add(user_id)
+                self._counters['edits'] += 1
+
+    def _get(self, user_id):
+        """取出用户的购物车，不在内存中时从 cart 表加载"""
+        with self._lock:
+            cart = self._carts.get(user_id)
+            self._touch(user_id)
+        if cart is not None:
+            return cart
+
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                execute(cursor, 'cart.items', (user_id,))
+                rows = cursor.fetchall()
+        finally:
+            if conn:
+                conn.close()
+        items = OrderedDict()
+        for row in rows:
+            items[row['product_id']] = items.get(row['product_id'], 0) + row['quantity']
+
+        with self._lock:
+            # 并发加载时以先放入的为准
+            cart = self._carts.setdefault(user_id, _Cart(items))
+            self._counters['loads'] += 1
+            self._evict()
+        return cart
+
+    def _touch(self, user_id):
+        self._last_used[user_id] = time.monotonic()
+        self._last_used.move_to_end(user_id)
+
+    def _evict(self, now=None):
+        """在 _lock 内调用：淘汰超出容量或空闲超过 idle_ttl 的已落库购物车"""
+        now = time.monotonic() if now is None else now
+        for user_id in list(self._last_used):
+            if len(self._carts) <= self.max_users and now - self._last_used[user_id] <= self.idle_ttl:
+                break
+            cart = self._carts.get(user_id)
+            if cart is not None:
+                # 正在修改或结算的购物车不淘汰
+                if cart.persist_lock.locked() or not cart.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if cart.dirty:
+                        continue
+                    del self._carts[user_id]
+                finally:
+                    cart.lock.release()
+                self._counters['evicted'] += 1
+            del self._last_used[user_id]
+
+    # ---- 落库 ----
+
+    def checkout(self, user_id):
+        """结算期间独占该用户的购物车落库，返回 (购物车, 当前内容, 版本)
+
+        调用方在下单事务中调用 persist() 写入结算后的购物车，提交后调用 commit_checkout()；
+        无论成功与否最后都要调用 release_checkout()。
+        """
+        while True:
+            cart = self._get(user_id)
+            cart.persist_lock.acquire()
+            if self._carts.get(user_id) is cart:
+                break
+            cart.persist_lock.release()
+        with cart.lock:
+            return cart, OrderedDict(cart.items), cart.version
+
+    def persist(self, cursor, user_ids, snapshots):
+        """在调用方事务中用 snapshots（user_id -> {product_id: 数量}）覆盖这些用户的 cart 行"""
+        execute(cursor, 'cart.delete_users', list(user_ids), ids=placeholders(len(user_ids)))
+        rows = [(product_id, user_id, quantity)
+                for user_id in user_ids for product_id, quantity in snapshots[user_id].items()]
+        if rows:
+            execute(cursor, 'cart.insert_many', [value for row in rows for value in row],
+                    rows=repeat('(%s, %s, %s)', len(rows)))
+
+    def commit_checkout(self, user_id, cart, version, removed):
+        """下单事务提交后从内存购物车中扣除 removed（product_id -> 数量）
+
+        结算读取内容之后没有其他修改时，内存与事务写入的 cart 行一致，直接记为已落库；
+        否则保留待落库，由后台线程写入结算期间的修改。
+        """
+        with cart.lock:
+            unchanged = cart.version == version
+            for product_id, quantity in removed.items():
+                current = cart.items.get(product_id)
+                if current is None:
+                    continue
+                if current <= quantity:
+                    del cart.items[product_id]
+                else:
+                    # 结算期间又加了数量，只扣掉已下单的部分
+                    cart.items[product_id] = current - quantity
+            self._changed(user_id, cart)
+            if unchanged:
+                cart.persisted = cart.version
+                with self._lock:
+                    self._dirty.discard(user_id)
+
+    def release_checkout(self, cart):
+        cart.persist_lock.release()
+
+    def flush(self):
+        """把有改动的用户写入数据库，返回写入的用户数；失败的用户保留待下次重试"""
+        self._rotate_journal()
+        with self._lock:
+            pending = sorted(self._dirty)
+        total = 0
+        for start in range(0, len(pending), self.batch_users):
+            total += self._flush_batch(pending[start:start + self.batch_users])
+        self._remove_persisted_segments()
+        return total
+
+    def _flush_batch(self, user_ids):
+        locked = []
+        snapshots = {}
+        versions = {}
+        for user_id in user_ids:
+            with self._lock:
+                cart = self._carts.get(user_id)
+            # 正在结算的用户跳过，结算会自行落库
+            if cart is None or not cart.persist_lock.acquire(blocking=False):
+                continue
+            locked.append(cart)
+            with cart.lock:
+                snapshots[user_id] = dict(cart.items)
+                versions[user_id] = cart.version
+        if not snapshots:
+            return 0
+
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                # 商品已被删除的条目不再写入，避免外键错误使整批失败
+                product_ids = sorted({product_id for items in snapshots.values() for product_id in items})
+                if product_ids:
+                    execute(cursor, 'products.names', product_ids, ids=placeholders(len(product_ids)))
+                    existing = {row['product_id'] for row in cursor.fetchall()}
+                    for items in snapshots.values():
+                        for product_id in [product_id for product_id in items if product_id not in existing]:
+                            del items[product_id]
+                self.persist(cursor, list(snapshots), snapshots)
+                conn.commit()
+        except Exception as e:
+            print(f"购物车落库失败: {e}")
+            with self._lock:
+                self._counters['flush_failures'] += 1
+            return 0
+        finally:
+            if conn:
+                conn.close()
+            for cart in locked:
+                cart.persist_lock.release()
+
+        with self._lock:
+            for user_id, version in versions.items():
+                cart = self._carts.get(user_id)
+                if cart is None:
+                    continue
+                cart.persisted = max(cart.persisted, version)
+                if not cart.dirty:
+                    self._dirty.discard(user_id)
+            self._counters['flushes'] += 1
+            self._counters['flushed_users'] += len(versions)
+        return len(versions)
+
+    # ---- journal ----
+
+    def _append_journal(self, user_id, items):
+        if not self.journal_path:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        record = {'user_id': user_id, 'items': [[product_id, quantity] for product_id, quantity in items.items()]}
+        self._journal.write(json.dumps(record) + '\n')
+        self._journal.flush()
+        if self.journal_fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_users.add(user_id)
+
+    def _segment_path(self, seq):
+        return f'{self.journal_path}.{seq}'
+
+    def _existing_segments(self):
+        """磁盘上已轮换的段 [(序号, 路径)]，从旧到新"""
+        directory = os.path.dirname(self.journal_path) or '.'
+        prefix = os.path.basename(self.journal_path) + '.'
+        segments = []
+        for name in os.listdir(directory):
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and suffix.isdigit():
+                segments.append((int(suffix), os.path.join(directory, name)))
+        return sorted(segments)
+
+    def _rotate_journal(self):
+        """把当前 journal 轮换为新的段，记下段中每个用户此刻的版本"""
+        if not self.journal_path:
+            return
+        with self._journal_lock:
+            if self._journal is None or not self._journal_users:
+                return
+            self._journal.close()
+            self._journal = None
+            self._segment_seq += 1
+            path = self._segment_path(self._segment_seq)
+            os.replace(self.journal_path, path)
+            with self._lock:
+                # 此刻的版本不低于段中该用户最后一条记录的版本
+                required = [(user_id, self._carts[user_id], self._carts[user_id].version)
+                            for user_id in self._journal_users if user_id in self._carts]
+            self._segments.append((path, required))
+            self._journal_users = set()
+
+    def _remove_persisted_segments(self):
+        """按从旧到新的顺序删除记录已全部落库的段
+
+        只删除最旧的段，保证恢复时较旧段中的记录总会被较新的记录覆盖。
+        购物车已被淘汰（淘汰时一定已落库）或落库版本不低于段中的版本时，该用户的记录不再需要。
+        """
+        with self._journal_lock:
+            while self._segments:
+                path, required = self._segments[0]
+                with self._lock:
+                    persisted = all(self._carts.get(user_id) is not cart or cart.persisted >= version
+                                    for user_id, cart, version in required)
+                if not persisted:
+                    return
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._segments.pop(0)
+
+    def recover(self):
+        """启动时按从旧到新读取 journal 各段，把未落库的购物车恢复到内存并标记为待落库，返回恢复的用户数"""
+        if not self.journal_path:
+            return 0
+        segments = self._existing_segments()
+        paths = [path for _, path in segments]
+        if os.path.exists(self.journal_path):
+            paths.append(self.journal_path)
+        if not paths:
+            return 0
+        latest = {}
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半
+                        continue
+                    latest[record['user_id']] = record['items']
+        with self._journal_lock, self._lock:
+            self._segment_seq = segments[-1][0] if segments else 0
+            if paths[-1] == self.journal_path:
+                self._segment_seq += 1
+                paths[-1] = self._segment_path(self._segment_seq)
+                os.replace(self.journal_path, paths[-1])
+            required = []
+            for user_id, items in latest.items():
+                cart = _Cart((product_id, quantity) for product_id, quantity in items)
+                cart.version = 1
+                self._carts[user_id] = cart
+                self._touch(user_id)
+                self._dirty.add(user_id)
+                required.append((user_id, cart, 1))
+            # 已有的段都保留到恢复的购物车全部落库之后
+            self._segments = [(path, required) for path in paths]
+            self._counters['recovered_users'] += len(latest)
+        if latest:
+            self._ensure_flusher()
+        return len(latest)
+
+    # ---- 后台线程 ----
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='cart-flusher', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                with self._lock:
+                    self._evict()
+            except Exception as e:
+                print(f"购物车落库失败: {e}")
+
+    def stop(self):
+        """停止后台线程并写入全部未落库的修改"""
+        self._stop.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['users'] = len(self._carts)
+            stats['dirty_users'] = len(self._dirty)
+        stats['max_users'] = self.max_users
+        stats['flush_interval'] = self.flush_interval
+        return stats
+
+
+cart_store = CartStore(**CART_CONFIG)
+
+
+def recover_on_startup():
+    """启动时在处理请求之前恢复上次未落库的购物车修改"""
+    try:
+        count = cart_store.recover()
+        if count:
+            print(f"已从 journal 恢复 {count} 个用户的购物车，将在后台写入数据库")
+    except Exception as e:
+        print(f"购物车 journal 恢复失败: {e}")
@@ -0,0 +1,128 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+
+from config import CACHE_CONFIG
+
+# 进程启动标识，避免重启后版本号从 0 开始导致旧 ETag 被误判为未变化
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+_version_lock = threading.Lock()
+_catalog_version = 0
+
+
+class LRUCache:
+    """带 TTL 的 LRU 缓存"""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_cache = LRUCache(**CACHE_CONFIG)
+
+
+def catalog_version():
+    """当前商品目录版本号"""
+    return _catalog_version
+
+
+def bump_catalog_version():
+    """商品或评价写入成功后调用，使已缓存的目录响应和 ETag 全部失效"""
+    global _catalog_version
+    with _version_lock:
+        _catalog_version += 1
+    _cache.clear()
+
+
+def _cache_key(version):
+    """按端点、路径参数和规范化后的查询参数生成缓存键"""
+    args = tuple(sorted(
+        (key, value.strip())
+        for key, value in request.args.items(multi=True)
+        if value.strip()
+    ))
+    return request.endpoint, tuple(sorted(request.view_args.items())), args, version
+
+
+def cached_catalog_response(func):
+    """缓存商品目录类 GET 接口的响应，并支持 If-None-Match 返回 304
+
+    必须放在 jwt_required / role_required 之后，鉴权仍对每个请求生效。
+    缓存和版本号都在进程内，多进程部署时其他进程的写入只能靠 TTL 过期。
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # 流式输出不经过缓存
+        if request.args.get('stream'):
+            return func(*args, **kwargs)
+
+        version = _catalog_version
+        etag = f'{_BOOT_ID}-{version}'
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            key = _cache_key(version)
+            cached = _cache.get(key)
+            if cached is None:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cached = (response.get_data(), response.mimetype)
+                # 生成响应期间目录被修改时不写入缓存，避免缓存旧数据
+                if version == _catalog_version:
+                    _cache.set(key, cached)
+            response = make_response(cached[0], 200)
+            response.mimetype = cached[1]
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+def get_cache_stats():
+    """查询目录缓存状态"""
+    stats = _cache.stats()
+    stats['catalog_version'] = _catalog_version
+    return stats
@@ -1,6 +1,89 @@
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': '040812',
-    'database': 'agriculture_db'
-}
+DB_CONFIG = {
+    'backend': 'mysql',       # 数据库后端：mysql / sqlite（单机部署与基准测试用）
+    'sqlite_path': 'agriculture.db',  # sqlite 后端的数据库文件，首次打开时自动建表
+    'sqlite_busy_timeout': 30,        # sqlite 写锁被占用时的最长等待秒数
+    'host': 'localhost',
+    'user': 'root',
+    'password': '040812',
+    'database': 'agriculture_db',
+    # 连接池配置
+    'pool_size': 10,          # 常驻连接数
+    'max_overflow': 10,       # 高峰期允许额外创建的连接数
+    'pool_timeout': 30,       # 连接池耗尽时等待空闲连接的秒数
+    'idle_timeout': 300,      # 空闲超过该秒数的连接在取出时丢弃
+    'pool_recycle': 3600,     # 连接存活超过该秒数后重建
+    'pool_pre_ping': True     # 取出连接时先 ping 检测连接是否可用
+}
+
+LOG_CONFIG = {
+    'queue_size': 10000,          # 内存日志队列容量
+    'batch_size': 500,            # 单次批量写入的最大条数
+    'flush_interval': 1.0,        # 最长攒批时间（秒）
+    'full_policy': 'block',       # 队列满时的处理方式：block / drop / spill
+    'block_timeout': 0.5,         # block 策略下最长等待秒数，超时后丢弃
+    'spill_path': 'logs_spill.jsonl'  # spill 策略及写库失败时的本地落盘文件
+}
+
+CACHE_CONFIG = {
+    'max_entries': 1024,  # 商品目录响应缓存的最大条目数（LRU 淘汰）
+    'ttl': 60             # 缓存条目最长存活秒数
+}
+
+COUNTER_CONFIG = {
+    'shards': 16,     # 每个计数器拆成的行数，分散并发事务对同一行的锁竞争
+    'mirror_ttl': 5   # 内存镜像的最长有效秒数，过期后从计数表重新加载
+}
+
+LOGIN_THROTTLE_CONFIG = {
+    'username_burst': 5,      # 同一用户名可连续尝试的次数
+    'username_rate': 0.1,     # 同一用户名每秒恢复的尝试次数（每 10 秒一次）
+    'ip_burst': 20,           # 同一 IP 可连续尝试的次数
+    'ip_rate': 1.0,           # 同一 IP 每秒恢复的尝试次数
+    'max_keys': 100000,       # 令牌桶状态的 LRU 容量（用户名、IP 各一份）
+    'report_interval': 60     # 登录失败汇总日志的写入间隔（秒）
+}
+
+CART_CONFIG = {
+    'flush_interval': 1.0,        # 购物车修改写回 cart 表的周期（秒），周期内同一用户的多次修改合并落库
+    'batch_users': 200,           # 每个写回事务包含的最大用户数
+    'max_users': 100000,          # 内存中保留的购物车数，超出时淘汰最久未访问且已落库的
+    'idle_ttl': 1800,             # 已落库的购物车空闲超过该秒数后从内存淘汰，再次访问时从 cart 表加载
+    'journal_path': 'cart_journal.jsonl',  # 未落库修改的本地日志（刷新时轮换为 .1、.2 … 段），进程崩溃后重启时据此恢复
+    'journal_fsync': False        # 每次修改后 fsync journal；False 时可承受进程崩溃，不保证断电不丢
+}
+
+PRODUCT_IMPORT_CONFIG = {
+    'chunk_size': 500,     # 每个事务写入的行数，每块只记一条汇总日志
+    'max_rows': 200000,    # 单次请求最多导入的行数
+    'max_errors': 1000     # 响应中最多返回的逐行错误数
+}
+
+JSON_CONFIG = {
+    'backend': 'auto',   # auto：安装了 orjson 时使用，否则用标准库 json；也可指定 'orjson' 或 'json'
+    'decimal': 'str'     # Decimal（价格、评分）输出为字符串 'str'（保留精度）或数字 'float'
+}
+
+RANKING_CONFIG = {
+    # 商品排序分数为贝叶斯平均 (星级总和 + prior_count * prior_mean) / (评价数 + prior_count)，
+    # 评价少的商品向 prior_mean 收缩。由评价触发器维护，修改后执行 POST /api/average_ratings/migrate 重建触发器并重算
+    'prior_mean': 3.0,   # 先验星级
+    'prior_count': 5     # 先验评价数，越大评价数的影响越大
+}
+
+RECOMMEND_CONFIG = {
+    'backend': 'auto',        # auto：安装了 numpy/scipy 时用稀疏矩阵计算相似度，否则用纯 Python；也可指定 'scipy' 或 'python'
+    'top_k': 20,              # 每个商品保留的最相似商品数
+    'max_user_items': 100,    # 每个买家参与相似度计算和打分的商品数上限（按权重取前 N）
+    'purchase_weight': 1.0,   # 买过（已支付订单）的基础权重
+    'rating_weight': 0.5,     # 评价每比 3 星高/低一星加/减的权重，1 星差评抵消购买权重
+    'rebuild_interval': 600   # 后台重建推荐索引的周期（秒），0 表示只在启动时构建
+}
+
+QUERY_BUDGET_CONFIG = {
+    'enforce': False  # 请求执行的语句条数超过端点声明的上限时直接报错（压测和开发环境使用）
+}
+
+METRICS_CONFIG = {
+    # 请求耗时与请求内 SQL 耗时直方图的分桶上界（秒）
+    'buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+}
@@ -0,0 +1,180 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from config import COUNTER_CONFIG
+from db import get_connection
+from queries import execute, repeat
+
+LOW_STOCK_THRESHOLD = 10
+
+# 平台计数器；total_sales 为金额，其余为整数计数
+COUNTER_NAMES = (
+    'total_users', 'total_buyers', 'total_sellers',
+    'total_products', 'low_stock_products',
+    'total_orders', 'completed_orders', 'canceled_orders', 'total_sales',
+    'total_logs', 'log_users'
+)
+
+# 从业务表重新统计各计数器，reconcile 时使用
+_RECONCILE_QUERIES = [
+    """
+        SELECT
+            COUNT(*) AS total_users,
+            SUM(CASE WHEN role = 'buyer' THEN 1 ELSE 0 END) AS total_buyers,
+            SUM(CASE WHEN role = 'seller' THEN 1 ELSE 0 END) AS total_sellers
+        FROM users
+    """,
+    f"""
+        SELECT
+            COUNT(*) AS total_products,
+            SUM(CASE WHEN stock < {LOW_STOCK_THRESHOLD} THEN 1 ELSE 0 END) AS low_stock_products
+        FROM products
+    """,
+    """
+        SELECT
+            COUNT(*) AS total_orders,
+            SUM(CASE WHEN status = '已支付' THEN 1 ELSE 0 END) AS completed_orders,
+            SUM(CASE WHEN status = '已取消' THEN 1 ELSE 0 END) AS canceled_orders,
+            SUM(CASE WHEN status = '已支付' THEN total_price ELSE 0 END) AS total_sales
+        FROM orders
+    """,
+    "SELECT COUNT(*) AS total_logs, COUNT(DISTINCT user_id) AS log_users FROM logs"
+]
+
+
+def is_low_stock(stock):
+    return stock < LOW_STOCK_THRESHOLD
+
+
+def order_deltas(status, total_price, sign=1):
+    """一笔订单对订单类计数器的贡献，sign=-1 表示撤销"""
+    paid = status == '已支付'
+    return {
+        'total_orders': sign,
+        'completed_orders': sign if paid else 0,
+        'canceled_orders': sign if status == '已取消' else 0,
+        'total_sales': sign * Decimal(str(total_price)).quantize(Decimal('0.01')) if paid else 0
+    }
+
+
+def merge(*deltas):
+    """合并多组增量"""
+    merged = {}
+    for delta in deltas:
+        for name, value in delta.items():
+            merged[name] = merged.get(name, 0) + value
+    return merged
+
+
+def _normalize(name, value):
+    # SQLite 的 SUM 对金额返回浮点数，经字符串转换并保留两位小数，与 DECIMAL(16, 2) 一致
+    return Decimal(str(value)).quantize(Decimal('0.01')) if name == 'total_sales' else int(value)
+
+
+class PlatformCounters:
+    """平台计数器：计数表按分片行存储，内存镜像提供常数时间读取
+
+    写入方在业务事务中调用 apply(cursor, deltas)，提交后调用 publish(deltas) 更新本进程镜像；
+    镜像超过 mirror_ttl 秒后从计数表重新加载，因而其他进程的写入也会在 TTL 内体现。
+    """
+
+    def __init__(self, shards=16, mirror_ttl=5):
+        self.shards = shards
+        self.mirror_ttl = mirror_ttl
+        self._lock = threading.Lock()
+        self._values = None
+        self._loaded_at = 0.0
+
+    def apply(self, cursor, deltas):
+        """在当前事务中累加计数，一条语句写完所有非零增量"""
+        rows = [(name, random.randrange(self.shards), value) for name, value in deltas.items() if value]
+        if not rows:
+            return
+        params = [item for row in rows for item in row]
+        execute(cursor, 'counters.add', params, rows=repeat('(%s, %s, %s)', len(rows)))
+
+    def apply_order(self, cursor, order_id, product_id, quantity):
+        """在当前事务中累加一笔新的已支付订单，金额与低库存变化由数据库按刚写入的行计算
+
+        调用方不知道增量的具体值，提交后调用 expire() 让镜像在下次读取时重新加载。
+        """
+        orders, completed, sales, low_stock = (random.randrange(self.shards) for _ in range(4))
+        execute(cursor, 'counters.add_order',
+                (orders, completed, sales, order_id, low_stock, quantity, product_id),
+                threshold=LOW_STOCK_THRESHOLD)
+
+    def publish(self, deltas):
+        """事务提交后同步本进程的内存镜像"""
+        with self._lock:
+            if self._values is None:
+                return
+            for name, value in deltas.items():
+                if value:
+                    self._values[name] = self._values.get(name, 0) + _normalize(name, value)
+
+    def expire(self):
+        """使内存镜像失效，下次读取时从计数表重新加载"""
+        with self._lock:
+            self._loaded_at = float('-inf')
+
+    def snapshot(self, names=COUNTER_NAMES):
+        """读取计数器，镜像有效时不访问数据库"""
+        with self._lock:
+            if self._values is not None and time.monotonic() - self._loaded_at < self.mirror_ttl:
+                return {name: self._values.get(name, _normalize(name, 0)) for name in names}
+        values = self.load()
+        return {name: values.get(name, _normalize(name, 0)) for name in names}
+
+    def load(self):
+        """从计数表加载镜像（至多 计数器数 x 分片数 行）"""
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                execute(cursor, 'counters.load')
+                values = {row['name']: _normalize(row['name'], row['value']) for row in cursor.fetchall()}
+        finally:
+            if conn:
+                conn.close()
+        with self._lock:
+            self._values = values
+            self._loaded_at = time.monotonic()
+        return dict(values)
+
+    def reconcile(self):
+        """按业务表重新统计并覆盖计数表，修正漂移，返回修正前后的值"""
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                # 先锁住计数行，阻止并发写入方在重算期间累加
+                cursor.execute("SELECT name, SUM(value) AS value FROM platform_counters GROUP BY name FOR UPDATE")
+                before = {row['name']: _normalize(row['name'], row['value']) for row in cursor.fetchall()}
+
+                after = {}
+                for sql in _RECONCILE_QUERIES:
+                    cursor.execute(sql)
+                    for name, value in cursor.fetchone().items():
+                        after[name] = _normalize(name, value or 0)
+
+                cursor.execute("DELETE FROM platform_counters")
+                cursor.executemany(
+                    "INSERT INTO platform_counters (name, shard, value) VALUES (%s, 0, %s)",
+                    list(after.items())
+                )
+                conn.commit()
+        finally:
+            if conn:
+                conn.close()
+        with self._lock:
+            self._values = dict(after)
+            self._loaded_at = time.monotonic()
+        return {
+            name: {'before': before.get(name, _normalize(name, 0)), 'after': after[name]}
+            for name in after
+        }
+
+
+platform_counters = PlatformCounters(**COUNTER_CONFIG)
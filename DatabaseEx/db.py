@@ -1,12 +1,261 @@
-import pymysql
-from config import DB_CONFIG
-
-def get_connection():
-    """获取数据库连接"""
-    return pymysql.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        cursorclass=pymysql.cursors.DictCursor
-    )
+import threading
+import time
+from collections import deque
+
+import pymysql
+from flask import g, has_request_context
+from config import DB_CONFIG
+
+
+class PoolTimeoutError(Exception):
+    """连接池耗尽且等待超时"""
+
+
+def is_sqlite():
+    """当前是否使用 SQLite 后端"""
+    return DB_CONFIG.get('backend', 'mysql') == 'sqlite'
+
+
+def _connect():
+    """建立一个新的数据库连接"""
+    if is_sqlite():
+        import sqlite_backend
+        return sqlite_backend.connect(DB_CONFIG['sqlite_path'], DB_CONFIG.get('sqlite_busy_timeout', 30))
+    return pymysql.connect(
+        host=DB_CONFIG['host'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        database=DB_CONFIG['database'],
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def unbuffered_cursor(conn):
+    """无缓冲的字典游标，结果集边读边取，用于流式输出"""
+    if is_sqlite():
+        return conn.cursor(buffered=False)
+    return conn.cursor(pymysql.cursors.SSDictCursor)
+
+
+class PooledConnection:
+    """从连接池取出的连接，close() 时归还连接池而不是真正断开"""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+        self._request_scoped = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        # 请求级连接由请求结束时统一归还，处理函数中的 close() 不做任何事
+        if not self._request_scoped:
+            self.release()
+
+    def release(self):
+        """归还连接池"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, self._created_at)
+
+    def discard(self):
+        """直接关闭连接而不归还（例如无缓冲游标未读完时）"""
+        if not self._released:
+            self._released = True
+            self._pool.discard(self._raw)
+
+
+class ConnectionPool:
+    """有界的数据库连接池"""
+
+    def __init__(self, creator, pool_size=10, max_overflow=10, timeout=30,
+                 idle_timeout=300, recycle=3600, pre_ping=True):
+        self._creator = creator
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # 元素为 (连接, 创建时间, 最近归还时间)
+        self._total = 0        # 已创建且未关闭的连接数
+        self._checked_out = 0  # 正在使用的连接数
+        self._counters = {
+            'checkouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'ping_failures': 0,
+            'waits': 0,
+            'timeouts': 0
+        }
+
+    def acquire(self):
+        """取出一个连接，连接池耗尽时最多等待 timeout 秒"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            raw = None
+            with self._cond:
+                if not self._idle and self._total >= self.pool_size + self.max_overflow:
+                    self._counters['waits'] += 1
+                while not self._idle and self._total >= self.pool_size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeoutError(f'连接池已耗尽，等待 {self.timeout} 秒后仍无可用连接')
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    raw, created_at, last_used = self._idle.pop()
+                else:
+                    # 先占用名额，真正的建连放到锁外进行
+                    self._total += 1
+                self._checked_out += 1
+                self._counters['checkouts'] += 1
+
+            if raw is None:
+                try:
+                    raw = self._creator()
+                except Exception:
+                    self._forget()
+                    raise
+                with self._cond:
+                    self._counters['created'] += 1
+                return PooledConnection(self, raw, time.monotonic())
+
+            now = time.monotonic()
+            if now - last_used > self.idle_timeout or now - created_at > self.recycle or not self._ping(raw):
+                self.discard(raw)
+                continue
+            return PooledConnection(self, raw, created_at)
+
+    def release(self, raw, created_at):
+        """归还连接，回滚未提交的事务；超出常驻数量的连接直接关闭"""
+        try:
+            raw.rollback()
+        except Exception:
+            self.discard(raw)
+            return
+
+        with self._cond:
+            self._checked_out -= 1
+            if len(self._idle) < self.pool_size:
+                self._idle.append((raw, created_at, time.monotonic()))
+                self._cond.notify()
+                return
+            self._total -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify()
+        self._close_quietly(raw)
+
+    def stats(self):
+        """连接池状态"""
+        with self._cond:
+            stats = {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'total': self._total,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out
+            }
+            stats.update(self._counters)
+        return stats
+
+    def dispose(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+        for raw, _, _ in idle:
+            self._close_quietly(raw)
+
+    def _ping(self, raw):
+        if not self.pre_ping:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._cond:
+                self._counters['ping_failures'] += 1
+            return False
+
+    def discard(self, raw):
+        """关闭一个已取出的连接，释放其名额"""
+        self._forget()
+        with self._cond:
+            self._counters['discarded'] += 1
+        self._close_quietly(raw)
+
+    def _forget(self):
+        with self._cond:
+            self._total -= 1
+            self._checked_out -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取全局连接池，首次调用时按 DB_CONFIG 创建"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    pool_size=DB_CONFIG.get('pool_size', 10),
+                    max_overflow=DB_CONFIG.get('max_overflow', 10),
+                    timeout=DB_CONFIG.get('pool_timeout', 30),
+                    idle_timeout=DB_CONFIG.get('idle_timeout', 300),
+                    recycle=DB_CONFIG.get('pool_recycle', 3600),
+                    pre_ping=DB_CONFIG.get('pool_pre_ping', True)
+                )
+    return _pool
+
+
+def get_connection():
+    """获取数据库连接
+
+    在请求上下文中返回本次请求共用的连接，请求结束时归还连接池；
+    否则直接从连接池取出一个连接，调用 close() 即归还。
+    """
+    if has_request_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = get_pool().acquire()
+            conn._request_scoped = True
+            g._db_conn = conn
+        return conn
+    return get_pool().acquire()
+
+
+def release_request_connection(exc=None):
+    """请求结束时归还请求级连接"""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def get_pool_stats():
+    """查询连接池状态"""
+    return get_pool().stats()
+
+
+def init_app(app):
+    """注册请求结束时的连接归还"""
+    app.teardown_request(release_request_connection)
@@ -0,0 +1,547 @@
+"""索引顾问与索引迁移工具
+
+对 queries.QUERIES 中注册的每条语句执行 EXPLAIN（SQLite 后端为 EXPLAIN QUERY PLAN），
+找出全表扫描和额外排序（filesort / 临时 B 树），按 WHERE 与 JOIN 条件给出候选索引，
+并把缺失的索引写成带版本号的迁移文件（migrations/NNNN_名称.sql），由 migrate 按顺序执行。
+
+在 DatabaseEx 目录下运行：
+
+    python index_advisor.py advise            # 输出执行计划问题，--strict 时有未预期的问题则返回 1
+    python index_advisor.py plan --name xxx   # 把缺失的候选索引写成新的迁移文件
+    python index_advisor.py migrate           # 执行尚未执行的迁移
+    python index_advisor.py status            # 查看各迁移的执行情况
+
+迁移文件只包含 CREATE INDEX 等 MySQL 与 SQLite 通用的语句；执行 CREATE INDEX 前先检查
+同名索引或前缀列相同的索引（包括外键自动创建的索引）是否已存在，存在则跳过，因此可以重复执行。
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+import config
+from db import get_connection, is_sqlite
+from queries import QUERIES, placeholders, repeat, sql_for, where
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# 含模板参数的语句按下列取值展开后再分析：[(过滤条件组合, 模板参数)]；
+# products.search、logs.page 按常见的过滤组合各分析一次，报告中的名称形如 logs.page[user_id+after]
+TEMPLATE_VARIANTS = {
+    'products.lock_many': [(None, {'ids': placeholders(3)})],
+    'products.names': [(None, {'ids': placeholders(3)})],
+    'products.reserve_stock_many': [
+        (None, {'case': 'CASE product_id ' + repeat('WHEN %s THEN %s', 2, ' ') + ' END', 'ids': placeholders(2)})
+    ],
+    'products.cart_view': [(None, {'ids': placeholders(3)})],
+    'products.recommend_by_ids': [(None, {'ids': placeholders(3)})],
+    'products.update_many_own': [
+        (None, {**{part: 'CASE product_id ' + repeat('WHEN %s THEN %s', 2, ' ') + ' END'
+                   for part in ('name_case', 'price_case', 'stock_case')}, 'ids': placeholders(2)})
+    ],
+    'products.import_lookup': [(None, {'ids': placeholders(2), 'names': placeholders(2)})],
+    'products.import_lock': [(None, {'ids': placeholders(2), 'names': placeholders(2)})],
+    'cart.delete_users': [(None, {'ids': placeholders(3)})],
+    'logs.users_seen': [(None, {'ids': placeholders(3)})],
+    'products.search': [
+        (keys, {'where': where('products.search', *keys, ids=placeholders(3)), 'limit': ''})
+        for keys in [(), ('name_like',), ('seller_id',), ('candidates',), ('product_id',)]
+    ] + [
+        (('limit',), {'where': '', 'limit': 'LIMIT %s'})
+    ],
+    'orders.export': [
+        (keys, {'where': where('orders.export', *keys, statuses=placeholders(1))})
+        for keys in [(), ('seller_id',), ('status', 'start', 'end'), ('seller_id', 'start', 'end')]
+    ],
+    'logs.page': [
+        (keys, {'where': where('logs.page', *keys)})
+        for keys in [(), ('user_id',), ('action',), ('start', 'end'), ('user_id', 'after')]
+    ],
+}
+
+_ALL = ('full_scan', 'filesort', 'temporary')
+_SORT = ('filesort', 'temporary')
+
+# 按设计就要读取整张表或整体排序的语句及其预期的问题类型，这些问题只提示、不计入 --strict：
+# 全量列表与全量统计；按联表算出的销量排序；选择性高的过滤条件命中少量行后的排序
+EXPECTED_ISSUES = {
+    'users.list': _ALL, 'products.list': _ALL, 'products.index_all': _ALL, 'orders.list': _ALL,
+    'reviews.list': _ALL, 'counters.load': _ALL,
+    'orders.sales_by_product': _ALL, 'orders.sales_by_product_hour': _SORT,
+    'products.search[seller_id]': _SORT, 'products.search[candidates]': _SORT,
+    'products.search[product_id]': _SORT, 'reviews.by_seller': _SORT,
+    'admin.top_products': _SORT, 'admin.top_products_since': _SORT, 'orders.export[]': _ALL,
+    'recommend.purchases': _ALL, 'recommend.ratings': _ALL,
+}
+
+_PARAM = re.compile(r'%([%s])')
+_ALIAS = re.compile(r'\b(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|SET\b|ORDER\b|'
+                    r'GROUP\b|LIMIT\b|FOR\b|INNER\b)(\w+))?', re.IGNORECASE)
+_DELETE = re.compile(r'^\s*DELETE\s+FROM\s+(\w+)', re.IGNORECASE)
+_COLUMN = r'(?:(\w+)\.)?(\w+)'
+_EQUAL_PARAM = re.compile(_COLUMN + r"\s*=\s*(?:%s|'[^']*')")
+_IN_LIST = re.compile(_COLUMN + r'\s+IN\s*\(', re.IGNORECASE)
+_RANGE = re.compile(_COLUMN + r'\s*(?:>=|<=|<|>)\s*%s')
+_JOIN_EQUAL = re.compile(_COLUMN + r'\s*=\s*' + _COLUMN + r'\b(?!\s*\()')
+
+
+def _sample_value(prefix):
+    """按占位符前面的 SQL 片段猜测一个类型合适的示例参数，只用于生成执行计划"""
+    prefix = prefix.rstrip()
+    upper = prefix.upper()
+    if upper.endswith('LIKE'):
+        return '%a%'
+    if upper.endswith('LIMIT'):
+        return 20
+    if prefix.endswith('/'):
+        return 3600
+    if prefix.endswith('||') or upper.endswith('INTERVAL'):
+        return 24
+    match = re.search(r'(\w+)\s*(?:=|>=|<=|<|>)$', prefix)
+    column = match.group(1).lower() if match else ''
+    if column in ('timestamp', 'created_at'):
+        return datetime(2024, 1, 1)
+    if column == 'status':
+        return '已支付'
+    if column in ('username', 'password', 'name', 'action', 'role', 'comment', 'description'):
+        return 'a'
+    return 1
+
+
+def sample_params(sql):
+    params = []
+    for match in _PARAM.finditer(sql):
+        if match.group(1) == 's':
+            params.append(_sample_value(sql[:match.start()]))
+    return params
+
+
+def collect_statements():
+    """展开注册表中的全部语句，返回 [(标签, 查询名, SQL, 示例参数)]
+
+    INSERT 只写入不查找，不需要索引，直接跳过；含模板参数但没有登记展开方式的语句也跳过。
+    """
+    statements = []
+    for name in QUERIES:
+        sql = sql_for(name)
+        if sql.lstrip().upper().startswith('INSERT'):
+            continue
+        if '{' in sql:
+            for keys, parts in TEMPLATE_VARIANTS.get(name, []):
+                label = name if keys is None else f"{name}[{'+'.join(keys)}]"
+                filled = sql_for(name, **parts)
+                statements.append((label, name, filled, sample_params(filled)))
+            continue
+        statements.append((name, name, sql, sample_params(sql)))
+    return statements
+
+
+def _aliases(sql):
+    """别名 -> 表名，表名本身也作为别名"""
+    aliases = {}
+    for table, alias in _ALIAS.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    for table in _DELETE.findall(sql):
+        aliases[table] = table
+    return aliases
+
+
+def explain(cursor, sql, params):
+    """执行计划中的问题：[{'table', 'issue', 'detail', 'rows', 'outer'}]
+
+    issue 为 full_scan / filesort / temporary；outer 表示该表是连接中最外层（最先读取）的表。
+    """
+    aliases = _aliases(sql)
+    issues = []
+    if is_sqlite():
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        tables_seen = 0
+        for row in cursor.fetchall():
+            detail = row['detail']
+            match = re.match(r'(SCAN|SEARCH) (\w+)(.*)$', detail)
+            if match and match.group(2) != 'CONSTANT':
+                tables_seen += 1
+            if match and match.group(1) == 'SCAN' and 'USING' not in match.group(3) and match.group(2) != 'CONSTANT':
+                issues.append({'table': aliases.get(match.group(2), match.group(2)), 'issue': 'full_scan',
+                               'detail': detail, 'rows': None, 'outer': tables_seen == 1})
+            elif detail.startswith('USE TEMP B-TREE FOR ORDER BY') or 'LAST TERM OF ORDER BY' in detail:
+                issues.append({'table': None, 'issue': 'filesort', 'detail': detail, 'rows': None})
+            elif detail.startswith('USE TEMP B-TREE'):
+                issues.append({'table': None, 'issue': 'temporary', 'detail': detail, 'rows': None})
+        return issues
+
+    cursor.execute('EXPLAIN ' + sql, params)
+    for position, row in enumerate(cursor.fetchall()):
+        table = row.get('table')
+        extra = row.get('Extra') or ''
+        detail = f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')} extra={extra}"
+        if row.get('type') == 'ALL' and table and not table.startswith('<'):
+            issues.append({'table': aliases.get(table, table), 'issue': 'full_scan', 'detail': detail,
+                           'rows': row.get('rows'), 'outer': position == 0})
+        if 'Using filesort' in extra:
+            issues.append({'table': aliases.get(table, table), 'issue': 'filesort', 'detail': detail,
+                           'rows': row.get('rows')})
+        if 'Using temporary' in extra:
+            issues.append({'table': aliases.get(table, table), 'issue': 'temporary', 'detail': detail,
+                           'rows': row.get('rows')})
+    return issues
+
+
+def suggest_index(sql, table, outer=True):
+    """按谓词为全表扫描的表给出候选索引，返回 (列, 等值列数)
+
+    等值条件列在前、范围列在后；没有等值条件且该表位于连接内层时改用连接列。
+    扫描的表不在语句中（触发器或外键检查引起）时不给出建议。
+    """
+    aliases = _aliases(sql)
+    if table not in aliases.values():
+        return [], 0
+    single_table = len(set(aliases.values())) == 1
+    body = sql.split('WHERE', 1)
+    on_and_where = ' '.join(re.findall(r'\bON\b(.*?)(?=\bJOIN\b|\bLEFT\b|\bWHERE\b|$)', body[0], re.S)) + \
+        (' ' + body[1] if len(body) > 1 else '')
+
+    def belongs(alias):
+        if alias:
+            return aliases.get(alias) == table
+        return single_table
+
+    columns = []
+
+    def add(column):
+        if column not in columns:
+            columns.append(column)
+
+    for alias, column in _EQUAL_PARAM.findall(on_and_where) + _IN_LIST.findall(on_and_where):
+        if belongs(alias):
+            add(column)
+    if not columns and not outer:
+        for left_alias, left, right_alias, right in _JOIN_EQUAL.findall(on_and_where):
+            if left_alias and right_alias and left_alias != right_alias:
+                if belongs(left_alias):
+                    add(left)
+                elif belongs(right_alias):
+                    add(right)
+    equality = len(columns)
+    for alias, column in _RANGE.findall(on_and_where):
+        if belongs(alias) and column not in columns:
+            add(column)
+            break
+    return columns, equality
+
+
+def existing_indexes(cursor):
+    """库中已有的索引：{表名: {索引名: [列...]}}，含主键和外键自动创建的索引"""
+    indexes = {}
+    if is_sqlite():
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%%'")
+        for table in [row['name'] for row in cursor.fetchall()]:
+            table_indexes = indexes.setdefault(table, {})
+            cursor.execute(f'PRAGMA table_info({table})')
+            primary = [row['name'] for row in sorted(cursor.fetchall(), key=lambda row: row['pk']) if row['pk']]
+            if primary:
+                table_indexes['PRIMARY'] = primary
+            cursor.execute(f'PRAGMA index_list({table})')
+            for index in [row['name'] for row in cursor.fetchall()]:
+                cursor.execute(f'PRAGMA index_info({index})')
+                table_indexes[index] = [row['name'] for row in sorted(cursor.fetchall(), key=lambda row: row['seqno'])]
+        return indexes
+
+    cursor.execute("""
+        SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, COLUMN_NAME AS column_name
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """)
+    for row in cursor.fetchall():
+        indexes.setdefault(row['table_name'], {}).setdefault(row['index_name'], []).append(row['column_name'])
+    return indexes
+
+
+def covering_index(indexes, table, columns):
+    """前缀列与 columns 相同（不计顺序）的已有索引名，没有则返回 None"""
+    for name, index_columns in indexes.get(table, {}).items():
+        if set(index_columns[:len(columns)]) == set(columns):
+            return name
+    return None
+
+
+def advise(cursor, prefix=None):
+    """分析全部语句，返回 (报告, 候选索引 [{'table', 'columns', 'queries'}])"""
+    indexes = existing_indexes(cursor)
+    report = []
+    candidates = {}
+    for label, name, sql, params in collect_statements():
+        if prefix and not label.startswith(prefix):
+            continue
+        try:
+            issues = explain(cursor, sql, params)
+        except Exception as e:
+            report.append({'query': label, 'error': str(e), 'issues': []})
+            continue
+        for issue in issues:
+            issue['expected'] = issue['issue'] in EXPECTED_ISSUES.get(label, ())
+            if issue['issue'] != 'full_scan' or issue['expected']:
+                continue
+            columns, equality = suggest_index(sql, issue['table'], issue.pop('outer'))
+            if columns and not covering_index(indexes, issue['table'], columns):
+                candidate = candidates.setdefault(
+                    (issue['table'], tuple(columns)),
+                    {'table': issue['table'], 'columns': columns, 'equality': equality, 'queries': []}
+                )
+                candidate['queries'].append(label)
+                issue['suggested_index'] = columns
+        report.append({'query': label, 'issues': issues})
+    return report, _merge_candidates(list(candidates.values()))
+
+
+def _covers(columns, prefixes):
+    return all(set(columns[:len(prefix)]) == set(prefix) for prefix in prefixes)
+
+
+def _merge_candidates(candidates):
+    """合并同一张表上的候选：短候选能成为长候选的前缀时并入长候选
+
+    长候选的等值列之间可以调换顺序，只要已并入的前缀仍然成立，
+    例如 (product_id, buyer_id, status) 与 (buyer_id) 合并为 (buyer_id, product_id, status)。
+    """
+    merged = []
+    for candidate in sorted(candidates, key=lambda item: -len(item['columns'])):
+        columns = candidate['columns']
+        for kept in merged:
+            if kept['table'] != candidate['table']:
+                continue
+            prefixes = kept['prefixes'] + [columns]
+            if _covers(kept['columns'], prefixes):
+                reordered = kept['columns']
+            elif candidate['equality'] == len(columns) and set(columns) <= set(kept['columns'][:kept['equality']]):
+                reordered = columns + [column for column in kept['columns'] if column not in columns]
+                if not _covers(reordered, prefixes):
+                    continue
+            else:
+                continue
+            kept['columns'] = reordered
+            kept['prefixes'] = prefixes
+            kept['queries'].extend(query for query in candidate['queries'] if query not in kept['queries'])
+            break
+        else:
+            merged.append(dict(candidate, prefixes=[columns]))
+    return [
+        {'table': item['table'], 'columns': item['columns'], 'queries': item['queries']}
+        for item in sorted(merged, key=lambda item: (item['table'], item['columns']))
+    ]
+
+
+def index_name(table, columns):
+    return f"idx_{table}_{'_'.join(columns)}"[:64]
+
+
+# ---- 迁移 ----
+
+_MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+_CREATE_INDEX = re.compile(r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+_DROP_INDEX = re.compile(r'^\s*DROP\s+INDEX\s+(\w+)\s+ON\s+(\w+)\s*$', re.IGNORECASE)
+
+
+def list_migrations():
+    """migrations 目录下的迁移文件：[(版本号, 名称, 路径)]，按版本号排序"""
+    if not os.path.isdir(MIGRATIONS_DIR):
+        return []
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((match.group(1), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def read_statements(path):
+    """读出迁移文件中的语句：去掉 -- 注释，按分号拆分"""
+    with open(path, encoding='utf-8') as file:
+        text = '\n'.join(line for line in file.read().splitlines() if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in text.split(';') if statement.strip()]
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(4) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NULL
+        )
+    """)
+
+
+def applied_migrations(cursor):
+    ensure_migrations_table(cursor)
+    cursor.execute("SELECT version, name, applied_at FROM schema_migrations ORDER BY version")
+    return {row['version']: row for row in cursor.fetchall()}
+
+
+def migrate(conn, dry_run=False, out=sys.stdout):
+    """按版本号顺序执行尚未执行的迁移，返回本次执行的版本号列表
+
+    MySQL 的 DDL 会隐式提交，因此每个迁移执行完立即登记；中途失败时已创建的索引在重试时会被跳过。
+    唯一索引只按名称跳过（前缀相同的普通索引不能代替唯一约束）；DROP INDEX 按 MySQL 语法书写，
+    索引不存在时跳过，SQLite 下去掉 ON 子句后执行。
+    """
+    done = []
+    with conn.cursor() as cursor:
+        applied = applied_migrations(cursor)
+        conn.commit()
+        for version, name, path in list_migrations():
+            if version in applied:
+                continue
+            print(f'迁移 {version}_{name}', file=out)
+            for statement in read_statements(path):
+                match = _CREATE_INDEX.match(statement)
+                if match:
+                    unique, index, table, columns = match.groups()
+                    columns = [column.strip().strip('`') for column in columns.split(',')]
+                    indexes = existing_indexes(cursor)
+                    if index in indexes.get(table, {}):
+                        existing = index
+                    else:
+                        existing = None if unique else covering_index(indexes, table, columns)
+                    if existing:
+                        print(f'  跳过 {index}：已有索引 {existing}', file=out)
+                        continue
+                match = _DROP_INDEX.match(statement)
+                if match:
+                    index, table = match.groups()
+                    if index not in existing_indexes(cursor).get(table, {}):
+                        print(f'  跳过删除 {index}：索引不存在', file=out)
+                        continue
+                    if is_sqlite():
+                        statement = f'DROP INDEX {index}'
+                print(f'  {" ".join(statement.split())}', file=out)
+                if not dry_run:
+                    cursor.execute(statement)
+            if not dry_run:
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                    (version, name, datetime.now().replace(microsecond=0))
+                )
+                conn.commit()
+            done.append(version)
+    return done
+
+
+def write_migration(candidates, name, report_time=None):
+    """把候选索引写成下一个版本号的迁移文件，返回文件路径"""
+    migrations = list_migrations()
+    version = f'{int(migrations[-1][0]) + 1 if migrations else 1:04d}'
+    os.makedirs(MIGRATIONS_DIR, exist_ok=True)
+    path = os.path.join(MIGRATIONS_DIR, f'{version}_{name}.sql')
+    report_time = report_time or datetime.now()
+    lines = [f'-- {version} 由 index_advisor.py plan 于 {report_time:%Y-%m-%d %H:%M} 生成', '']
+    for candidate in candidates:
+        lines.append(f"-- {', '.join(candidate['queries'])}")
+        lines.append(f"CREATE INDEX {index_name(candidate['table'], candidate['columns'])} "
+                     f"ON {candidate['table']} ({', '.join(candidate['columns'])});")
+        lines.append('')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines))
+    return path
+
+
+def print_report(report, candidates, out=sys.stdout):
+    unexpected = 0
+    for item in report:
+        if item.get('error'):
+            print(f"{item['query']}: EXPLAIN 失败: {item['error']}", file=out)
+            unexpected += 1
+            continue
+        for issue in item['issues']:
+            flag = '  (预期)' if issue['expected'] else ''
+            unexpected += not issue['expected']
+            table = f" {issue['table']}" if issue['table'] else ''
+            print(f"{item['query']}: {issue['issue']}{table}{flag}  [{issue['detail']}]", file=out)
+    print(f'\n未预期的问题 {unexpected} 个', file=out)
+    if candidates:
+        print('缺失的候选索引：', file=out)
+        for candidate in candidates:
+            print(f"  {candidate['table']} ({', '.join(candidate['columns'])})  <- {', '.join(candidate['queries'])}",
+                  file=out)
+    return unexpected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='索引顾问与索引迁移')
+    parser.add_argument('--database', help='覆盖 DB_CONFIG 中的数据库名')
+    parser.add_argument('--sqlite', metavar='PATH', help='改用 SQLite 后端')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    advise_parser = commands.add_parser('advise', help='EXPLAIN 全部注册语句并报告全表扫描和额外排序')
+    advise_parser.add_argument('--query', help='只分析名称以此开头的语句')
+    advise_parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+    advise_parser.add_argument('--strict', action='store_true', help='存在未预期的问题时返回 1')
+
+    plan_parser = commands.add_parser('plan', help='把缺失的候选索引写成新的迁移文件')
+    plan_parser.add_argument('--name', default='advised_indexes', help='迁移名称（字母、数字、下划线）')
+
+    migrate_parser = commands.add_parser('migrate', help='执行尚未执行的迁移')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='只打印将要执行的语句')
+
+    commands.add_parser('status', help='查看各迁移的执行情况')
+    args = parser.parse_args(argv)
+
+    if args.database:
+        config.DB_CONFIG['database'] = args.database
+    if args.sqlite:
+        config.DB_CONFIG['backend'] = 'sqlite'
+        config.DB_CONFIG['sqlite_path'] = args.sqlite
+
+    conn = get_connection()
+    try:
+        if args.command == 'migrate':
+            done = migrate(conn, dry_run=args.dry_run)
+            print(f"{'将执行' if args.dry_run else '已执行'} {len(done)} 个迁移")
+            return 0
+
+        with conn.cursor() as cursor:
+            if args.command == 'status':
+                applied = applied_migrations(cursor)
+                conn.commit()
+                for version, name, _ in list_migrations():
+                    row = applied.get(version)
+                    print(f"{version}_{name}  {row['applied_at'] if row else '未执行'}")
+                return 0
+
+            report, candidates = advise(cursor, getattr(args, 'query', None))
+            # SQLite 下 FOR UPDATE 语句的 EXPLAIN 也会取得写锁，分析完立即释放
+            conn.rollback()
+
+        if args.command == 'plan':
+            with conn.cursor() as cursor:
+                applied = applied_migrations(cursor)
+                conn.commit()
+            pending = [f'{version}_{name}' for version, name, _ in list_migrations() if version not in applied]
+            if pending:
+                print(f"提示：还有未执行的迁移 {', '.join(pending)}，建议先 migrate 再 plan，避免生成重复的索引")
+            if not candidates:
+                print('没有缺失的候选索引')
+                return 0
+            if not re.fullmatch(r'\w+', args.name):
+                parser.error('--name 只能包含字母、数字和下划线')
+            print(f'已生成 {write_migration(candidates, args.name)}')
+            return 0
+
+        if args.json:
+            json.dump({'report': report, 'candidates': candidates}, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+            unexpected = sum(not issue['expected'] for item in report for issue in item['issues']) + \
+                sum(1 for item in report if item.get('error'))
+        else:
+            unexpected = print_report(report, candidates)
+        return 1 if args.strict and unexpected else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timedelta
+
+from db import get_connection
+from queries import execute
+
+BUCKET_SECONDS = 3600
+# 时间窗口 -> 包含的小时桶数，None 表示全部时间
+WINDOWS = {'all': None, '24h': 24, '7d': 168}
+_MAX_BUCKETS = max(size for size in WINDOWS.values() if size)
+
+
+class SalesLeaderboard:
+    """按时间窗口增量维护的商品销量排行榜
+
+    每个窗口保存商品销量计数和按 (-销量, 商品ID) 排好序的列表，查询前 N 名只需切片。
+    24h / 7d 窗口由小时桶累加，整点推进时减去滑出窗口的桶。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._loading = False
+        self._pending = []  # 重建期间的增量修改，重建完成后重放
+
+    def _reset(self):
+        self._buckets = {}  # 小时编号 -> Counter(product_id -> 销量)
+        self._totals = {name: Counter() for name in WINDOWS}
+        self._ranked = {name: [] for name in WINDOWS}
+        self._hour = int(time.time() // BUCKET_SECONDS)
+        self.ready = False
+
+    def record(self, product_id, quantity, timestamp=None, order_id=None):
+        """记录一笔已支付订单的销量；取消或删除订单时传入负数并带上下单时间
+
+        新订单传入 order_id（同一事务写入的多笔订单传其中任一 ID 即可），
+        重建时据此跳过已被统计查询计入的订单。
+        """
+        hour = int((timestamp if timestamp is not None else time.time()) // BUCKET_SECONDS)
+        with self._lock:
+            if self._loading:
+                self._pending.append((hour, product_id, quantity, order_id))
+            self._advance(int(time.time() // BUCKET_SECONDS))
+            self._add(hour, product_id, quantity)
+
+    def remove_product(self, product_id):
+        """商品被删除时从所有窗口移除"""
+        with self._lock:
+            if self._loading:
+                self._pending.append((None, product_id, None, None))
+            self._remove(product_id)
+
+    def top(self, window='all', limit=10):
+        """返回 [(product_id, 销量)]，按销量从高到低"""
+        if window not in WINDOWS:
+            raise ValueError(f'未知的时间窗口: {window}')
+        with self._lock:
+            self._advance(int(time.time() // BUCKET_SECONDS))
+            return [(product_id, -neg) for neg, product_id in self._ranked[window][:limit]]
+
+    def begin_load(self):
+        """开始重建，此后的 record 会被暂存以便在 load 之后重放"""
+        with self._lock:
+            self._loading = True
+            self._pending = []
+
+    def abort_load(self):
+        with self._lock:
+            self._loading = False
+            self._pending = []
+
+    def load(self, all_time, hourly, high_water=0):
+        """用数据库统计结果整体替换当前状态
+
+        all_time: [(product_id, 销量)]；hourly: [(小时编号, product_id, 销量)]；
+        high_water: 统计时的订单 ID 高水位，不超过它的新订单已计入统计，重放时跳过
+        """
+        with self._lock:
+            pending = self._pending
+            self._reset()
+            for product_id, quantity in all_time:
+                self._set('all', product_id, quantity)
+            for hour, product_id, quantity in hourly:
+                self._add(hour, product_id, quantity, include_all=False)
+            for hour, product_id, quantity, order_id in pending:
+                if quantity is None:
+                    self._remove(product_id)
+                elif order_id is None or order_id > high_water:
+                    self._add(hour, product_id, quantity)
+            self._loading = False
+            self._pending = []
+            self.ready = True
+
+    def _add(self, hour, product_id, quantity, include_all=True):
+        if include_all:
+            self._set('all', product_id, self._totals['all'][product_id] + quantity)
+        if hour <= self._hour - _MAX_BUCKETS:
+            return
+        bucket = self._buckets.setdefault(hour, Counter())
+        bucket[product_id] += quantity
+        for name, size in WINDOWS.items():
+            if size and hour > self._hour - size:
+                self._set(name, product_id, self._totals[name][product_id] + quantity)
+
+    def _remove(self, product_id):
+        for bucket in self._buckets.values():
+            bucket.pop(product_id, None)
+        for name in WINDOWS:
+            self._set(name, product_id, 0)
+
+    def _set(self, name, product_id, quantity):
+        totals = self._totals[name]
+        ranked = self._ranked[name]
+        old = totals.get(product_id, 0)
+        if old > 0:
+            index = bisect_left(ranked, (-old, product_id))
+            if index < len(ranked) and ranked[index] == (-old, product_id):
+                del ranked[index]
+        if quantity > 0:
+            totals[product_id] = quantity
+            insort(ranked, (-quantity, product_id))
+        else:
+            totals.pop(product_id, None)
+
+    def _advance(self, now_hour):
+        """整点推进：把滑出各窗口的小时桶从计数中减掉"""
+        if now_hour <= self._hour:
+            return
+        old_hour = self._hour
+        self._hour = now_hour
+        for name, size in WINDOWS.items():
+            if not size:
+                continue
+            for hour, bucket in self._buckets.items():
+                if old_hour - size < hour <= now_hour - size:
+                    for product_id, quantity in bucket.items():
+                        self._set(name, product_id, self._totals[name][product_id] - quantity)
+        for hour in [h for h in self._buckets if h <= now_hour - _MAX_BUCKETS]:
+            del self._buckets[hour]
+
+
+sales_leaderboard = SalesLeaderboard()
+
+
+def rebuild_leaderboard():
+    """根据 orders 表重建排行榜，返回参与统计的商品数
+
+    先开始暂存新的销量记录，再读出订单 ID 高水位，两条统计查询只计入不超过高水位的订单；
+    重放暂存记录时跳过高水位以内的新订单，因此统计开始前后提交的订单都恰好计入一次。
+    订单状态变化（取消、删除）没有 ID 边界，仍全部重放：只有在开始暂存到统计查询读取之间
+    提交的状态变化会被重复计入，这段时间只有一次主键上的 MAX 查询。
+    MySQL 的自增 ID 在插入时分配，若某笔订单在读高水位前插入、之后才提交，会被漏计，再次重建即可校正。
+    """
+    sales_leaderboard.begin_load()
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            execute(cursor, 'orders.max_id')
+            high_water = cursor.fetchone()['max_id'] or 0
+
+            execute(cursor, 'orders.sales_by_product', (high_water,))
+            all_time = [(row['product_id'], int(row['total_sales'])) for row in cursor.fetchall()]
+
+            since = datetime.now() - timedelta(hours=_MAX_BUCKETS)
+            execute(cursor, 'orders.sales_by_product_hour', (BUCKET_SECONDS, since, high_water))
+            hourly = [(int(row['hour']), row['product_id'], int(row['total_sales'])) for row in cursor.fetchall()]
+    except Exception:
+        sales_leaderboard.abort_load()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+    sales_leaderboard.load(all_time, hourly, high_water)
+    return len(all_time)
+
+
+def rebuild_in_background():
+    """启动时在后台线程重建排行榜，完成前 top-products 查询退回 SQL 统计"""
+    def run():
+        try:
+            count = rebuild_leaderboard()
+            print(f"销量排行榜重建完成，共 {count} 个商品")
+        except Exception as e:
+            print(f"销量排行榜重建失败: {e}")
+
+    thread = threading.Thread(target=run, name='leaderboard-rebuild', daemon=True)
+    thread.start()
+    return thread
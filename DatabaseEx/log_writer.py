@@ -0,0 +1,214 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+from config import LOG_CONFIG
+from db import get_connection
+from counters import platform_counters
+from queries import execute, executemany, placeholders
+
+_STOP = object()
+_KNOWN_USERS_MAX = 100000  # 已知有日志的用户 ID 缓存上限，超出后清空，只会多查几次
+
+
+class LogWriter:
+    """后台日志写入线程：log_action 只入队，由写入线程按数量或时间批量 INSERT"""
+
+    def __init__(self, queue_size=10000, batch_size=500, flush_interval=1.0,
+                 full_policy='block', block_timeout=0.5, spill_path='logs_spill.jsonl'):
+        if full_policy not in ('block', 'drop', 'spill'):
+            raise ValueError(f'未知的队列满处理策略: {full_policy}')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.spill_path = spill_path
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spill_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'failed': 0,
+            'batches': 0
+        }
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._known_users = set()  # 已确认在 logs 表中有记录的用户，只由写入线程访问
+
+    def start(self):
+        """启动写入线程"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, user_id, action, description):
+        """日志入队，队列满时按 full_policy 处理"""
+        entry = (user_id, action, description, datetime.now())
+        try:
+            if self.full_policy == 'block':
+                self._queue.put(entry, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(entry)
+        except queue.Full:
+            if self.full_policy == 'spill':
+                self._spill([entry])
+            else:
+                self._count('dropped')
+            return
+        self._count('enqueued')
+
+    def stop(self, timeout=5.0):
+        """停止写入线程，退出前写完队列中剩余的日志"""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        """日志队列状态"""
+        with self._counter_lock:
+            stats = dict(self._counters)
+        stats['queued'] = self._queue.qsize()
+        stats['capacity'] = self._queue.maxsize
+        stats['full_policy'] = self.full_policy
+        return stats
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._drain()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stopping:
+                self._drain()
+                return
+
+    def _drain(self):
+        """把队列中剩余的日志全部写入"""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        """一次多行 INSERT 写入一批日志，失败时落盘"""
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                new_users = self._new_users(cursor, batch)
+                executemany(cursor, 'logs.insert', batch)
+                deltas = {'total_logs': len(batch), 'log_users': len(new_users)}
+                platform_counters.apply(cursor, deltas)
+                conn.commit()
+            self._remember(new_users)
+            platform_counters.publish(deltas)
+            self._count('written', len(batch))
+            self._count('batches')
+        except Exception as e:
+            print(f"日志记录失败: {e}")
+            self._count('failed', len(batch))
+            self._spill(batch)
+        finally:
+            if conn:
+                conn.close()
+
+    def _new_users(self, cursor, batch):
+        """本批中第一次写日志的用户 ID 集合
+
+        已知有日志的用户不再查询；其余用户按 idx_logs_user_time 查一次，代价与本批用户数相关而非日志量。
+        多个进程同时写入同一新用户的首条日志时可能重复计数，由 reconcile 修正。
+        """
+        users = {user_id for user_id, _, _, _ in batch if user_id is not None} - self._known_users
+        if not users:
+            return set()
+        ids = sorted(users)
+        execute(cursor, 'logs.users_seen', ids, ids=placeholders(len(ids)))
+        seen = {row['user_id'] for row in cursor.fetchall()}
+        self._remember(seen)
+        return users - seen
+
+    def _remember(self, users):
+        if len(self._known_users) + len(users) > _KNOWN_USERS_MAX:
+            self._known_users.clear()
+        self._known_users.update(users)
+
+    def _spill(self, entries):
+        """追加写入本地文件，便于之后补录"""
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+                for user_id, action, description, timestamp in entries:
+                    f.write(json.dumps({
+                        'user_id': user_id,
+                        'action': action,
+                        'description': description,
+                        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                    }, ensure_ascii=False) + '\n')
+            self._count('spilled', len(entries))
+        except Exception as e:
+            print(f"日志落盘失败: {e}")
+            self._count('dropped', len(entries))
+
+    def _count(self, name, n=1):
+        with self._counter_lock:
+            self._counters[name] += n
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """获取全局日志写入器，首次调用时启动写入线程并注册退出时的刷新"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = LogWriter(**LOG_CONFIG)
+                writer.start()
+                atexit.register(writer.stop)
+                _writer = writer
+    return _writer
+
+
+def get_log_queue_stats():
+    """查询日志队列状态"""
+    return get_log_writer().stats()
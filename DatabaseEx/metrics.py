@@ -0,0 +1,255 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, request
+
+from config import METRICS_CONFIG
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Shard:
+    """单个线程独占的计数分片，热路径只写本线程的分片，不需要加锁"""
+    __slots__ = ('requests', 'latency', 'db_time', 'in_flight')
+
+    def __init__(self):
+        self.requests = {}   # (endpoint, method, status) -> 次数
+        self.latency = {}    # (endpoint, method) -> [各桶计数..., 总和, 次数]
+        self.db_time = {}    # 同上，记录每个请求内 SQL 执行耗时之和
+        self.in_flight = {}  # endpoint -> 进行中的请求数（本线程的增减）
+
+
+def _fold(target, source):
+    """把 source 表中的计数累加到 target 表"""
+    for key, value in list(source.items()):
+        if isinstance(value, list):
+            total = target.setdefault(key, [0] * len(value))
+            for index, item in enumerate(list(value)):
+                total[index] += item
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """请求指标：按端点统计延迟直方图、状态码计数、进行中请求数和请求内 SQL 耗时
+
+    每个线程写自己的分片，/metrics 抓取时再把所有分片相加，请求路径上没有锁竞争。
+    开发服务器每个请求一个线程，抓取时把已退出线程的分片并入 _retired，分片数只与存活线程数相关。
+    """
+
+    def __init__(self, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._shards = {}         # 线程 -> 该线程的分片
+        self._retired = _Shard()  # 已退出线程的分片累加到这里
+        self._shards_lock = threading.Lock()  # 线程首次创建分片和抓取时使用
+        self._collectors = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards[threading.current_thread()] = shard
+        return shard
+
+    def _observe(self, table, key, value):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = [0] * (len(self.buckets) + 3)
+        histogram[bisect_left(self.buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def request_started(self, endpoint, method):
+        local = self._local
+        local.started = time.perf_counter()
+        local.db_time = 0.0
+        local.key = (endpoint, method)
+        local.status = 500
+        in_flight = self._shard().in_flight
+        in_flight[endpoint] = in_flight.get(endpoint, 0) + 1
+
+    def set_status(self, status):
+        self._local.status = status
+
+    def request_finished(self):
+        local = self._local
+        started = getattr(local, 'started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        local.started = None
+        endpoint, method = local.key
+        shard = self._shard()
+        shard.in_flight[endpoint] -= 1
+        request_key = (endpoint, method, local.status)
+        shard.requests[request_key] = shard.requests.get(request_key, 0) + 1
+        self._observe(shard.latency, local.key, elapsed)
+        self._observe(shard.db_time, local.key, local.db_time)
+
+    def add_db_time(self, elapsed):
+        """累加当前请求内的 SQL 执行耗时，由 queries.execute 调用"""
+        local = self._local
+        local.db_time = getattr(local, 'db_time', 0.0) + elapsed
+
+    def register_collector(self, collector):
+        """注册抓取时调用的函数，返回 [(指标名, 类型, 说明, [(标签字典, 值)])]"""
+        self._collectors.append(collector)
+        return collector
+
+    def _collect(self):
+        """回收已退出线程的分片，返回 {属性: 合并后的表}"""
+        attributes = _Shard.__slots__
+        with self._shards_lock:
+            for thread, shard in list(self._shards.items()):
+                if not thread.is_alive():
+                    # 线程已退出，分片不会再被写入
+                    for attribute in attributes:
+                        _fold(getattr(self._retired, attribute), getattr(shard, attribute))
+                    del self._shards[thread]
+            shards = [self._retired] + list(self._shards.values())
+            merged = {attribute: {} for attribute in attributes}
+            for shard in shards:
+                for attribute in attributes:
+                    _fold(merged[attribute], getattr(shard, attribute))
+        return merged
+
+    def _render_histogram(self, lines, name, help_text, histograms):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (endpoint, method), values in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(endpoint=endpoint, method=method, le=bound)} {cumulative}')
+            labels = _labels(endpoint=endpoint, method=method)
+            lines.append(f'{name}_sum{labels} {_format_value(values[-2])}')
+            lines.append(f'{name}_count{labels} {values[-1]}')
+
+    def render(self):
+        """按 Prometheus 文本格式输出全部指标"""
+        merged = self._collect()
+        lines = [
+            '# HELP http_requests_total 按端点、方法和状态码统计的请求数',
+            '# TYPE http_requests_total counter'
+        ]
+        for (endpoint, method, status), count in sorted(merged['requests'].items()):
+            lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+        lines.append('# HELP http_requests_in_flight 正在处理的请求数')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        for endpoint, count in sorted(merged['in_flight'].items()):
+            lines.append(f'http_requests_in_flight{_labels(endpoint=endpoint)} {count}')
+
+        self._render_histogram(lines, 'http_request_duration_seconds', '请求处理耗时（秒）',
+                               merged['latency'])
+        self._render_histogram(lines, 'http_request_db_seconds', '单个请求内 SQL 执行耗时之和（秒）',
+                               merged['db_time'])
+
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception:
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    suffix = _labels(**labels) if labels else ''
+                    lines.append(f'{name}{suffix} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(**METRICS_CONFIG)
+
+
+def add_db_time(elapsed):
+    metrics.add_db_time(elapsed)
+
+
+@metrics.register_collector
+def _pool_metrics():
+    """连接池已创建时导出连接数和事件计数"""
+    import db
+    if db._pool is None:
+        return []
+    stats = db._pool.stats()
+    return [
+        ('db_pool_connections', 'gauge', '连接池中的连接数',
+         [({'state': state}, stats[state]) for state in ('total', 'idle', 'checked_out')]),
+        ('db_pool_size', 'gauge', '连接池常驻连接数与允许的额外连接数',
+         [({'kind': 'pool_size'}, stats['pool_size']), ({'kind': 'max_overflow'}, stats['max_overflow'])]),
+        ('db_pool_events_total', 'counter', '连接池事件计数',
+         [({'event': event}, stats[event])
+          for event in ('checkouts', 'created', 'discarded', 'ping_failures', 'waits', 'timeouts')])
+    ]
+
+
+@metrics.register_collector
+def _log_queue_metrics():
+    """日志写入线程已启动时导出队列长度和写入计数"""
+    import log_writer
+    if log_writer._writer is None:
+        return []
+    stats = log_writer._writer.stats()
+    return [
+        ('log_queue_size', 'gauge', '日志队列中等待写入的条数', [({}, stats['queued'])]),
+        ('log_queue_capacity', 'gauge', '日志队列容量', [({}, stats['capacity'])]),
+        ('log_entries_total', 'counter', '日志条目按处理结果计数',
+         [({'result': result}, stats[result])
+          for result in ('enqueued', 'written', 'dropped', 'spilled', 'failed')]),
+        ('log_batches_total', 'counter', '批量写入次数', [({}, stats['batches'])])
+    ]
+
+
+@metrics.register_collector
+def _cart_store_metrics():
+    """内存购物车的用户数、待落库用户数和写回计数"""
+    import cart_store
+    stats = cart_store.cart_store.stats()
+    return [
+        ('cart_store_users', 'gauge', '内存购物车数', [({'state': 'cached'}, stats['users']),
+                                                       ({'state': 'dirty'}, stats['dirty_users'])]),
+        ('cart_store_events_total', 'counter', '内存购物车事件计数',
+         [({'event': event}, stats[event])
+          for event in ('loads', 'edits', 'flushes', 'flushed_users', 'flush_failures', 'evicted')])
+    ]
+
+
+def _before_request():
+    metrics.request_started(request.endpoint or 'unmatched', request.method)
+
+
+def _after_request(response):
+    metrics.set_status(response.status_code)
+    return response
+
+
+def _teardown_request(exc):
+    metrics.request_finished()
+
+
+def metrics_view():
+    return Response(metrics.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+    """注册请求计时钩子和 /metrics 端点"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,24 @@
+-- 0001 查询工作负载所需的索引（index_advisor.py advise 的结果整理）
+-- MySQL 会为外键列自动建索引，这里与之前缀相同的索引在执行时跳过；SQLite 不会自动建，需要全部创建。
+
+-- cart.items, cart.delete_users（0002 改为唯一键 uk_cart_user_product）
+CREATE INDEX idx_cart_user_product ON cart (user_id, product_id);
+
+-- products.delete, products.delete_own（删除商品时的外键检查）
+CREATE INDEX idx_cart_product ON cart (product_id);
+
+-- orders.by_buyer, reviews.write_check, reviews.upsert_if_purchased（提交评价时的购买校验）
+CREATE INDEX idx_orders_buyer_product_status ON orders (buyer_id, product_id, status);
+
+-- products.delete, products.delete_own, products.order_totals, orders.by_seller, orders.export, before_delete_cascade_orders
+CREATE INDEX idx_orders_product_status ON orders (product_id, status);
+
+-- reviews.by_buyer
+CREATE INDEX idx_reviews_user ON reviews (user_id);
+
+-- products.by_seller, products.search, products.update_many_own, products.import_lookup, products.import_lock,
+-- orders.by_seller, orders.export, reviews.by_seller, average_ratings.missing_rows（db_create.txt 已包含，补齐早期建的库）
+CREATE INDEX idx_seller_id ON products (seller_id);
+
+-- logs.page, logs.recent（db_create.txt 已包含，补齐早期建的库）
+CREATE INDEX idx_logs_time ON logs (timestamp, log_id);
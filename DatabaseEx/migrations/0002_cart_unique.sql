@@ -0,0 +1,24 @@
+-- 0002 cart 表每个 (user_id, product_id) 只保留一行，由唯一键保证
+-- 早期的“先查再插入”在并发时可能写入重复行：先把数量合并到 cart_id 最小的一行，再删除其余行
+
+UPDATE cart SET quantity = (
+    SELECT total FROM (
+        SELECT user_id, product_id, SUM(quantity) AS total
+        FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1
+    ) AS duplicated
+    WHERE duplicated.user_id = cart.user_id AND duplicated.product_id = cart.product_id
+)
+WHERE (user_id, product_id) IN (
+    SELECT user_id, product_id FROM (
+        SELECT user_id, product_id FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1
+    ) AS duplicated_keys
+);
+
+DELETE FROM cart WHERE cart_id NOT IN (
+    SELECT keep_id FROM (SELECT MIN(cart_id) AS keep_id FROM cart GROUP BY user_id, product_id) AS kept
+);
+
+CREATE UNIQUE INDEX uk_cart_user_product ON cart (user_id, product_id);
+
+-- 唯一键已覆盖 0001 中的 idx_cart_user_product
+DROP INDEX idx_cart_user_product ON cart;
@@ -1,8 +1,8 @@
-class User:
-    TABLE_NAME = 'users'
-
-class Product:
-    TABLE_NAME = 'products'
-
-class Order:
-    TABLE_NAME = 'orders'
+class User:
+    TABLE_NAME = 'users'
+
+class Product:
+    TABLE_NAME = 'products'
+
+class Order:
+    TABLE_NAME = 'orders'
@@ -0,0 +1,285 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from config import PRODUCT_IMPORT_CONFIG
+from counters import platform_counters, is_low_stock
+from db import get_connection
+from queries import execute, executemany, placeholders, repeat
+from search_index import index_product
+
+FORMATS = ('csv', 'ndjson')
+MAX_NAME_LENGTH = 100            # 与 products.name VARCHAR(100) 一致
+MAX_PRICE = Decimal('99999999.99')  # DECIMAL(10, 2) 的上限
+CENT = Decimal('0.01')
+
+
+class ImportFormatError(ValueError):
+    """请求体整体无法解析（缺少表头等），与单行错误区分"""
+
+
+def _lines(stream):
+    """按行读取二进制请求体并解码，不把整个请求体读入内存"""
+    first = True
+    for line_num, line in enumerate(stream, 1):
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError:
+            raise ImportFormatError(f'第 {line_num} 行不是有效的 UTF-8 编码')
+        if first:
+            text = text.lstrip('\ufeff')
+            first = False
+        yield text
+
+
+def read_csv(stream):
+    """逐行解析 CSV，产出 (行号, 字段字典)；表头必须包含 name、price、stock，可选 product_id"""
+    reader = csv.DictReader(_lines(stream))
+    if reader.fieldnames is None:
+        return
+    fields = [field.strip() for field in reader.fieldnames]
+    missing = [field for field in ('name', 'price', 'stock') if field not in fields]
+    if missing:
+        raise ImportFormatError(f"CSV 表头缺少字段: {', '.join(missing)}")
+    reader.fieldnames = fields
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(stream):
+    """逐行解析 NDJSON，产出 (行号, 字段字典)；无法解析的行产出 (行号, 错误信息)"""
+    for line_num, line in enumerate(_lines(stream), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, f'JSON 解析失败: {e}'
+            continue
+        yield line_num, row if isinstance(row, dict) else '每行必须是 JSON 对象'
+
+
+def validate_row(row):
+    """校验并规范化一行，返回 ({'product_id', 'name', 'price', 'stock'}, None) 或 (None, 错误信息)"""
+    if not isinstance(row, dict):
+        return None, row
+
+    product_id = row.get('product_id')
+    if product_id in (None, ''):
+        product_id = None
+    else:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return None, f'product_id 无效: {product_id}'
+        if product_id <= 0:
+            return None, f'product_id 无效: {product_id}'
+
+    name = row.get('name')
+    if not isinstance(name, str) or not name.strip():
+        return None, '商品名称不能为空'
+    name = name.strip()
+    if len(name) > MAX_NAME_LENGTH:
+        return None, f'商品名称不能超过 {MAX_NAME_LENGTH} 个字符'
+
+    price = row.get('price')
+    try:
+        if isinstance(price, bool):
+            raise InvalidOperation
+        price = Decimal(str(price).strip()).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        return None, f'价格无效: {row.get("price")}'
+    if not price.is_finite() or price < 0 or price > MAX_PRICE:
+        return None, f'价格无效: {row.get("price")}'
+
+    stock = row.get('stock')
+    try:
+        if isinstance(stock, bool) or (isinstance(stock, float) and not stock.is_integer()):
+            raise ValueError
+        stock = int(stock.strip()) if isinstance(stock, str) else int(stock)
+    except (TypeError, ValueError):
+        return None, f'库存无效: {row.get("stock")}'
+    if stock < 0:
+        return None, f'库存不能为负数: {stock}'
+
+    return {'product_id': product_id, 'name': name, 'price': price, 'stock': stock}, None
+
+
+def _row_key(item):
+    # 指定 product_id 时按 ID 更新，否则按（卖家, 商品名）匹配；商品名不区分大小写，SQLite 上由 CASEFOLD 排序规则保证
+    return ('id', item['product_id']) if item['product_id'] else ('name', item['name'].casefold())
+
+
+class ProductImporter:
+    """卖家批量导入商品：逐行校验，按块在一个事务中新增或更新
+
+    每块固定执行：锁定已有商品 -> 一条 UPDATE ... CASE 更新 -> 一条多行 INSERT 新增 ->
+    按名称查回新商品 ID -> 一条语句累加平台计数器；每块只记一条汇总日志。
+    某一块写库失败时只把该块的行记为失败，继续处理后续的块。
+    """
+
+    def __init__(self, seller_id, log, chunk_size=None, max_rows=None, max_errors=None):
+        self.seller_id = seller_id
+        self.log = log
+        self.chunk_size = chunk_size or PRODUCT_IMPORT_CONFIG['chunk_size']
+        self.max_rows = max_rows or PRODUCT_IMPORT_CONFIG['max_rows']
+        self.max_errors = max_errors or PRODUCT_IMPORT_CONFIG['max_errors']
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.chunks = 0
+        self.errors = []
+        self._pending = []   # [(行号, 规范化后的行)]
+        self._keys = set()
+
+    def run(self, rows):
+        """rows 为 (行号, 字段字典或错误信息) 的迭代器，返回导入结果
+
+        请求体中途无法解析时，先写入之前已校验通过的行，再抛出 ImportFormatError。
+        """
+        try:
+            for line_num, row in rows:
+                if self.rows >= self.max_rows:
+                    self._error(line_num, f'单次最多导入 {self.max_rows} 行，其余行未处理')
+                    break
+                self.rows += 1
+                item, error = validate_row(row)
+                if error:
+                    self._error(line_num, error)
+                    continue
+                key = _row_key(item)
+                if key in self._keys:
+                    # 同一商品在块内出现多次时先写入前面的行，后面的行按更新处理
+                    self._flush()
+                self._pending.append((line_num, item))
+                self._keys.add(key)
+                if len(self._pending) >= self.chunk_size:
+                    self._flush()
+        finally:
+            self._flush()
+        return self.result()
+
+    def result(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'chunks': self.chunks,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors)
+        }
+
+    def _error(self, line_num, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': line_num, 'error': message})
+
+    def _flush(self):
+        pending, self._pending, self._keys = self._pending, [], set()
+        if not pending:
+            return
+        self.chunks += 1
+        conn = None
+        committed = False
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                inserted, updated, failed, written, deltas = self._write_chunk(cursor, pending)
+                conn.commit()
+                committed = True
+                platform_counters.publish(deltas)
+                # 提交后再更新搜索索引，与单个添加商品一致
+                for product_id, item in written:
+                    index_product(cursor, product_id, item['name'], self.seller_id)
+        except Exception as e:
+            if committed:
+                print(f"批量导入后更新搜索索引失败: {e}")
+            else:
+                if conn:
+                    conn.rollback()
+                for line_num, _ in pending:
+                    self._error(line_num, f'写入失败: {e}')
+                self.log(self.seller_id, "批量导入产品失败",
+                         f"卖家 {self.seller_id} 批量导入第 {self.chunks} 批（{len(pending)} 行）时发生错误: {e}")
+                return
+        finally:
+            if conn:
+                conn.close()
+
+        self.inserted += inserted
+        self.updated += updated
+        for line_num, message in failed:
+            self._error(line_num, message)
+        self.log(self.seller_id, "批量导入产品",
+                 f"卖家 {self.seller_id} 批量导入第 {self.chunks} 批：新增 {inserted} 个，"
+                 f"更新 {updated} 个，失败 {len(failed)} 行")
+
+    def _write_chunk(self, cursor, pending):
+        """在当前事务中写入一块，返回 (新增数, 更新数, [(行号, 错误)], [(商品 ID, 行)], 计数器增量)"""
+        seller_id = self.seller_id
+        ids = [item['product_id'] for _, item in pending if item['product_id']]
+        names = [item['name'] for _, item in pending if not item['product_id']]
+
+        # 锁定本块涉及的已有商品，取得修改前的库存用于计数器增量
+        existing = self._lookup(cursor, ids, names)
+        by_id = {row['product_id']: row for row in existing}
+        by_name = {}
+        for row in existing:
+            by_name.setdefault(row['name'].casefold(), []).append(row)
+
+        updates, inserts, failed = [], [], []
+        for line_num, item in pending:
+            if item['product_id']:
+                current = by_id.get(item['product_id'])
+                if current is None:
+                    failed.append((line_num, '无权更新此产品或产品不存在'))
+                    continue
+            else:
+                matches = by_name.get(item['name'].casefold(), [])
+                if len(matches) > 1:
+                    failed.append((line_num, '存在多个同名商品，请指定 product_id'))
+                    continue
+                current = matches[0] if matches else None
+            if current is None:
+                inserts.append(item)
+            else:
+                updates.append((current, item))
+
+        deltas = {'total_products': len(inserts), 'low_stock_products': 0}
+        written = []
+        if updates:
+            case = 'CASE product_id ' + repeat('WHEN %s THEN %s', len(updates), ' ') + ' END'
+            params = []
+            for field in ('name', 'price', 'stock'):
+                params += [value for current, item in updates for value in (current['product_id'], item[field])]
+            update_ids = [current['product_id'] for current, _ in updates]
+            execute(cursor, 'products.update_many_own', params + update_ids + [seller_id],
+                    name_case=case, price_case=case, stock_case=case, ids=placeholders(len(update_ids)))
+            for current, item in updates:
+                deltas['low_stock_products'] += int(is_low_stock(item['stock'])) - int(is_low_stock(current['stock']))
+                written.append((current['product_id'], item))
+
+        if inserts:
+            executemany(cursor, 'products.insert',
+                        [(item['name'], item['price'], item['stock'], seller_id) for item in inserts])
+            # 多行 INSERT 的自增 ID 不保证连续，按名称查回新商品的 ID
+            new_ids = {}
+            for row in self._lookup(cursor, [], [item['name'] for item in inserts], lock=False):
+                key = row['name'].casefold()
+                new_ids[key] = max(new_ids.get(key, 0), row['product_id'])
+            for item in inserts:
+                deltas['low_stock_products'] += int(is_low_stock(item['stock']))
+                written.append((new_ids[item['name'].casefold()], item))
+
+        platform_counters.apply(cursor, deltas)
+        return len(inserts), len(updates), failed, written, deltas
+
+    def _lookup(self, cursor, ids, names, lock=True):
+        """按 ID 或名称查询该卖家的商品；列表为空时用 NULL 占位，IN (NULL) 不匹配任何行"""
+        execute(cursor, 'products.import_lock' if lock else 'products.import_lookup',
+                [self.seller_id] + ids + names,
+                ids=placeholders(len(ids)) if ids else 'NULL',
+                names=placeholders(len(names)) if names else 'NULL')
+        return cursor.fetchall()
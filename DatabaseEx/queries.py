@@ -0,0 +1,707 @@
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import request
+
+from config import QUERY_BUDGET_CONFIG
+from db import is_sqlite
+from metrics import add_db_time
+
+# 具名 SQL 注册表：处理函数通过名称执行语句，执行器按名称统计调用次数、耗时和行数。
+# 模板中的 {xxx} 只能由本模块的 placeholders / repeat / where 填充，不能拼接用户输入。
+QUERIES = {
+    # ---- users ----
+    'users.count_by_username': "SELECT COUNT(*) AS count FROM users WHERE username = %s",
+    'users.insert': "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+    'users.authenticate': "SELECT user_id, role FROM users WHERE username=%s AND password=%s",
+    'users.list': "SELECT * FROM users",
+    'users.get': "SELECT user_id, username, role FROM users WHERE user_id=%s",
+    'users.username': "SELECT username FROM users WHERE user_id = %s",
+
+    # ---- products ----
+    'products.insert': "INSERT INTO products (name, price, stock, seller_id) VALUES (%s, %s, %s, %s)",
+    'products.list': """
+        SELECT
+            p.product_id,
+            p.name,
+            p.price,
+            p.stock,
+            u.username AS seller_name,
+            IFNULL(ar.average_stars, 0.00) AS average_rating,
+            IFNULL(ar.review_count, 0) AS rating_count
+        FROM
+            products p
+        LEFT JOIN
+            average_ratings ar
+        ON
+            p.product_id = ar.product_id
+        LEFT JOIN
+            users u
+        ON
+            p.seller_id = u.user_id
+    """,
+    'products.stock': "SELECT stock FROM products WHERE product_id = %s",
+    'products.lock_stock': "SELECT stock FROM products WHERE product_id=%s FOR UPDATE",
+    'products.lock_own_stock': "SELECT stock FROM products WHERE product_id=%s AND seller_id=%s FOR UPDATE",
+    'products.lock_many': """
+        SELECT product_id, price, stock FROM products
+        WHERE product_id IN ({ids})
+        ORDER BY product_id FOR UPDATE
+    """,
+    'products.names': "SELECT product_id, name FROM products WHERE product_id IN ({ids})",
+    'products.cart_view': "SELECT product_id, name, price FROM products WHERE product_id IN ({ids})",
+    'products.update_own': """
+        UPDATE products
+        SET name=%s, price=%s, stock=%s
+        WHERE product_id=%s AND seller_id=%s
+    """,
+    'products.update_many_own': """
+        UPDATE products SET name = {name_case}, price = {price_case}, stock = {stock_case}
+        WHERE product_id IN ({ids}) AND seller_id = %s
+    """,
+    'products.import_lookup': """
+        SELECT product_id, name, stock FROM products
+        WHERE seller_id = %s AND (product_id IN ({ids}) OR name IN ({names}))
+    """,
+    'products.import_lock': """
+        SELECT product_id, name, stock FROM products
+        WHERE seller_id = %s AND (product_id IN ({ids}) OR name IN ({names}))
+        ORDER BY product_id FOR UPDATE
+    """,
+    'products.reserve_stock': "UPDATE products SET stock = stock - %s WHERE product_id = %s AND stock >= %s",
+    'products.reserve_stock_many': """
+        UPDATE products SET stock = stock - {case}
+        WHERE product_id IN ({ids}) AND stock >= {case}
+    """,
+    'products.delete': "DELETE FROM products WHERE product_id=%s",
+    'products.delete_own': "DELETE FROM products WHERE product_id=%s AND seller_id=%s",
+    'products.order_totals': """
+        SELECT
+            COUNT(*) AS total_orders,
+            SUM(CASE WHEN status = '已支付' THEN 1 ELSE 0 END) AS completed_orders,
+            SUM(CASE WHEN status = '已取消' THEN 1 ELSE 0 END) AS canceled_orders,
+            SUM(CASE WHEN status = '已支付' THEN total_price ELSE 0 END) AS total_sales
+        FROM orders
+        WHERE product_id = %s
+        FOR UPDATE
+    """,
+    # 从 average_ratings 出发，按排序分数索引 (rank_score, product_id) 倒序读取，不对结果集排序；
+    # 每个商品的 average_ratings 行由触发器随商品创建，启动时 ensure_average_ratings 检查缺行并自动迁移
+    'products.search': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            p.price,
+            p.stock,
+            u.username AS seller_name,
+            ar.average_stars AS average_rating,
+            ar.review_count AS rating_count
+        FROM average_ratings ar
+        JOIN products p ON p.product_id = ar.product_id
+        JOIN users u ON p.seller_id = u.user_id
+        {where}
+        ORDER BY ar.rank_score DESC, ar.product_id DESC
+        {limit}
+    """,
+    # 没有 average_ratings 行的商品（存在时搜索和推荐会漏掉它们），启动时检查
+    'average_ratings.missing_rows': """
+        SELECT p.product_id FROM products p
+        WHERE NOT EXISTS (SELECT 1 FROM average_ratings ar WHERE ar.product_id = p.product_id)
+        LIMIT 1
+    """,
+    'products.by_seller': """
+        SELECT
+            p.product_id,
+            p.name,
+            p.price,
+            p.stock,
+            IFNULL(ar.average_stars, 0.00) AS average_rating,
+            IFNULL(ar.review_count, 0) AS rating_count
+        FROM products p
+        LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
+        WHERE p.seller_id = %s
+    """,
+    'products.get_own': """
+        SELECT
+            p.product_id,
+            p.name,
+            p.price,
+            p.stock,
+            IFNULL(ar.average_stars, 0.00) AS average_rating,
+            IFNULL(ar.review_count, 0) AS rating_count
+        FROM products p
+        LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
+        WHERE p.product_id = %s AND p.seller_id = %s
+    """,
+    'products.recommend': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            p.price,
+            p.stock,
+            u.username AS seller_name,
+            ar.average_stars AS average_rating,
+            ar.review_count AS rating_count
+        FROM average_ratings ar
+        JOIN products p ON p.product_id = ar.product_id
+        JOIN users u ON p.seller_id = u.user_id
+        ORDER BY ar.rank_score DESC, ar.product_id DESC
+        LIMIT %s
+    """,
+    'products.recommend_by_ids': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            p.price,
+            p.stock,
+            u.username AS seller_name,
+            IFNULL(ar.average_stars, 0.00) AS average_rating,
+            IFNULL(ar.review_count, 0) AS rating_count
+        FROM products p
+        JOIN users u ON p.seller_id = u.user_id
+        LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
+        WHERE p.product_id IN ({ids})
+    """,
+    'recommend.purchases': """
+        SELECT DISTINCT buyer_id AS user_id, product_id
+        FROM orders
+        WHERE status = '已支付'
+    """,
+    'recommend.ratings': "SELECT user_id, product_id, stars FROM reviews",
+    'products.index_all': """
+        SELECT p.product_id, p.name, p.seller_id, u.username AS seller_name
+        FROM products p
+        LEFT JOIN users u ON p.seller_id = u.user_id
+    """,
+
+    # ---- cart（由 cart_store 加载和写回）----
+    'cart.items': "SELECT product_id, quantity FROM cart WHERE user_id = %s",
+    'cart.delete_users': "DELETE FROM cart WHERE user_id IN ({ids})",
+    'cart.insert_many': "INSERT INTO cart (product_id, user_id, quantity) VALUES {rows}",
+
+    # ---- orders ----
+    # 总价在写入时按商品当前价格计算，下单不需要先读出价格
+    'orders.insert': """
+        INSERT INTO orders (buyer_id, product_id, quantity, total_price, status)
+        SELECT %s, product_id, %s, price * %s, '已支付' FROM products WHERE product_id = %s
+    """,
+    'orders.insert_many': """
+        INSERT INTO orders (buyer_id, product_id, quantity, total_price, status)
+        VALUES {rows}
+    """,
+    'orders.list': """
+        SELECT
+            o.order_id,
+            o.product_id,
+            o.buyer_id,
+            p.seller_id,
+            o.quantity,
+            o.total_price,
+            o.status
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+    """,
+    'orders.by_buyer': """
+        SELECT
+            o.order_id,
+            o.product_id,
+            o.quantity,
+            o.total_price,
+            o.status,
+            p.name AS product_name,
+            u.username AS seller_name
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        JOIN users u ON p.seller_id = u.user_id
+        WHERE o.buyer_id = %s
+    """,
+    'orders.by_seller': """
+        SELECT o.order_id, o.buyer_id, o.product_id, o.quantity, o.total_price, o.status, p.name AS product_name
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        WHERE p.seller_id = %s
+    """,
+    # 不排序：结果按索引顺序直接流出，不需要先在库内排序完整个结果集
+    'orders.export': """
+        SELECT
+            o.order_id,
+            o.created_at,
+            o.buyer_id,
+            p.seller_id,
+            o.product_id,
+            p.name AS product_name,
+            o.quantity,
+            o.total_price,
+            o.status
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        {where}
+    """,
+    'orders.lock': "SELECT * FROM orders WHERE order_id=%s FOR UPDATE",
+    'orders.lock_summary': """
+        SELECT product_id, quantity, total_price, status, created_at
+        FROM orders WHERE order_id=%s FOR UPDATE
+    """,
+    'orders.set_status': "UPDATE orders SET status=%s WHERE order_id=%s",
+    'orders.delete': "DELETE FROM orders WHERE order_id=%s",
+    # 排行榜重建：先读出订单 ID 的高水位，两条统计只计入不超过高水位的订单，之后提交的新订单由重放补上
+    'orders.max_id': "SELECT MAX(order_id) AS max_id FROM orders",
+    'orders.sales_by_product': """
+        SELECT product_id, SUM(quantity) AS total_sales
+        FROM orders
+        WHERE status = '已支付' AND order_id <= %s
+        GROUP BY product_id
+    """,
+    'orders.sales_by_product_hour': """
+        SELECT
+            product_id,
+            FLOOR(UNIX_TIMESTAMP(created_at) / %s) AS hour,
+            SUM(quantity) AS total_sales
+        FROM orders
+        WHERE status = '已支付' AND created_at >= %s AND order_id <= %s
+        GROUP BY product_id, hour
+    """,
+
+    # ---- reviews ----
+    # 只有买过（存在已支付订单）才写入；(product_id, user_id) 是主键，已评价时改为更新。
+    # MySQL 影响行数：1 为新增，2 为更新，0 为未购买或内容未变（由 reviews.write_check 区分）；
+    # SQLite 版本新增和更新都是 1
+    'reviews.upsert_if_purchased': """
+        INSERT INTO reviews (product_id, user_id, stars, comment)
+        SELECT %s, %s, %s, %s FROM DUAL
+        WHERE EXISTS (
+            SELECT 1 FROM orders
+            WHERE buyer_id = %s AND product_id = %s AND status = '已支付'
+        )
+        ON DUPLICATE KEY UPDATE stars = VALUES(stars), comment = VALUES(comment)
+    """,
+    'reviews.write_check': """
+        SELECT
+            EXISTS (SELECT 1 FROM products WHERE product_id = %s) AS product_exists,
+            EXISTS (
+                SELECT 1 FROM orders
+                WHERE buyer_id = %s AND product_id = %s AND status = '已支付'
+            ) AS purchased,
+            EXISTS (SELECT 1 FROM reviews WHERE product_id = %s AND user_id = %s) AS reviewed
+    """,
+    'reviews.exists': "SELECT 1 AS found FROM reviews WHERE product_id = %s AND user_id = %s",
+    'reviews.update': "UPDATE reviews SET stars = %s, comment = %s WHERE product_id = %s AND user_id = %s",
+    'reviews.delete': "DELETE FROM reviews WHERE product_id = %s AND user_id = %s",
+    'reviews.by_product': """
+        SELECT r.user_id, u.username, r.stars, r.comment
+        FROM reviews r
+        JOIN users u ON r.user_id = u.user_id
+        WHERE r.product_id = %s
+    """,
+    'reviews.by_seller': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            r.user_id AS buyer_id,
+            u.username AS buyer_name,
+            r.stars,
+            r.comment
+        FROM reviews r
+        JOIN products p ON r.product_id = p.product_id
+        JOIN users u ON r.user_id = u.user_id
+        WHERE p.seller_id = %s
+        ORDER BY p.product_id, r.stars DESC
+    """,
+    'reviews.by_buyer': """
+        SELECT
+            r.product_id,
+            p.name AS product_name,
+            u.username AS seller_name,
+            r.stars,
+            r.comment
+        FROM reviews r
+        JOIN products p ON r.product_id = p.product_id
+        JOIN users u ON p.seller_id = u.user_id
+        WHERE r.user_id = %s
+    """,
+    'reviews.list': """
+        SELECT
+            r.product_id,
+            p.name AS product_name,
+            r.user_id AS buyer_id,
+            u.username AS buyer_name,
+            r.stars,
+            r.comment
+        FROM reviews r
+        JOIN products p ON r.product_id = p.product_id
+        JOIN users u ON r.user_id = u.user_id
+        ORDER BY r.product_id, r.stars DESC
+    """,
+    'average_ratings.get': """
+        SELECT product_id, average_stars, review_count
+        FROM average_ratings
+        WHERE product_id = %s
+    """,
+
+    # ---- admin / logs ----
+    'logs.insert': "INSERT INTO logs (user_id, action, description, timestamp) VALUES (%s, %s, %s, %s)",
+    'logs.page': """
+        SELECT
+            l.log_id,
+            l.user_id,
+            u.username,
+            l.action,
+            l.description,
+            l.timestamp
+        FROM logs l
+        LEFT JOIN users u ON l.user_id = u.user_id
+        {where}
+        ORDER BY l.timestamp DESC, l.log_id DESC
+        LIMIT %s
+    """,
+    # 本批日志涉及的用户中已有日志的，其余用户是首次写日志，计入 log_users 计数器
+    'logs.users_seen': "SELECT DISTINCT user_id FROM logs WHERE user_id IN ({ids})",
+    'logs.recent': """
+        SELECT
+            user_id,
+            action,
+            description,
+            timestamp
+        FROM logs
+        ORDER BY timestamp DESC
+        LIMIT 10
+    """,
+    'admin.top_products': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            SUM(o.quantity) AS total_sales
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        WHERE o.status = '已支付'
+        GROUP BY p.product_id, p.name
+        ORDER BY total_sales DESC
+        LIMIT %s
+    """,
+    'admin.top_products_since': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            SUM(o.quantity) AS total_sales
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        WHERE o.status = '已支付' AND o.created_at >= NOW() - INTERVAL %s HOUR
+        GROUP BY p.product_id, p.name
+        ORDER BY total_sales DESC
+        LIMIT %s
+    """,
+
+    # ---- platform counters ----
+    'counters.add': """
+        INSERT INTO platform_counters (name, shard, value) VALUES {rows}
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    """,
+    # 新订单的计数器增量：销售额取自刚写入的订单，低库存变化按扣减后的库存判断
+    'counters.add_order': """
+        INSERT INTO platform_counters (name, shard, value) VALUES
+            ('total_orders', %s, 1),
+            ('completed_orders', %s, 1),
+            ('total_sales', %s, (SELECT total_price FROM orders WHERE order_id = %s)),
+            ('low_stock_products', %s, (
+                SELECT CASE WHEN stock < {threshold} AND stock + %s >= {threshold} THEN 1 ELSE 0 END
+                FROM products WHERE product_id = %s
+            ))
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    """,
+    'counters.load': "SELECT name, SUM(value) AS value FROM platform_counters GROUP BY name",
+}
+
+# SQLite 后端下语义不同的语句，其余语句由 sqlite_backend 做通用改写（占位符、FOR UPDATE 等）后共用
+SQLITE_QUERIES = {
+    # 导入按 casefold 后的商品名匹配，SQLite 默认区分大小写，改用连接上注册的 CASEFOLD 排序规则
+    'products.import_lookup': """
+        SELECT product_id, name, stock FROM products
+        WHERE seller_id = %s AND (product_id IN ({ids}) OR name COLLATE CASEFOLD IN ({names}))
+    """,
+    'products.import_lock': """
+        SELECT product_id, name, stock FROM products
+        WHERE seller_id = %s AND (product_id IN ({ids}) OR name COLLATE CASEFOLD IN ({names}))
+        ORDER BY product_id FOR UPDATE
+    """,
+    'orders.sales_by_product_hour': """
+        SELECT
+            product_id,
+            CAST(strftime('%%s', created_at, 'utc') AS INTEGER) / %s AS hour,
+            SUM(quantity) AS total_sales
+        FROM orders
+        WHERE status = '已支付' AND created_at >= %s AND order_id <= %s
+        GROUP BY product_id, hour
+    """,
+    'admin.top_products_since': """
+        SELECT
+            p.product_id,
+            p.name AS product_name,
+            SUM(o.quantity) AS total_sales
+        FROM orders o
+        JOIN products p ON o.product_id = p.product_id
+        WHERE o.status = '已支付' AND o.created_at >= datetime('now', 'localtime', '-' || %s || ' hours')
+        GROUP BY p.product_id, p.name
+        ORDER BY total_sales DESC
+        LIMIT %s
+    """,
+    'counters.add': """
+        INSERT INTO platform_counters (name, shard, value) VALUES {rows}
+        ON CONFLICT (name, shard) DO UPDATE SET value = value + excluded.value
+    """,
+    'counters.add_order': """
+        INSERT INTO platform_counters (name, shard, value) VALUES
+            ('total_orders', %s, 1),
+            ('completed_orders', %s, 1),
+            ('total_sales', %s, (SELECT total_price FROM orders WHERE order_id = %s)),
+            ('low_stock_products', %s, (
+                SELECT CASE WHEN stock < {threshold} AND stock + %s >= {threshold} THEN 1 ELSE 0 END
+                FROM products WHERE product_id = %s
+            ))
+        ON CONFLICT (name, shard) DO UPDATE SET value = value + excluded.value
+    """,
+    # SQLite 的 INSERT ... SELECT 后接 ON CONFLICT 时 SELECT 必须带 WHERE；新增和更新的影响行数都是 1，
+    # RETURNING 只能看到写入后的行，也无法区分，add_review 此时记中性的“提交评价成功”
+    'reviews.upsert_if_purchased': """
+        INSERT INTO reviews (product_id, user_id, stars, comment)
+        SELECT %s, %s, %s, %s
+        WHERE EXISTS (
+            SELECT 1 FROM orders
+            WHERE buyer_id = %s AND product_id = %s AND status = '已支付'
+        )
+        ON CONFLICT (product_id, user_id) DO UPDATE SET stars = excluded.stars, comment = excluded.comment
+    """,
+}
+
+# 可选过滤条件：模板名 -> {条件名: 条件片段}，由 where() 按需拼接
+CONDITIONS = {
+    'logs.page': {
+        'user_id': "l.user_id = %s",
+        'action': "l.action = %s",
+        'start': "l.timestamp >= %s",
+        'end': "l.timestamp < %s",
+        # 先用 timestamp <= 限定索引范围，再排除同一时间戳下已返回的记录
+        'after': "l.timestamp <= %s AND (l.timestamp < %s OR l.log_id < %s)",
+    },
+    'orders.export': {
+        'seller_id': "p.seller_id = %s",
+        'status': "o.status IN ({statuses})",
+        'start': "o.created_at >= %s",
+        'end': "o.created_at < %s",
+    },
+    'products.search': {
+        'product_id': "p.product_id = %s",
+        'seller_id': "p.seller_id = %s",
+        'candidates': "p.product_id IN ({ids})",
+        # 模式由 search_index.like_pattern 生成，% 和 _ 已转义为字面字符
+        'name_like': "p.name LIKE %s ESCAPE '\\\\'",
+        'seller_name_like': "u.username LIKE %s ESCAPE '\\\\'",
+    },
+}
+
+
+def placeholders(count):
+    """count 个 %s 占位符，用于 IN 列表"""
+    return ', '.join(['%s'] * count)
+
+
+def repeat(fragment, count, sep=', '):
+    """把片段重复 count 次，用于多行 VALUES 和 CASE 分支"""
+    return sep.join([fragment] * count)
+
+
+def where(name, *keys, **parts):
+    """按注册的条件片段拼接 WHERE 子句，没有条件时返回空串"""
+    if not keys:
+        return ''
+    conditions = CONDITIONS[name]
+    return 'WHERE ' + ' AND '.join(conditions[key].format(**parts) for key in keys)
+
+
+class QueryStats:
+    """按查询名累计调用次数、耗时和行数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # name -> [调用次数, 总耗时, 最大耗时, 行数, 出错次数]
+
+    def record(self, name, elapsed, rows=0, error=False):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = [0, 0.0, 0.0, 0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+            stats[3] += rows
+            if error:
+                stats[4] += 1
+
+    def add_rows(self, name, rows):
+        """流式查询读完结果后补记行数"""
+        with self._lock:
+            if name in self._stats:
+                self._stats[name][3] += rows
+
+    def snapshot(self, sort='total_ms'):
+        with self._lock:
+            items = [(name, list(stats)) for name, stats in self._stats.items()]
+        report = [
+            {
+                'name': name,
+                'calls': calls,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / calls, 3) if calls else 0.0,
+                'max_ms': round(longest * 1000, 3),
+                'rows': rows,
+                'errors': errors
+            }
+            for name, (calls, total, longest, rows, errors) in items
+        ]
+        if sort not in ('name', 'calls', 'total_ms', 'avg_ms', 'max_ms', 'rows', 'errors'):
+            raise ValueError(f'未知的排序字段: {sort}')
+        report.sort(key=lambda item: item[sort], reverse=sort != 'name')
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+query_stats = QueryStats()
+
+_thread = threading.local()
+
+
+def query_count():
+    """当前线程累计执行的具名语句条数"""
+    return getattr(_thread, 'count', 0)
+
+
+def _count_query():
+    _thread.count = getattr(_thread, 'count', 0) + 1
+
+
+class QueryBudgetExceeded(AssertionError):
+    """请求执行的语句条数超过端点声明的上限"""
+
+
+class QueryBudgets:
+    """按端点记录单次请求的语句条数上限、实际最大值和超限次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._budgets = {}  # endpoint -> [上限, 请求数, 最多语句数, 超限次数]
+
+    def observe(self, endpoint, limit, used):
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            if budget is None:
+                budget = self._budgets[endpoint] = [limit, 0, 0, 0]
+            budget[1] += 1
+            if used > budget[2]:
+                budget[2] = used
+            if used > limit:
+                budget[3] += 1
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted((endpoint, list(budget)) for endpoint, budget in self._budgets.items())
+        return [
+            {'endpoint': endpoint, 'limit': limit, 'requests': requests, 'max_queries': most, 'exceeded': exceeded}
+            for endpoint, (limit, requests, most, exceeded) in items
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._budgets.clear()
+
+
+query_budgets = QueryBudgets()
+
+
+def query_budget(limit):
+    """声明处理函数单次请求最多执行 limit 条具名语句（不含提交）
+
+    超出时计入 query_budgets；QUERY_BUDGET_CONFIG['enforce'] 为 True 时抛出 QueryBudgetExceeded，
+    供压测和开发环境把往返次数的回归当作错误暴露出来。
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = query_count()
+            response = func(*args, **kwargs)
+            used = query_count() - start
+            endpoint = request.endpoint or func.__name__
+            query_budgets.observe(endpoint, limit, used)
+            if used > limit and QUERY_BUDGET_CONFIG['enforce']:
+                raise QueryBudgetExceeded(f'{endpoint} 执行了 {used} 条语句，超过上限 {limit}')
+            return response
+        return wrapper
+    return decorator
+
+
+def sql_for(name, **parts):
+    """取出名称对应的 SQL，有模板参数时填充"""
+    if is_sqlite():
+        sql = SQLITE_QUERIES.get(name) or QUERIES[name]
+    else:
+        sql = QUERIES[name]
+    return sql.format(**parts) if parts else sql
+
+
+def _rowcount(cursor):
+    # 无缓冲游标执行后 rowcount 为 -1 或 2^64-1，行数由调用方在读完后补记
+    count = cursor.rowcount
+    return count if 0 <= count < 2 ** 63 else 0
+
+
+def execute(cursor, name, params=None, **parts):
+    """按名称执行语句并记录耗时；SELECT 记返回行数，写语句记影响行数"""
+    sql = sql_for(name, **parts)
+    start = time.perf_counter()
+    try:
+        _count_query()
+        result = cursor.execute(sql, params)
+    except Exception:
+        elapsed = time.perf_counter() - start
+        query_stats.record(name, elapsed, error=True)
+        add_db_time(elapsed)
+        raise
+    elapsed = time.perf_counter() - start
+    query_stats.record(name, elapsed, _rowcount(cursor))
+    add_db_time(elapsed)
+    return result
+
+
+def executemany(cursor, name, seq_of_params, **parts):
+    """按名称批量执行语句并记录耗时"""
+    sql = sql_for(name, **parts)
+    start = time.perf_counter()
+    try:
+        _count_query()
+        result = cursor.executemany(sql, seq_of_params)
+    except Exception:
+        elapsed = time.perf_counter() - start
+        query_stats.record(name, elapsed, error=True)
+        add_db_time(elapsed)
+        raise
+    elapsed = time.perf_counter() - start
+    query_stats.record(name, elapsed, _rowcount(cursor))
+    add_db_time(elapsed)
+    return result
+
+
+def dump_query_stats(file=None, sort='total_ms'):
+    """以表格形式输出各查询的统计，便于在命令行或压测脚本中查看"""
+    file = file or sys.stdout
+    report = query_stats.snapshot(sort)
+    width = max([len('name')] + [len(item['name']) for item in report])
+    print(f"{'name':<{width}}  {'calls':>8}  {'total_ms':>12}  {'avg_ms':>10}  {'max_ms':>10}  {'rows':>10}  {'errors':>6}",
+          file=file)
+    for item in report:
+        print(f"{item['name']:<{width}}  {item['calls']:>8}  {item['total_ms']:>12.3f}  {item['avg_ms']:>10.3f}  "
+              f"{item['max_ms']:>10.3f}  {item['rows']:>10}  {item['errors']:>6}", file=file)
+    return report
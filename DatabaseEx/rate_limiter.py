@@ -0,0 +1,173 @@
+import atexit
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from config import LOGIN_THROTTLE_CONFIG
+from log_writer import get_log_writer
+
+_OTHER = '(其他)'  # 失败统计中超出容量的用户名合并到该键
+
+
+class TokenBucketLimiter:
+    """按键划分的令牌桶限流器
+
+    每个键一个桶：容量 burst，每秒补充 rate 个令牌，每次尝试消耗一个。
+    桶状态保存在容量为 max_keys 的 LRU 中，被淘汰的键相当于桶重新装满。
+    """
+
+    def __init__(self, burst, rate, max_keys=100000):
+        self.burst = burst
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [剩余令牌, 上次补充时间]
+        self._lock = threading.Lock()
+
+    def acquire(self, key, now=None):
+        """消耗一个令牌；返回 0 表示放行，否则返回需要等待的秒数"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+    def wait_time(self, key, now=None):
+        """不消耗令牌，返回 acquire 此刻是否会放行：0 表示放行，否则返回需要等待的秒数"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LoginThrottle:
+    """登录限流：用户名和来源 IP 各一组令牌桶，失败次数按周期汇总写一条日志"""
+
+    def __init__(self, username_burst=5, username_rate=0.1, ip_burst=20, ip_rate=1.0,
+                 max_keys=100000, report_interval=60):
+        self.by_username = TokenBucketLimiter(username_burst, username_rate, max_keys)
+        self.by_ip = TokenBucketLimiter(ip_burst, ip_rate, max_keys)
+        self.max_keys = max_keys
+        self.report_interval = report_interval
+
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()  # 保证两组桶先检查、后同时扣减
+        self._failed = Counter()       # 用户名 -> 本周期密码错误次数
+        self._throttled = Counter()    # 用户名 -> 本周期被限流次数
+        self._ips = set()
+        self._totals = Counter()       # 启动以来的累计值
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _username_key(username):
+        # 数据库比较不区分大小写，限流键也统一大小写，避免换大小写绕过
+        return str(username).strip().casefold()
+
+    def check(self, username, ip):
+        """在查询数据库前调用；返回 0 表示放行，否则返回建议的重试秒数"""
+        self._ensure_reporter()
+        key = self._username_key(username)
+        now = time.monotonic()
+        # 两组桶都放行才同时扣减，避免被用户名桶拒绝的尝试也消耗 IP 的令牌（反之亦然）
+        with self._check_lock:
+            wait = max(self.by_username.wait_time(key, now), self.by_ip.wait_time(ip, now))
+            if not wait:
+                self.by_username.acquire(key, now)
+                self.by_ip.acquire(ip, now)
+        if wait:
+            self._record(self._throttled, username, ip, 'throttled')
+        return wait
+
+    def record_failure(self, username, ip):
+        """用户名或密码错误"""
+        self._record(self._failed, username, ip, 'failed')
+
+    def record_success(self, username):
+        """登录成功后清空该用户名的桶，之前输错的几次不再影响本人"""
+        self.by_username.reset(self._username_key(username))
+
+    def _record(self, counter, username, ip, total_name):
+        key = self._username_key(username)
+        with self._lock:
+            if key not in counter and len(counter) >= self.max_keys:
+                key = _OTHER
+            counter[key] += 1
+            if len(self._ips) < self.max_keys:
+                self._ips.add(ip)
+            self._totals[total_name] += 1
+
+    def report(self):
+        """把本周期的失败统计写成一条日志，没有失败时不写"""
+        with self._lock:
+            failed, throttled, ips = self._failed, self._throttled, self._ips
+            self._failed, self._throttled, self._ips = Counter(), Counter(), set()
+        if not failed and not throttled:
+            return None
+
+        top = (failed + throttled).most_common(5)
+        description = (
+            f"{self.report_interval} 秒内登录失败 {sum(failed.values())} 次，"
+            f"限流拒绝 {sum(throttled.values())} 次，"
+            f"涉及 {len(failed.keys() | throttled.keys())} 个用户名、{len(ips)} 个 IP；"
+            f"尝试最多的用户名: " + ', '.join(f'{name}({count})' for name, count in top)
+        )
+        get_log_writer().enqueue(None, '登录失败汇总', description)
+        return description
+
+    def stats(self):
+        with self._lock:
+            return {
+                'failed_total': self._totals['failed'],
+                'throttled_total': self._totals['throttled'],
+                'pending_failed': sum(self._failed.values()),
+                'pending_throttled': sum(self._throttled.values()),
+                'username_buckets': len(self.by_username),
+                'ip_buckets': len(self.by_ip),
+                'max_keys': self.max_keys
+            }
+
+    def _ensure_reporter(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                # 先启动日志写入器，保证退出时本汇总先于写入器的刷新执行
+                get_log_writer()
+                self._thread = threading.Thread(target=self._run, name='login-throttle-report', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.report_interval):
+            try:
+                self.report()
+            except Exception as e:
+                print(f"登录失败汇总写入失败: {e}")
+
+    def stop(self):
+        """停止汇总线程并写出剩余的统计"""
+        self._stop.set()
+        self.report()
+
+
+login_throttle = LoginThrottle(**LOGIN_THROTTLE_CONFIG)
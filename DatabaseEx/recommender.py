@@ -0,0 +1,252 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from config import RECOMMEND_CONFIG
+from db import get_connection
+from queries import execute
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # 可选依赖，未安装时用纯 Python 计算相似度
+    np = None
+    sparse = None
+
+BACKENDS = ('auto', 'scipy', 'python')
+PRECISION = 9  # 相似度保留的小数位，消除两种实现的浮点误差，使同分商品的顺序一致
+
+
+def _score_key(item):
+    # 分数从高到低，同分时商品 ID 小的在前，保证结果稳定
+    return item[1], -item[0]
+
+
+def interaction_weights(purchases, ratings, purchase_weight, rating_weight):
+    """买家 × 商品的隐式反馈权重：{user_id: {product_id: 权重}}
+
+    买过（已支付订单）记 purchase_weight，评价在此基础上按 (星级 - 3) * rating_weight 加减，
+    权重不大于 0 的（例如 1 星差评）不计入。
+    """
+    weights = defaultdict(dict)
+    for user_id, product_id in purchases:
+        weights[user_id][product_id] = purchase_weight
+    for user_id, product_id, stars in ratings:
+        user = weights[user_id]
+        user[product_id] = user.get(product_id, 0) + (stars - 3) * rating_weight
+    for user_id in list(weights):
+        user = {product_id: weight for product_id, weight in weights[user_id].items() if weight > 0}
+        if user:
+            weights[user_id] = user
+        else:
+            del weights[user_id]
+    return dict(weights)
+
+
+def _top_items(items, limit):
+    """按权重取前 limit 个 (product_id, 权重)"""
+    if len(items) <= limit:
+        return list(items.items())
+    return heapq.nlargest(limit, items.items(), key=_score_key)
+
+
+def similarities_scipy(weights, top_k, max_user_items):
+    """用稀疏矩阵计算商品间余弦相似度，返回 {product_id: ((相似商品, 相似度), ...)}"""
+    users = {}
+    items = {}
+    rows, cols, values = [], [], []
+    for user_id, user_items in weights.items():
+        row = users.setdefault(user_id, len(users))
+        for product_id, weight in _top_items(user_items, max_user_items):
+            rows.append(row)
+            cols.append(items.setdefault(product_id, len(items)))
+            values.append(weight)
+    if not items:
+        return {}
+    product_ids = np.fromiter(items, dtype=np.int64, count=len(items))
+
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(users), len(items)), dtype=np.float64)
+    # 按列（商品）归一化后 X^T X 即为余弦相似度矩阵
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    matrix = matrix @ sparse.diags(1.0 / norms)
+    similarity = (matrix.T @ matrix).tocsr()
+    similarity = (similarity - sparse.diags(similarity.diagonal())).tocsr()
+    similarity.eliminate_zeros()
+
+    neighbours = {}
+    indptr, indices, data = similarity.indptr, similarity.indices, similarity.data
+    for column in range(len(items)):
+        start, end = indptr[column], indptr[column + 1]
+        if start == end:
+            continue
+        scores = np.round(data[start:end], PRECISION)
+        others = indices[start:end]
+        order = np.lexsort((product_ids[others], -scores))[:top_k]
+        neighbours[int(product_ids[column])] = tuple(
+            zip(product_ids[others[order]].tolist(), scores[order].tolist())
+        )
+    return neighbours
+
+
+def similarities_python(weights, top_k, max_user_items):
+    """纯 Python 实现，结果与 similarities_scipy 相同，适用于未安装 numpy/scipy 的环境"""
+    dots = defaultdict(lambda: defaultdict(float))
+    norms = defaultdict(float)
+    for user_items in weights.values():
+        items = _top_items(user_items, max_user_items)
+        for product_id, weight in items:
+            norms[product_id] += weight * weight
+            row = dots[product_id]
+            for other, other_weight in items:
+                if other != product_id:
+                    row[other] += weight * other_weight
+
+    neighbours = {}
+    for product_id, row in dots.items():
+        if not row:
+            continue
+        norm = math.sqrt(norms[product_id])
+        scores = ((other, round(dot / (norm * math.sqrt(norms[other])), PRECISION)) for other, dot in row.items())
+        neighbours[product_id] = tuple(heapq.nlargest(top_k, scores, key=_score_key))
+    return neighbours
+
+
+class ItemRecommender:
+    """基于商品相似度的协同过滤推荐
+
+    后台周期性地从订单和评价构建买家 × 商品稀疏矩阵，算出每个商品最相似的 top_k 个商品；
+    请求时只在内存中累加买家历史商品的相似商品得分，不访问数据库。
+    两次重建之间的新购买会立即计入买家历史，商品相似度要到下次重建才更新。
+    """
+
+    def __init__(self, config=None):
+        config = dict(RECOMMEND_CONFIG, **(config or {}))
+        if config['backend'] not in BACKENDS:
+            raise ValueError(f"未知的推荐计算后端: {config['backend']}")
+        if config['backend'] == 'scipy' and sparse is None:
+            raise RuntimeError('RECOMMEND_CONFIG 指定了 scipy，但未安装 numpy/scipy')
+        self.config = config
+        self.backend = 'scipy' if config['backend'] != 'python' and sparse is not None else 'python'
+        self._lock = threading.Lock()
+        self._neighbours = {}  # product_id -> ((相似商品, 相似度), ...)
+        self._history = {}     # user_id -> {product_id: 权重}
+        self._loading = False
+        self._pending = []     # 重建期间的新购买，重建完成后重放
+        self.ready = False
+        self.built_at = None
+        self.build_seconds = None
+
+    def recommend(self, user_id, limit=10):
+        """返回 [(product_id, 得分)]，不含买家已买过的商品；冷启动买家返回空列表"""
+        with self._lock:
+            history = self._history.get(user_id)
+            if not history:
+                return []
+            items = _top_items(history, self.config['max_user_items'])
+            neighbours = self._neighbours
+        scores = defaultdict(float)
+        for product_id, weight in items:
+            for other, similarity in neighbours.get(product_id, ()):
+                if other not in history:
+                    scores[other] += weight * similarity
+        return heapq.nlargest(limit, scores.items(), key=_score_key)
+
+    def history(self, user_id):
+        """买家有过正向反馈的商品 ID 集合"""
+        with self._lock:
+            return set(self._history.get(user_id, ()))
+
+    def record_purchase(self, user_id, product_id):
+        """订单支付成功后调用，使推荐结果立即排除已买商品"""
+        with self._lock:
+            if self._loading:
+                self._pending.append((user_id, product_id))
+            self._add(user_id, product_id)
+
+    def _add(self, user_id, product_id):
+        user = self._history.setdefault(user_id, {})
+        if product_id not in user:
+            user[product_id] = self.config['purchase_weight']
+
+    def rebuild(self):
+        """从数据库重建相似度索引，返回参与计算的买家数"""
+        with self._lock:
+            self._loading = True
+            self._pending = []
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                execute(cursor, 'recommend.purchases')
+                purchases = [(row['user_id'], row['product_id']) for row in cursor.fetchall()]
+                execute(cursor, 'recommend.ratings')
+                ratings = [(row['user_id'], row['product_id'], int(row['stars'])) for row in cursor.fetchall()]
+            conn.close()
+            conn = None
+
+            config = self.config
+            weights = interaction_weights(purchases, ratings, config['purchase_weight'], config['rating_weight'])
+            compute = similarities_scipy if self.backend == 'scipy' else similarities_python
+            neighbours = compute(weights, config['top_k'], config['max_user_items'])
+        except Exception:
+            with self._lock:
+                self._loading = False
+                self._pending = []
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+        with self._lock:
+            pending = self._pending
+            self._neighbours = neighbours
+            self._history = weights
+            for user_id, product_id in pending:
+                self._add(user_id, product_id)
+            self._loading = False
+            self._pending = []
+            self.ready = True
+            self.built_at = time.time()
+            self.build_seconds = round(time.perf_counter() - started, 3)
+        return len(weights)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'backend': self.backend,
+                'users': len(self._history),
+                'products': len(self._neighbours),
+                'neighbour_pairs': sum(len(items) for items in self._neighbours.values()),
+                'build_seconds': self.build_seconds,
+                'built_at': self.built_at
+            }
+
+
+item_recommender = ItemRecommender()
+
+
+def rebuild_in_background(interval=None):
+    """启动时在后台线程构建推荐索引，此后每 rebuild_interval 秒重建一次
+
+    构建完成前所有买家都使用全局排行。
+    """
+    interval = RECOMMEND_CONFIG['rebuild_interval'] if interval is None else interval
+
+    def run():
+        while True:
+            try:
+                count = item_recommender.rebuild()
+                print(f"推荐索引构建完成，共 {count} 个买家，耗时 {item_recommender.build_seconds} 秒")
+            except Exception as e:
+                print(f"推荐索引构建失败: {e}")
+            if not interval:
+                return
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='recommender-rebuild', daemon=True)
+    thread.start()
+    return thread
@@ -1,210 +1,342 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from routes.permissions import role_required
-from db import get_connection
-import json
-
-# 日志管理blueprint
-logs_bp = Blueprint('logs', __name__)
-
-# 添加日志记录的工具函数
-def log_action(user_id, action, description):
-    """记录用户操作日志"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = "INSERT INTO logs (user_id, action, description) VALUES (%s, %s, %s)"
-            cursor.execute(sql, (user_id, action, description))
-            conn.commit()
-    except Exception as e:
-        print(f"日志记录失败: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-# 管理员查看所有日志
-@logs_bp.route('/admin/logs', methods=['GET'])
-@jwt_required()
-@role_required('admin')  # 仅管理员可访问
-def view_logs():
-    """查看系统日志"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT 
-                    l.log_id,
-                    l.user_id,
-                    u.username,
-                    l.action,
-                    l.description,
-                    l.timestamp
-                FROM logs l
-                LEFT JOIN users u ON l.user_id = u.user_id
-                ORDER BY l.timestamp DESC
-            """
-            cursor.execute(sql)
-            logs = cursor.fetchall()
-        return jsonify(logs), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-@logs_bp.route('/admin/stats/users', methods=['GET'])
-@jwt_required()
-@role_required('admin')
-def user_statistics():
-    """统计用户数量（包括总数、买家、卖家）"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询用户总数、买家总数、卖家总数
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) AS total_users,
-                    SUM(CASE WHEN role = 'buyer' THEN 1 ELSE 0 END) AS total_buyers,
-                    SUM(CASE WHEN role = 'seller' THEN 1 ELSE 0 END) AS total_sellers
-                FROM users
-            """)
-            stats = cursor.fetchone()
-        return jsonify(stats), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-@logs_bp.route('/admin/stats/products', methods=['GET'])
-@jwt_required()
-@role_required('admin')
-def product_statistics():
-    """统计商品总数及库存不足的商品数量"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询商品总数及库存不足的商品数量
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) AS total_products,
-                    SUM(CASE WHEN stock < 10 THEN 1 ELSE 0 END) AS low_stock_products
-                FROM products
-            """)
-            stats = cursor.fetchone()
-        return jsonify(stats), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-@logs_bp.route('/admin/stats/orders', methods=['GET'])
-@jwt_required()
-@role_required('admin')
-def order_statistics():
-    """统计订单总数及完成和取消的订单数"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询订单总数及完成、取消的订单数量
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) AS total_orders,
-                    SUM(CASE WHEN status = '已支付' THEN 1 ELSE 0 END) AS completed_orders,
-                    SUM(CASE WHEN status = '已取消' THEN 1 ELSE 0 END) AS canceled_orders,
-                    SUM(CASE WHEN status = '已支付' THEN total_price ELSE 0 END) AS total_sales
-                FROM orders
-            """)
-            stats = cursor.fetchone()
-        return jsonify(stats), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-@logs_bp.route('/admin/stats/top-products', methods=['GET'])
-@jwt_required()
-@role_required('admin')
-def top_products():
-    """统计最热销的商品（按销量排序）"""
-    conn = None
-    try:
-        limit = int(request.args.get('limit', 10))  # 可选参数，默认返回前10
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询销量最高的商品
-            cursor.execute("""
-                SELECT 
-                    p.product_id, 
-                    p.name AS product_name, 
-                    SUM(o.quantity) AS total_sales
-                FROM orders o
-                JOIN products p ON o.product_id = p.product_id
-                WHERE o.status = '已支付'
-                GROUP BY p.product_id, p.name
-                ORDER BY total_sales DESC
-                LIMIT %s
-            """, (limit,))
-            top_products = cursor.fetchall()
-        return jsonify(top_products), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-@logs_bp.route('/admin/stats/logs', methods=['GET'])
-@jwt_required()
-@role_required('admin')
-def logs_statistics():
-    """统计日志记录"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询日志总数及按用户分布的操作记录数
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) AS total_logs,
-                    COUNT(DISTINCT user_id) AS unique_users
-                FROM logs
-            """)
-            stats = cursor.fetchone()
-
-            # 查询最近的日志
-            cursor.execute("""
-                SELECT 
-                    user_id, 
-                    action, 
-                    description, 
-                    timestamp 
-                FROM logs
-                ORDER BY timestamp DESC
-                LIMIT 10
-            """)
-            recent_logs = cursor.fetchall()
-
-        # 格式化返回的日志记录
-        recent_logs_formatted = [
-            {
-                "user_id": log["user_id"],
-                "action": log["action"],
-                "description": log["description"],
-                "timestamp": log["timestamp"].strftime("%Y-%m-%d %H:%M:%S")  # 格式化时间为易读形式
-            }
-            for log in recent_logs
-        ]
-
-        return jsonify({'stats': stats, 'recent_logs': recent_logs_formatted}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from routes.permissions import role_required
+from db import get_connection, get_pool_stats
+from log_writer import get_log_writer, get_log_queue_stats
+from catalog_cache import get_cache_stats
+from leaderboard import sales_leaderboard, rebuild_leaderboard, WINDOWS
+from counters import platform_counters
+from rate_limiter import login_throttle
+from cart_store import cart_store
+from queries import execute, placeholders, where, query_stats, query_budgets
+import json
+import base64
+from datetime import datetime
+
+# 日志管理blueprint
+logs_bp = Blueprint('logs', __name__)
+
+# 添加日志记录的工具函数
+def log_action(user_id, action, description):
+    """记录用户操作日志（入队后由后台线程批量写入）"""
+    get_log_writer().enqueue(user_id, action, description)
+
+LOGS_PAGE_SIZE = 100
+LOGS_MAX_PAGE_SIZE = 1000
+
+def _encode_cursor(timestamp, log_id):
+    """把一页最后一条日志的 (timestamp, log_id) 编码为不透明游标"""
+    raw = json.dumps([timestamp.isoformat(sep=' '), log_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, log_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+def _parse_time(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} 时间格式错误，应为 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS')
+
+def _int_arg(name, default=None):
+    """读取整数查询参数；request.args.get(type=int) 会把无法解析的值静默当作未传，这里改为抛出 ValueError"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} 必须为整数')
+
+# 管理员查看日志（支持过滤与游标分页）
+@logs_bp.route('/admin/logs', methods=['GET'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def view_logs():
+    """查看系统日志
+
+    可选参数：user_id、action、start、end（时间范围）、limit、cursor。
+    按 (timestamp, log_id) 倒序做键集分页，下一页的游标放在响应头 X-Next-Cursor 中。
+    配合 db_create.txt 中 logs 表的复合索引，任意深度的翻页都是一次有界的索引范围扫描。
+    """
+    conn = None
+    try:
+        action = request.args.get('action', type=str)
+        start = request.args.get('start', type=str)
+        end = request.args.get('end', type=str)
+        cursor_param = request.args.get('cursor', type=str)
+
+        # 参数无法解析时返回 400，而不是忽略该条件返回未过滤的结果
+        try:
+            user_id = _int_arg('user_id')
+            limit = max(1, min(_int_arg('limit', LOGS_PAGE_SIZE), LOGS_MAX_PAGE_SIZE))
+            if action is not None and not (action.strip() and len(action) <= 255):
+                raise ValueError('action 不能为空且长度不能超过 255')
+            if cursor_param is not None and not cursor_param:
+                raise ValueError('无效的分页游标')
+
+            filters = []
+            params = []
+            if user_id is not None:
+                filters.append('user_id')
+                params.append(user_id)
+            if action is not None:
+                filters.append('action')
+                params.append(action)
+            if start:
+                filters.append('start')
+                params.append(_parse_time(start, 'start'))
+            if end:
+                filters.append('end')
+                params.append(_parse_time(end, 'end'))
+            if cursor_param is not None:
+                last_timestamp, last_log_id = _decode_cursor(cursor_param)
+                filters.append('after')
+                params.extend([last_timestamp, last_timestamp, last_log_id])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 多取一条用于判断是否还有下一页
+            execute(cursor, 'logs.page', params + [limit + 1], where=where('logs.page', *filters))
+            logs = cursor.fetchall()
+
+        response = jsonify(logs[:limit])
+        if len(logs) > limit:
+            last = logs[limit - 1]
+            response.headers['X-Next-Cursor'] = _encode_cursor(last['timestamp'], last['log_id'])
+        return response, 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 查看数据库连接池状态
+@logs_bp.route('/admin/stats/db_pool', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def db_pool_statistics():
+    """查看数据库连接池状态"""
+    try:
+        return jsonify(get_pool_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看日志写入队列状态
+@logs_bp.route('/admin/stats/log_queue', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def log_queue_statistics():
+    """查看日志写入队列状态（排队、丢弃、落盘数量等）"""
+    try:
+        return jsonify(get_log_queue_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看商品目录缓存状态
+@logs_bp.route('/admin/stats/catalog_cache', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def catalog_cache_statistics():
+    """查看商品目录缓存状态（命中、未命中、条目数）"""
+    try:
+        return jsonify(get_cache_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看登录限流状态
+@logs_bp.route('/admin/stats/login_throttle', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def login_throttle_statistics():
+    """查看登录限流状态（失败、限流次数及令牌桶数量）"""
+    try:
+        return jsonify(login_throttle.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看购物车写回状态
+@logs_bp.route('/admin/stats/cart_store', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def cart_store_statistics():
+    """查看内存购物车状态（用户数、待落库用户数、写回次数与失败次数）"""
+    try:
+        return jsonify(cart_store.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看各具名 SQL 的执行统计
+@logs_bp.route('/admin/stats/queries', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def query_statistics():
+    """按查询名统计调用次数、总耗时、最大耗时和行数，可选 sort=total_ms|avg_ms|max_ms|calls|rows|errors|name"""
+    try:
+        sort = request.args.get('sort', default='total_ms', type=str)
+        try:
+            report = query_stats.snapshot(sort)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(report), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看各端点单次请求的语句条数
+@logs_bp.route('/admin/stats/query_budgets', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def query_budget_statistics():
+    """查看声明了语句条数上限的端点：上限、请求数、单次请求最多执行的语句数和超限次数"""
+    try:
+        return jsonify(query_budgets.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 清零 SQL 执行统计
+@logs_bp.route('/admin/stats/queries/reset', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def reset_query_statistics():
+    """清零 SQL 执行统计，便于观察某段时间内的负载"""
+    try:
+        query_stats.reset()
+        query_budgets.reset()
+        return jsonify({'message': 'SQL 执行统计已清零'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@logs_bp.route('/admin/stats/users', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def user_statistics():
+    """统计用户数量（包括总数、买家、卖家）"""
+    try:
+        # 从平台计数器读取，不扫描 users 表
+        stats = platform_counters.snapshot(('total_users', 'total_buyers', 'total_sellers'))
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@logs_bp.route('/admin/stats/products', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def product_statistics():
+    """统计商品总数及库存不足的商品数量"""
+    try:
+        stats = platform_counters.snapshot(('total_products', 'low_stock_products'))
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@logs_bp.route('/admin/stats/orders', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def order_statistics():
+    """统计订单总数及完成和取消的订单数"""
+    try:
+        stats = platform_counters.snapshot(('total_orders', 'completed_orders', 'canceled_orders', 'total_sales'))
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 按业务表校正平台计数器
+@logs_bp.route('/admin/stats/reconcile', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def reconcile_statistics():
+    """重新统计并覆盖平台计数器，返回校正前后的值"""
+    try:
+        result = platform_counters.reconcile()
+        return jsonify({'message': '平台计数器已校正', 'counters': result}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@logs_bp.route('/admin/stats/top-products', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def top_products():
+    """统计最热销的商品（按销量排序）
+
+    可选参数 window=all|24h|7d。排行榜就绪时直接读取内存中的有序结构，
+    只按主键查询前 N 名的商品名；未就绪时退回对 orders 的聚合查询。
+    """
+    conn = None
+    try:
+        limit = int(request.args.get('limit', 10))  # 可选参数，默认返回前10
+        window = request.args.get('window', 'all')
+        if window not in WINDOWS:
+            return jsonify({'error': f'window 只能是 {", ".join(WINDOWS)}'}), 400
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            if sales_leaderboard.ready:
+                ranking = sales_leaderboard.top(window, limit)
+                if not ranking:
+                    return jsonify([]), 200
+                ids = [product_id for product_id, _ in ranking]
+                execute(cursor, 'products.names', ids, ids=placeholders(len(ids)))
+                names = {row['product_id']: row['name'] for row in cursor.fetchall()}
+                top_products = [
+                    {'product_id': product_id, 'product_name': names[product_id], 'total_sales': total_sales}
+                    for product_id, total_sales in ranking
+                    if product_id in names
+                ]
+                return jsonify(top_products), 200
+
+            # 查询销量最高的商品
+            if WINDOWS[window]:
+                execute(cursor, 'admin.top_products_since', (WINDOWS[window], limit))
+            else:
+                execute(cursor, 'admin.top_products', (limit,))
+            top_products = cursor.fetchall()
+        return jsonify(top_products), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 根据订单表重建销量排行榜
+@logs_bp.route('/admin/stats/top-products/rebuild', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def rebuild_top_products():
+    """重建销量排行榜（服务重启后或数据校正时使用）"""
+    try:
+        count = rebuild_leaderboard()
+        return jsonify({'message': '销量排行榜已重建', 'products': count}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@logs_bp.route('/admin/stats/logs', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def logs_statistics():
+    """统计日志记录"""
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 日志总数与涉及用户数都读平台计数器，由日志写入线程维护
+            counters = platform_counters.snapshot(('total_logs', 'log_users'))
+            stats = {'total_logs': counters['total_logs'], 'unique_users': counters['log_users']}
+
+            # 查询最近的日志（时间由 JSON 序列化统一输出为 ISO 8601）
+            execute(cursor, 'logs.recent')
+            recent_logs = cursor.fetchall()
+
+        return jsonify({'stats': stats, 'recent_logs': recent_logs}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
@@ -1,159 +1,307 @@
-import json
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import get_connection
-from routes.permissions import role_required
-
-average_ratings_bp = Blueprint('average_ratings', __name__)
-
-def create_triggers():
-    """创建触发器，用于在相关表发生变化时自动处理依赖关系"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 创建触发器：在新增商品时添加平均星级初始行
-            cursor.execute("""
-                CREATE TRIGGER before_insert_product
-                AFTER INSERT ON products
-                FOR EACH ROW
-                BEGIN
-                    INSERT INTO average_ratings (product_id, average_stars, review_count)
-                    VALUES (NEW.product_id, 0.00, 0);
-                END;
-            """)
-
-            # 创建触发器：在删除商品前删除所有相关评价
-            cursor.execute("""
-                CREATE TRIGGER before_delete_product_reviews
-                BEFORE DELETE ON products
-                FOR EACH ROW
-                BEGIN
-                    DELETE FROM reviews WHERE product_id = OLD.product_id;
-                END;
-            """)
-
-            # 创建触发器：在删除商品前删除 average_ratings
-            cursor.execute("""
-                CREATE TRIGGER before_delete_product_ratings
-                BEFORE DELETE ON products
-                FOR EACH ROW
-                BEGIN
-                    DELETE FROM average_ratings WHERE product_id = OLD.product_id;
-                END;
-            """)
-
-            # 创建触发器：在新增评价时更新平均星级
-            cursor.execute("""
-                CREATE TRIGGER after_insert_review
-                AFTER INSERT ON reviews
-                FOR EACH ROW
-                BEGIN
-                    UPDATE average_ratings
-                    SET average_stars = (
-                        SELECT AVG(stars)
-                        FROM reviews
-                        WHERE product_id = NEW.product_id
-                    ),
-                    review_count = (
-                        SELECT COUNT(*)
-                        FROM reviews
-                        WHERE product_id = NEW.product_id
-                    )
-                    WHERE product_id = NEW.product_id;
-                END;
-            """)
-
-            # 创建触发器：在更新评价时更新平均星级
-            cursor.execute("""
-                CREATE TRIGGER after_update_review
-                AFTER UPDATE ON reviews
-                FOR EACH ROW
-                BEGIN
-                    UPDATE average_ratings
-                    SET average_stars = (
-                        SELECT AVG(stars)
-                        FROM reviews
-                        WHERE product_id = NEW.product_id
-                    ),
-                    review_count = (
-                        SELECT COUNT(*)
-                        FROM reviews
-                        WHERE product_id = NEW.product_id
-                    )
-                    WHERE product_id = NEW.product_id;
-                END;
-            """)
-
-            # 创建触发器：在删除评价时更新平均星级
-            cursor.execute("""
-                CREATE TRIGGER after_delete_review
-                AFTER DELETE ON reviews
-                FOR EACH ROW
-                BEGIN
-                    UPDATE average_ratings
-                    SET average_stars = (
-                        SELECT IFNULL(AVG(stars), 0)
-                        FROM reviews
-                        WHERE product_id = OLD.product_id
-                    ),
-                    review_count = (
-                        SELECT COUNT(*)
-                        FROM reviews
-                        WHERE product_id = OLD.product_id
-                    )
-                    WHERE product_id = OLD.product_id;
-                END;
-            """)
-
-            # 创建触发器：在删除商品前删除所有相关订单
-            cursor.execute("""
-                CREATE TRIGGER before_delete_cascade_orders
-                BEFORE DELETE ON products
-                FOR EACH ROW
-                BEGIN
-                    DELETE FROM orders WHERE product_id = OLD.product_id;
-                END;
-            """)
-            conn.commit()
-    except Exception as e:
-        print(f"Error creating triggers: {e}")
-    finally:
-        if conn:
-            conn.close()
-
-# 手动触发触发器创建
-@average_ratings_bp.route('/create_triggers', methods=['POST'])
-@jwt_required()
-@role_required('admin')  # 仅管理员可访问
-def setup_triggers():
-    """手动创建触发器"""
-    try:
-        create_triggers()
-        return jsonify({'message': '触发器已创建'}), 201
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-# 查看某商品的平均星级
-@average_ratings_bp.route('/average_ratings/<int:product_id>', methods=['GET'])
-def get_average_rating(product_id):
-    """获取某商品的平均星级和评价数量"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT product_id, average_stars, review_count
-                FROM average_ratings
-                WHERE product_id = %s
-            """
-            cursor.execute(sql, (product_id,))
-            result = cursor.fetchone()
-            if not result:
-                return jsonify({'error': '商品不存在或尚无评价'}), 404
-        return jsonify(result), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+import json
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from db import get_connection, is_sqlite
+from config import RANKING_CONFIG
+from routes.permissions import role_required
+from catalog_cache import bump_catalog_version, cached_catalog_response
+from queries import execute
+
+average_ratings_bp = Blueprint('average_ratings', __name__)
+
+# 排序分数（贝叶斯平均）的先验，写入触发器定义
+PRIOR_COUNT = RANKING_CONFIG['prior_count']
+PRIOR_SUM = float(RANKING_CONFIG['prior_count'] * RANKING_CONFIG['prior_mean'])
+
+# 评分触发器：维护星级总和 star_sum、评价数 review_count 和排序分数 rank_score，
+# 每次写入只做常数次主键更新，不再对该商品的全部评价重新 AVG/COUNT。
+# MySQL 单表 UPDATE 的赋值按从左到右执行，后面的表达式读取的是已更新的值。
+RATING_TRIGGERS = [
+    ('before_insert_product', f"""
+        CREATE TRIGGER before_insert_product
+        AFTER INSERT ON products
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO average_ratings (product_id, average_stars, review_count, star_sum, rank_score)
+            VALUES (NEW.product_id, 0.00, 0, 0, {PRIOR_SUM} / {PRIOR_COUNT});
+        END;
+    """),
+    ('after_insert_review', f"""
+        CREATE TRIGGER after_insert_review
+        AFTER INSERT ON reviews
+        FOR EACH ROW
+        BEGIN
+            UPDATE average_ratings
+            SET star_sum = star_sum + NEW.stars,
+                review_count = review_count + 1,
+                average_stars = star_sum / review_count,
+                rank_score = (star_sum + {PRIOR_SUM}) / (review_count + {PRIOR_COUNT})
+            WHERE product_id = NEW.product_id;
+        END;
+    """),
+    ('after_update_review', f"""
+        CREATE TRIGGER after_update_review
+        AFTER UPDATE ON reviews
+        FOR EACH ROW
+        BEGIN
+            IF OLD.product_id = NEW.product_id THEN
+                IF OLD.stars <> NEW.stars THEN
+                    UPDATE average_ratings
+                    SET star_sum = star_sum + NEW.stars - OLD.stars,
+                        average_stars = star_sum / review_count,
+                        rank_score = (star_sum + {PRIOR_SUM}) / (review_count + {PRIOR_COUNT})
+                    WHERE product_id = NEW.product_id;
+                END IF;
+            ELSE
+                UPDATE average_ratings
+                SET star_sum = star_sum - OLD.stars,
+                    review_count = review_count - 1,
+                    average_stars = IF(review_count = 0, 0, star_sum / review_count),
+                    rank_score = (star_sum + {PRIOR_SUM}) / (review_count + {PRIOR_COUNT})
+                WHERE product_id = OLD.product_id;
+                UPDATE average_ratings
+                SET star_sum = star_sum + NEW.stars,
+                    review_count = review_count + 1,
+                    average_stars = star_sum / review_count,
+                    rank_score = (star_sum + {PRIOR_SUM}) / (review_count + {PRIOR_COUNT})
+                WHERE product_id = NEW.product_id;
+            END IF;
+        END;
+    """),
+    ('after_delete_review', f"""
+        CREATE TRIGGER after_delete_review
+        AFTER DELETE ON reviews
+        FOR EACH ROW
+        BEGIN
+            UPDATE average_ratings
+            SET star_sum = star_sum - OLD.stars,
+                review_count = review_count - 1,
+                average_stars = IF(review_count = 0, 0, star_sum / review_count),
+                rank_score = (star_sum + {PRIOR_SUM}) / (review_count + {PRIOR_COUNT})
+            WHERE product_id = OLD.product_id;
+        END;
+    """)
+]
+
+def create_triggers():
+    """创建触发器，用于在相关表发生变化时自动处理依赖关系"""
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            if is_sqlite():
+                # SQLite 后端使用等价的触发器定义（建库时已创建，这里补建缺失的）
+                import sqlite_backend
+                sqlite_backend.create_triggers(cursor)
+                conn.commit()
+                return
+            # 创建触发器：在删除商品前删除所有相关评价
+            cursor.execute("""
+                CREATE TRIGGER before_delete_product_reviews
+                BEFORE DELETE ON products
+                FOR EACH ROW
+                BEGIN
+                    DELETE FROM reviews WHERE product_id = OLD.product_id;
+                END;
+            """)
+
+            # 创建触发器：在删除商品前删除 average_ratings
+            cursor.execute("""
+                CREATE TRIGGER before_delete_product_ratings
+                BEFORE DELETE ON products
+                FOR EACH ROW
+                BEGIN
+                    DELETE FROM average_ratings WHERE product_id = OLD.product_id;
+                END;
+            """)
+
+            # 创建触发器：新增商品时添加平均星级初始行，评价增删改时按增量维护平均星级和排序分数
+            for _, sql in RATING_TRIGGERS:
+                cursor.execute(sql)
+
+            # 创建触发器：在删除商品前删除所有相关订单
+            cursor.execute("""
+                CREATE TRIGGER before_delete_cascade_orders
+                BEFORE DELETE ON products
+                FOR EACH ROW
+                BEGIN
+                    DELETE FROM orders WHERE product_id = OLD.product_id;
+                END;
+            """)
+            conn.commit()
+    except Exception as e:
+        print(f"Error creating triggers: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def migrate_average_ratings():
+    """把已有库迁移到增量维护方式（启动时 ensure_average_ratings 发现不完整会自动执行）
+
+    1. 为 average_ratings 增加 star_sum、rank_score 列和排序分数索引（已存在则跳过）；
+    2. 用增量版本替换新增商品和三个评价触发器；
+    3. 补齐缺失的 average_ratings 行，并按 reviews 表一次性重算 star_sum、review_count、average_stars、rank_score。
+    重算与触发器替换之间若有评价写入可能不准，建议在低峰期执行，之后也可重复执行以校正；
+    修改 RANKING_CONFIG 后重新执行即可按新的先验重建触发器并重算排序分数。
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            if is_sqlite():
+                return _migrate_average_ratings_sqlite(conn, cursor)
+            cursor.execute("""
+                SELECT COLUMN_NAME AS name
+                FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = 'average_ratings'
+            """)
+            columns = {row['name'] for row in cursor.fetchall()}
+            if 'star_sum' not in columns:
+                cursor.execute("""
+                    ALTER TABLE average_ratings
+                    ADD COLUMN star_sum INT NOT NULL DEFAULT 0 CHECK (star_sum >= 0)
+                """)
+            if 'rank_score' not in columns:
+                cursor.execute("""
+                    ALTER TABLE average_ratings
+                    ADD COLUMN rank_score DECIMAL(7, 6) NOT NULL DEFAULT 0,
+                    ADD INDEX idx_ar_rank_score (rank_score, product_id)
+                """)
+
+            for name, sql in RATING_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                cursor.execute(sql)
+
+            cursor.execute("""
+                INSERT IGNORE INTO average_ratings (product_id, average_stars, review_count, star_sum)
+                SELECT product_id, 0.00, 0, 0 FROM products
+            """)
+            cursor.execute(f"""
+                UPDATE average_ratings ar
+                LEFT JOIN (
+                    SELECT product_id, SUM(stars) AS star_sum, COUNT(*) AS review_count
+                    FROM reviews
+                    GROUP BY product_id
+                ) r ON ar.product_id = r.product_id
+                SET ar.star_sum = IFNULL(r.star_sum, 0),
+                    ar.review_count = IFNULL(r.review_count, 0),
+                    ar.average_stars = IFNULL(r.star_sum / r.review_count, 0),
+                    ar.rank_score = (IFNULL(r.star_sum, 0) + {PRIOR_SUM}) / (IFNULL(r.review_count, 0) + {PRIOR_COUNT})
+            """)
+            updated = cursor.rowcount
+            conn.commit()
+        return updated
+    finally:
+        if conn:
+            conn.close()
+
+def ensure_average_ratings():
+    """检查排序分数依赖的结构是否完整，不完整时自动执行 migrate_average_ratings，返回是否执行了迁移
+
+    搜索和推荐从 average_ratings 出发按 rank_score 读取，缺少该表的行的商品会被漏掉；
+    缺少列、评分触发器，或有商品没有对应行时都视为不完整。
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            complete = True
+            if not is_sqlite():
+                # SQLite 在打开数据库时已补齐列和触发器，只需检查行
+                cursor.execute("""
+                    SELECT COLUMN_NAME AS name
+                    FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'average_ratings'
+                """)
+                columns = {row['name'] for row in cursor.fetchall()}
+                cursor.execute("SELECT TRIGGER_NAME AS name FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()")
+                triggers = {row['name'] for row in cursor.fetchall()}
+                complete = {'star_sum', 'rank_score'} <= columns and {name for name, _ in RATING_TRIGGERS} <= triggers
+            if complete:
+                execute(cursor, 'average_ratings.missing_rows')
+                complete = cursor.fetchone() is None
+    finally:
+        if conn:
+            conn.close()
+    if complete:
+        return False
+    migrate_average_ratings()
+    return True
+
+def ensure_on_startup():
+    """启动时在处理请求之前检查平均星级表，必要时迁移"""
+    try:
+        if ensure_average_ratings():
+            print("average_ratings 结构或数据不完整，已自动迁移")
+    except Exception as e:
+        print(f"average_ratings 检查失败: {e}")
+
+def _migrate_average_ratings_sqlite(conn, cursor):
+    """SQLite 后端的重算：建库时已包含 star_sum、rank_score 列，按当前先验重建评分触发器后补齐行并重算"""
+    import sqlite_backend
+    for name, sql in sqlite_backend.TRIGGERS:
+        if name in sqlite_backend.RATING_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(sql)
+    cursor.execute("""
+        INSERT OR IGNORE INTO average_ratings (product_id, average_stars, review_count, star_sum)
+        SELECT product_id, 0.00, 0, 0 FROM products
+    """)
+    cursor.execute("""
+        UPDATE average_ratings
+        SET star_sum = IFNULL((SELECT SUM(stars) FROM reviews r WHERE r.product_id = average_ratings.product_id), 0),
+            review_count = (SELECT COUNT(*) FROM reviews r WHERE r.product_id = average_ratings.product_id),
+            average_stars = IFNULL((SELECT ROUND(AVG(stars), 2) FROM reviews r
+                                    WHERE r.product_id = average_ratings.product_id), 0)
+    """)
+    cursor.execute(sqlite_backend.RANK_SCORE_SQL)
+    updated = cursor.rowcount
+    conn.commit()
+    return updated
+
+# 手动触发触发器创建
+@average_ratings_bp.route('/create_triggers', methods=['POST'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def setup_triggers():
+    """手动创建触发器"""
+    try:
+        create_triggers()
+        return jsonify({'message': '触发器已创建'}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 迁移平均星级为增量维护
+@average_ratings_bp.route('/average_ratings/migrate', methods=['POST'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def migrate_ratings():
+    """迁移 average_ratings 到增量维护并重算已有数据"""
+    try:
+        updated = migrate_average_ratings()
+        bump_catalog_version()
+        return jsonify({'message': '平均星级已迁移为增量维护', 'updated_rows': updated}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查看某商品的平均星级
+@average_ratings_bp.route('/average_ratings/<int:product_id>', methods=['GET'])
+@cached_catalog_response
+def get_average_rating(product_id):
+    """获取某商品的平均星级和评价数量"""
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            execute(cursor, 'average_ratings.get', (product_id,))
+            result = cursor.fetchone()
+            if not result:
+                return jsonify({'error': '商品不存在或尚无评价'}), 404
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
@@ -1,363 +1,382 @@
-import json
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import get_connection
-from routes.permissions import role_required
-from routes.admin import log_action
-
-cart_bp = Blueprint('cart', __name__)
-
-
-# 加入购物车
-@cart_bp.route('/cart', methods=['POST'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def add_to_cart():
-    """将商品加入购物车"""
-    conn = None
-    try:
-        data = request.get_json()
-        product_id = data['product_id']
-        quantity = data['quantity']
-
-        # 获取当前用户信息
-        current_user = json.loads(get_jwt_identity())
-        user_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 检查商品是否存在
-            cursor.execute("SELECT stock FROM products WHERE product_id = %s", (product_id,))
-            product = cursor.fetchone()
-            if not product:
-                # 记录日志：商品不存在
-                action = "加入购物车失败"
-                description = f"用户 {user_id} 尝试将不存在的商品 {product_id} 加入购物车"
-                log_action(user_id, action, description)
-
-                return jsonify({'error': '商品不存在'}), 404
-
-            # 检查库存是否足够
-            if quantity > product['stock']:
-                # 记录日志：库存不足
-                action = "加入购物车失败"
-                description = f"用户 {user_id} 尝试将商品 {product_id} 加入购物车，但库存不足"
-                log_action(user_id, action, description)
-
-                return jsonify({'error': '库存不足'}), 400
-
-            # 检查购物车中是否已存在该商品
-            cursor.execute("SELECT quantity FROM cart WHERE product_id = %s AND user_id = %s", (product_id, user_id))
-            cart_item = cursor.fetchone()
-            if cart_item:
-                # 如果已存在，更新数量
-                cursor.execute(
-                    "UPDATE cart SET quantity = quantity + %s WHERE product_id = %s AND user_id = %s",
-                    (quantity, product_id, user_id)
-                )
-                action = "更新购物车"
-                description = f"用户 {user_id} 更新购物车中商品 {product_id} 的数量为 {cart_item['quantity'] + quantity}"
-            else:
-                # 如果不存在，插入新记录
-                cursor.execute(
-                    "INSERT INTO cart (product_id, user_id, quantity) VALUES (%s, %s, %s)",
-                    (product_id, user_id, quantity)
-                )
-                action = "加入购物车"
-                description = f"用户 {user_id} 将商品 {product_id} 数量 {quantity} 加入购物车"
-
-            # 记录日志：成功加入购物车或更新购物车
-            log_action(user_id, action, description)
-
-            conn.commit()
-        return jsonify({'message': '商品已加入购物车'}), 201
-    except Exception as e:
-        # 记录日志：系统错误
-        action = "加入购物车失败"
-        description = f"用户 {user_id} 尝试将商品 {product_id} 加入购物车时发生系统错误：{str(e)}"
-        log_action(user_id, action, description)
-
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 从购物车删除商品
-@cart_bp.route('/cart/<int:product_id>', methods=['DELETE'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def remove_from_cart(product_id):
-    """将商品从购物车中移除"""
-    conn = None
-    try:
-        # 获取当前用户信息
-        current_user = json.loads(get_jwt_identity())
-        user_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 检查购物车中是否存在该商品
-            cursor.execute("SELECT * FROM cart WHERE product_id = %s AND user_id = %s", (product_id, user_id))
-            cart_item = cursor.fetchone()
-            if not cart_item:
-                # 记录日志：尝试移除不存在的商品
-                action = "移除购物车失败"
-                description = f"用户 {user_id} 尝试移除购物车中不存在的商品 {product_id}"
-                log_action(user_id, action, description)
-
-                return jsonify({'error': '购物车中没有该商品'}), 404
-
-            # 从购物车中删除商品
-            cursor.execute("DELETE FROM cart WHERE product_id = %s AND user_id = %s", (product_id, user_id))
-            conn.commit()
-
-            # 记录日志：成功移除商品
-            action = "移除购物车"
-            description = f"用户 {user_id} 将商品 {product_id} 从购物车中移除"
-            log_action(user_id, action, description)
-
-        return jsonify({'message': '商品已从购物车中移除'}), 200
-    except Exception as e:
-        # 记录日志：系统错误
-        action = "移除购物车失败"
-        description = f"用户 {user_id} 尝试移除商品 {product_id} 时发生系统错误：{str(e)}"
-        log_action(user_id, action, description)
-
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 查看购物车内容
-@cart_bp.route('/cart', methods=['GET'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def view_cart():
-    """查看购物车内容"""
-    conn = None
-    try:
-        # 获取当前用户信息
-        current_user = json.loads(get_jwt_identity())
-        user_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询购物车中属于当前用户的所有商品
-            sql = """
-                SELECT c.product_id, p.name AS product_name, c.quantity, p.price, (c.quantity * p.price) AS total_price
-                FROM cart c
-                JOIN products p ON c.product_id = p.product_id
-                WHERE c.user_id = %s
-            """
-            cursor.execute(sql, (user_id,))
-            cart_items = cursor.fetchall()
-
-        return jsonify(cart_items), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 批量从购物车下单
-@cart_bp.route('/cart/checkout', methods=['POST'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def checkout_cart():
-    """批量下单"""
-    conn = None
-    try:
-        # 获取当前用户信息
-        current_user = json.loads(get_jwt_identity())
-        user_id = current_user['user_id']
-
-        conn = get_connection()
-        conn.autocommit = False  # 开启事务管理
-        with conn.cursor() as cursor:
-            # 查询购物车内容
-            sql_cart = """
-                SELECT c.product_id, c.quantity, p.price, p.stock
-                FROM cart c
-                JOIN products p ON c.product_id = p.product_id
-                WHERE c.user_id = %s
-            """
-            cursor.execute(sql_cart, (user_id,))
-            cart_items = cursor.fetchall()
-
-            if not cart_items:
-                # 记录日志：购物车为空
-                action = "批量下单失败"
-                description = f"用户 {user_id} 尝试下单时购物车为空"
-                log_action(user_id, action, description)
-
-                return jsonify({'error': '购物车为空，无法下单'}), 400
-
-            successful_orders = []
-            failed_orders = []
-
-            for item in cart_items:
-                product_id = item['product_id']
-                quantity = item['quantity']
-                price = item['price']
-                stock = item['stock']
-
-                if quantity > stock:
-                    # 如果库存不足，记录失败原因
-                    failed_orders.append({
-                        'product_id': product_id,
-                        'reason': '库存不足'
-                    })
-                    # 记录日志：库存不足
-                    action = "批量下单失败"
-                    description = f"用户 {user_id} 下单商品 {product_id} 时库存不足"
-                    log_action(user_id, action, description)
-
-                    continue
-
-                try:
-                    # 扣减库存并创建订单
-                    total_price = quantity * price
-                    sql_order = """
-                        INSERT INTO orders (buyer_id, product_id, quantity, total_price, status)
-                        VALUES (%s, %s, %s, %s, '已支付')
-                    """
-                    cursor.execute(sql_order, (user_id, product_id, quantity, total_price))
-
-                    sql_update_stock = "UPDATE products SET stock = stock - %s WHERE product_id = %s"
-                    cursor.execute(sql_update_stock, (quantity, product_id))
-
-                    # 从购物车中移除已下单的商品
-                    sql_remove_cart = "DELETE FROM cart WHERE product_id = %s AND user_id = %s"
-                    cursor.execute(sql_remove_cart, (product_id, user_id))
-
-                    # 成功记录
-                    successful_orders.append({
-                        'product_id': product_id,
-                        'quantity': quantity,
-                        'total_price': total_price
-                    })
-
-                    # 记录日志：成功下单
-                    action = "批量下单成功"
-                    description = f"用户 {user_id} 成功下单商品 {product_id}，数量 {quantity}，总价 {total_price}"
-                    log_action(user_id, action, description)
-
-                except Exception as e:
-                    # 如果当前订单失败，回滚当前循环中的事务
-                    conn.rollback()
-                    failed_orders.append({
-                        'product_id': product_id,
-                        'reason': f'处理失败: {str(e)}'
-                    })
-
-                    # 记录日志：下单失败
-                    action = "批量下单失败"
-                    description = f"用户 {user_id} 下单商品 {product_id} 时失败，原因：{str(e)}"
-                    log_action(user_id, action, description)
-
-                    continue
-
-            # 如果有成功的订单，提交事务
-            if successful_orders:
-                conn.commit()
-            else:
-                conn.rollback()  # 如果所有订单失败，回滚整个事务
-
-            # 记录日志：批量下单完成
-            action = "批量下单完成"
-            description = (
-                f"用户 {user_id} 批量下单完成。成功订单：{len(successful_orders)} 个，失败订单：{len(failed_orders)} 个"
-            )
-            log_action(user_id, action, description)
-
-            return jsonify({
-                'message': '批量下单完成',
-                'successful_orders': successful_orders,
-                'failed_orders': failed_orders
-            }), 200
-
-    except Exception as e:
-        # 捕获全局异常并返回
-        if conn:
-            conn.rollback()
-
-        # 记录日志：系统错误
-        action = "批量下单失败"
-        description = f"用户 {user_id} 尝试批量下单时发生系统错误：{str(e)}"
-        log_action(user_id, action, description)
-
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 更新购物车中的商品数量
-@cart_bp.route('/cart/<int:product_id>', methods=['PATCH'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def update_cart(product_id):
-    """更新购物车中商品的数量"""
-    conn = None
-    try:
-        # 获取当前用户信息
-        current_user = json.loads(get_jwt_identity())
-        user_id = current_user['user_id']
-
-        # 获取请求数据
-        data = request.get_json()
-        new_quantity = data.get('quantity')
-
-        # 校验数量
-        if not isinstance(new_quantity, int) or new_quantity <= 0:
-            action = "更新购物车失败"
-            description = f"用户 {user_id} 尝试更新购物车商品 {product_id} 的数量为无效值 {new_quantity}"
-            log_action(user_id, action, description)
-            return jsonify({'error': '数量必须是正整数'}), 400
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 检查购物车中是否有该商品
-            cursor.execute(
-                "SELECT * FROM cart WHERE product_id = %s AND user_id = %s",
-                (product_id, user_id)
-            )
-            cart_item = cursor.fetchone()
-            if not cart_item:
-                action = "更新购物车失败"
-                description = f"用户 {user_id} 尝试更新购物车，但商品 {product_id} 不在购物车中"
-                log_action(user_id, action, description)
-                return jsonify({'error': '购物车中没有此商品'}), 404
-
-            # 检查商品库存是否足够
-            cursor.execute(
-                "SELECT stock FROM products WHERE product_id = %s",
-                (product_id,)
-            )
-            product = cursor.fetchone()
-            if not product or new_quantity > product['stock']:
-                action = "更新购物车失败"
-                description = f"用户 {user_id} 尝试更新购物车商品 {product_id}，但库存不足。请求数量：{new_quantity}，库存：{product['stock'] if product else '商品不存在'}"
-                log_action(user_id, action, description)
-                return jsonify({'error': '库存不足'}), 400
-
-            # 更新购物车中的数量
-            cursor.execute(
-                "UPDATE cart SET quantity = %s WHERE product_id = %s AND user_id = %s",
-                (new_quantity, product_id, user_id)
-            )
-            conn.commit()
-
-            action = "更新购物车成功"
-            description = f"用户 {user_id} 成功更新购物车商品 {product_id} 的数量为 {new_quantity}"
-            log_action(user_id, action, description)
-
-        return jsonify({'message': '购物车已更新'}), 200
-    except Exception as e:
-        action = "更新购物车失败"
-        description = f"用户 {user_id} 更新购物车商品 {product_id} 时发生错误：{str(e)}"
-        log_action(user_id, action, description)
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from db import get_connection
+from routes.permissions import role_required, current_user
+from routes.admin import log_action
+from catalog_cache import bump_catalog_version
+from leaderboard import sales_leaderboard
+from recommender import item_recommender
+from counters import platform_counters, order_deltas, merge, is_low_stock
+from cart_store import cart_store
+from queries import execute, placeholders, repeat, query_budget
+
+cart_bp = Blueprint('cart', __name__)
+
+
+# 加入购物车
+@cart_bp.route('/cart', methods=['POST'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+@query_budget(2)  # 商品库存 + 内存中没有该用户购物车时加载一次
+def add_to_cart():
+    """将商品加入购物车
+
+    只读取一次商品库存，购物车的修改写入内存购物车，由 cart_store 在后台写回 cart 表。
+    """
+    conn = None
+    try:
+        data = request.get_json()
+        product_id = int(data['product_id'])
+        quantity = data['quantity']
+
+        # 获取当前用户信息
+        user_id = current_user().user_id
+
+        # 校验数量
+        if not isinstance(quantity, int) or quantity <= 0:
+            action = "加入购物车失败"
+            description = f"用户 {user_id} 尝试将商品 {product_id} 以无效数量 {quantity} 加入购物车"
+            log_action(user_id, action, description)
+            return jsonify({'error': '数量必须是正整数'}), 400
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 检查商品是否存在
+            execute(cursor, 'products.stock', (product_id,))
+            product = cursor.fetchone()
+            if not product:
+                # 记录日志：商品不存在
+                action = "加入购物车失败"
+                description = f"用户 {user_id} 尝试将不存在的商品 {product_id} 加入购物车"
+                log_action(user_id, action, description)
+
+                return jsonify({'error': '商品不存在'}), 404
+
+            # 检查库存是否足够
+            if quantity > product['stock']:
+                # 记录日志：库存不足
+                action = "加入购物车失败"
+                description = f"用户 {user_id} 尝试将商品 {product_id} 加入购物车，但库存不足"
+                log_action(user_id, action, description)
+
+                return jsonify({'error': '库存不足'}), 400
+
+        # 已存在则累加数量，否则新增
+        new_quantity = cart_store.add(user_id, product_id, quantity)
+        if new_quantity != quantity:
+            action = "更新购物车"
+            description = f"用户 {user_id} 更新购物车中商品 {product_id} 的数量为 {new_quantity}"
+        else:
+            action = "加入购物车"
+            description = f"用户 {user_id} 将商品 {product_id} 数量 {quantity} 加入购物车"
+
+        # 记录日志：成功加入购物车或更新购物车
+        log_action(user_id, action, description)
+        return jsonify({'message': '商品已加入购物车'}), 201
+    except Exception as e:
+        # 记录日志：系统错误
+        action = "加入购物车失败"
+        description = f"用户 {user_id} 尝试将商品 {product_id} 加入购物车时发生系统错误：{str(e)}"
+        log_action(user_id, action, description)
+
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 从购物车删除商品
+@cart_bp.route('/cart/<int:product_id>', methods=['DELETE'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+@query_budget(1)
+def remove_from_cart(product_id):
+    """将商品从购物车中移除（只修改内存购物车）"""
+    try:
+        # 获取当前用户信息
+        user_id = current_user().user_id
+
+        # 从购物车中删除商品
+        if not cart_store.remove(user_id, product_id):
+            # 记录日志：尝试移除不存在的商品
+            action = "移除购物车失败"
+            description = f"用户 {user_id} 尝试移除购物车中不存在的商品 {product_id}"
+            log_action(user_id, action, description)
+
+            return jsonify({'error': '购物车中没有该商品'}), 404
+
+        # 记录日志：成功移除商品
+        action = "移除购物车"
+        description = f"用户 {user_id} 将商品 {product_id} 从购物车中移除"
+        log_action(user_id, action, description)
+
+        return jsonify({'message': '商品已从购物车中移除'}), 200
+    except Exception as e:
+        # 记录日志：系统错误
+        action = "移除购物车失败"
+        description = f"用户 {user_id} 尝试移除商品 {product_id} 时发生系统错误：{str(e)}"
+        log_action(user_id, action, description)
+
+        return jsonify({'error': str(e)}), 500
+
+# 查看购物车内容
+@cart_bp.route('/cart', methods=['GET'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+@query_budget(2)
+def view_cart():
+    """查看购物车内容：数量取自内存购物车，名称和价格按主键批量查询"""
+    conn = None
+    try:
+        # 获取当前用户信息
+        user_id = current_user().user_id
+
+        items = cart_store.items(user_id)
+        if not items:
+            return jsonify([]), 200
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            product_ids = [product_id for product_id, _ in items]
+            execute(cursor, 'products.cart_view', product_ids, ids=placeholders(len(product_ids)))
+            products = {row['product_id']: row for row in cursor.fetchall()}
+
+        cart_items = []
+        for product_id, quantity in items:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            cart_items.append({
+                'product_id': product_id,
+                'product_name': product['name'],
+                'quantity': quantity,
+                'price': product['price'],
+                'total_price': quantity * product['price']
+            })
+
+        # 已被删除的商品不再保留在购物车中
+        missing = [product_id for product_id, _ in items if product_id not in products]
+        if missing:
+            cart_store.discard_products(user_id, missing)
+
+        return jsonify(cart_items), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 批量从购物车下单
+@cart_bp.route('/cart/checkout', methods=['POST'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+@query_budget(7)  # 与购物车商品数无关
+def checkout_cart():
+    """批量下单
+
+    无论购物车有多少商品，都只执行固定数量的语句：
+    按 product_id 顺序锁定商品行 -> 一条多行 INSERT 写入订单 ->
+    一条带条件的 UPDATE 扣减库存 -> 一条 DELETE 与一条多行 INSERT 把剩余购物车写回 cart 表。
+    购物车内容取自内存购物车，结算期间独占该用户的购物车落库；
+    商品行按主键顺序加锁，并发结算不会因加锁顺序不同而死锁，也不会超卖。
+    """
+    conn = None
+    cart = None
+    try:
+        # 获取当前用户信息
+        user_id = current_user().user_id
+
+        # 取出购物车内容，结算结束前后台写回不会覆盖该用户的 cart 行
+        cart, cart_quantities, version = cart_store.checkout(user_id)
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            if not cart_quantities:
+                # 记录日志：购物车为空
+                action = "批量下单失败"
+                description = f"用户 {user_id} 尝试下单时购物车为空"
+                log_action(user_id, action, description)
+
+                return jsonify({'error': '购物车为空，无法下单'}), 400
+
+            # 按 product_id 顺序锁定商品行
+            product_ids = sorted(cart_quantities)
+            execute(cursor, 'products.lock_many', product_ids, ids=placeholders(len(product_ids)))
+            products = {row['product_id']: row for row in cursor.fetchall()}
+
+            successful_orders = []
+            failed_orders = []
+            deltas = {}
+
+            for product_id in product_ids:
+                quantity = cart_quantities[product_id]
+                product = products.get(product_id)
+                if product is None or quantity > product['stock']:
+                    # 如果商品不存在或库存不足，记录失败原因
+                    reason = '商品不存在' if product is None else '库存不足'
+                    failed_orders.append({
+                        'product_id': product_id,
+                        'reason': reason
+                    })
+                    # 记录日志：库存不足
+                    action = "批量下单失败"
+                    description = f"用户 {user_id} 下单商品 {product_id} 时{reason}"
+                    log_action(user_id, action, description)
+                    continue
+
+                stock = product['stock']
+                total_price = quantity * product['price']
+                deltas = merge(deltas, order_deltas('已支付', total_price), {
+                    'low_stock_products': int(is_low_stock(stock - quantity)) - int(is_low_stock(stock))
+                })
+                successful_orders.append({
+                    'product_id': product_id,
+                    'quantity': quantity,
+                    'total_price': total_price
+                })
+
+            missing = [order['product_id'] for order in failed_orders if order['reason'] == '商品不存在']
+
+            if not successful_orders:
+                conn.rollback()  # 如果所有订单失败，释放锁
+            else:
+                ordered_ids = [order['product_id'] for order in successful_orders]
+                ordered_placeholders = placeholders(len(ordered_ids))
+
+                # 一条多行 INSERT 创建全部订单
+                execute(
+                    cursor, 'orders.insert_many',
+                    [value
+                     for order in successful_orders
+                     for value in (user_id, order['product_id'], order['quantity'], order['total_price'])],
+                    rows=repeat("(%s, %s, %s, %s, '已支付')", len(successful_orders))
+                )
+                order_id = cursor.lastrowid  # 本事务写入的任一订单 ID，排行榜重建时据此去重
+
+                # 一条带条件的 UPDATE 扣减全部库存
+                case_sql = 'CASE product_id ' + repeat('WHEN %s THEN %s', len(successful_orders), ' ') + ' END'
+                case_params = [value for order in successful_orders for value in (order['product_id'], order['quantity'])]
+                execute(
+                    cursor, 'products.reserve_stock_many',
+                    case_params + ordered_ids + case_params,
+                    case=case_sql, ids=ordered_placeholders
+                )
+                if cursor.rowcount != len(successful_orders):
+                    # 商品行已加锁，正常情况下不会发生；防御性地整体回滚
+                    raise RuntimeError('库存扣减失败，请重试')
+
+                # 在同一事务中把剩余的购物车写回 cart 表（已下单和已删除的商品不再保留）
+                removed = {product_id: cart_quantities[product_id] for product_id in ordered_ids + missing}
+                remaining = {product_id: quantity for product_id, quantity in cart_quantities.items()
+                             if product_id not in removed}
+                cart_store.persist(cursor, [user_id], {user_id: remaining})
+
+                platform_counters.apply(cursor, deltas)
+                conn.commit()
+                cart_store.commit_checkout(user_id, cart, version, removed)
+                platform_counters.publish(deltas)
+                bump_catalog_version()
+
+                for order in successful_orders:
+                    sales_leaderboard.record(order['product_id'], order['quantity'], order_id=order_id)
+                    item_recommender.record_purchase(user_id, order['product_id'])
+
+                    # 记录日志：成功下单
+                    action = "批量下单成功"
+                    description = (
+                        f"用户 {user_id} 成功下单商品 {order['product_id']}，"
+                        f"数量 {order['quantity']}，总价 {order['total_price']}"
+                    )
+                    log_action(user_id, action, description)
+
+            if missing and not successful_orders:
+                cart_store.discard_products(user_id, missing)
+
+            # 记录日志：批量下单完成
+            action = "批量下单完成"
+            description = (
+                f"用户 {user_id} 批量下单完成。成功订单：{len(successful_orders)} 个，失败订单：{len(failed_orders)} 个"
+            )
+            log_action(user_id, action, description)
+
+            return jsonify({
+                'message': '批量下单完成',
+                'successful_orders': successful_orders,
+                'failed_orders': failed_orders
+            }), 200
+
+    except Exception as e:
+        # 捕获全局异常并返回
+        if conn:
+            conn.rollback()
+
+        # 记录日志：系统错误
+        action = "批量下单失败"
+        description = f"用户 {user_id} 尝试批量下单时发生系统错误：{str(e)}"
+        log_action(user_id, action, description)
+
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if cart:
+            cart_store.release_checkout(cart)
+        if conn:
+            conn.close()
+
+# 更新购物车中的商品数量
+@cart_bp.route('/cart/<int:product_id>', methods=['PATCH'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+@query_budget(2)
+def update_cart(product_id):
+    """更新购物车中商品的数量（只读取一次商品库存，修改写入内存购物车）"""
+    conn = None
+    try:
+        # 获取当前用户信息
+        user_id = current_user().user_id
+
+        # 获取请求数据
+        data = request.get_json()
+        new_quantity = data.get('quantity')
+
+        # 校验数量
+        if not isinstance(new_quantity, int) or new_quantity <= 0:
+            action = "更新购物车失败"
+            description = f"用户 {user_id} 尝试更新购物车商品 {product_id} 的数量为无效值 {new_quantity}"
+            log_action(user_id, action, description)
+            return jsonify({'error': '数量必须是正整数'}), 400
+
+        # 检查购物车中是否有该商品
+        if cart_store.quantity(user_id, product_id) is None:
+            action = "更新购物车失败"
+            description = f"用户 {user_id} 尝试更新购物车，但商品 {product_id} 不在购物车中"
+            log_action(user_id, action, description)
+            return jsonify({'error': '购物车中没有此商品'}), 404
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 检查商品库存是否足够
+            execute(cursor, 'products.stock', (product_id,))
+            product = cursor.fetchone()
+            if not product or new_quantity > product['stock']:
+                action = "更新购物车失败"
+                description = f"用户 {user_id} 尝试更新购物车商品 {product_id}，但库存不足。请求数量：{new_quantity}，库存：{product['stock'] if product else '商品不存在'}"
+                log_action(user_id, action, description)
+                return jsonify({'error': '库存不足'}), 400
+
+        # 更新购物车中的数量（并发移除时按不在购物车中处理）
+        if cart_store.set(user_id, product_id, new_quantity) is None:
+            return jsonify({'error': '购物车中没有此商品'}), 404
+
+        action = "更新购物车成功"
+        description = f"用户 {user_id} 成功更新购物车商品 {product_id} 的数量为 {new_quantity}"
+        log_action(user_id, action, description)
+
+        return jsonify({'message': '购物车已更新'}), 200
+    except Exception as e:
+        action = "更新购物车失败"
+        description = f"用户 {user_id} 更新购物车商品 {product_id} 时发生错误：{str(e)}"
+        log_action(user_id, action, description)
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
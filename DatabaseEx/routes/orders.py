@@ -1,242 +1,319 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import get_connection
-from routes.permissions import role_required
-import json  # 导入 JSON 模块
-from routes.admin import log_action  # 导入日志记录函数
-
-orders_bp = Blueprint('orders', __name__)
-
-# 买家创建订单
-@orders_bp.route('/orders', methods=['POST'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def create_order():
-    """创建订单"""
-    current_user = json.loads(get_jwt_identity())  # 将字符串转换回字典
-    buyer_id = current_user['user_id']  # 获取买家 ID
-
-    data = request.get_json()
-    product_id = int(data['product_id'])
-    quantity = int(data['quantity'])
-
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 获取产品价格和库存
-            cursor.execute("SELECT price, stock FROM products WHERE product_id = %s", (product_id,))
-            product = cursor.fetchone()
-
-            if not product:
-                # 记录日志：产品不存在
-                action = "创建订单失败"
-                description = f"用户 {buyer_id} 尝试创建订单，但产品 {product_id} 不存在"
-                log_action(buyer_id, action, description)
-                return jsonify({'error': '产品不存在'}), 404
-
-            price = float(product['price'])
-            stock = int(product['stock'])
-
-            if quantity > stock:
-                # 记录日志：库存不足
-                action = "创建订单失败"
-                description = f"用户 {buyer_id} 尝试创建订单，产品 {product_id} 库存不足。请求数量：{quantity}，库存：{stock}"
-                log_action(buyer_id, action, description)
-                return jsonify({'error': '库存不足'}), 400
-
-            total_price = price * quantity
-
-            # 创建订单
-            sql = """
-            INSERT INTO orders (buyer_id, product_id, quantity, total_price, status)
-            VALUES (%s, %s, %s, %s, '已支付')
-            """
-            cursor.execute(sql, (buyer_id, product_id, quantity, total_price))
-
-            # 更新库存
-            cursor.execute("UPDATE products SET stock = stock - %s WHERE product_id = %s", (quantity, product_id))
-
-            conn.commit()
-
-            # 记录日志：订单创建成功
-            action = "创建订单成功"
-            description = f"用户 {buyer_id} 成功创建订单。产品ID：{product_id}，数量：{quantity}，总价：{total_price}"
-            log_action(buyer_id, action, description)
-
-        return jsonify({'message': '订单创建成功'}), 201
-
-    except Exception as e:
-        # 记录日志：订单创建失败
-        action = "创建订单失败"
-        description = f"用户 {buyer_id} 创建订单时发生错误：{str(e)}"
-        log_action(buyer_id, action, description)
-        return jsonify({'error': str(e)}), 500
-
-    finally:
-        if conn:
-            conn.close()
-
-# 获取所有订单
-@orders_bp.route('/orders', methods=['GET'])
-@jwt_required()
-@role_required('admin')  # 仅管理员可访问
-def get_orders():
-    """获取所有订单，包括买家ID和卖家ID"""
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询所有订单，包含买家ID和卖家ID
-            sql = """
-                SELECT 
-                    o.order_id,
-                    o.product_id,
-                    o.buyer_id,
-                    p.seller_id,
-                    o.quantity,
-                    o.total_price,
-                    o.status
-                FROM orders o
-                JOIN products p ON o.product_id = p.product_id
-            """
-            cursor.execute(sql)
-            orders = cursor.fetchall()
-
-        # 返回包含所有订单的 JSON 数据
-        return jsonify(orders), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 买家获取自己的订单
-@orders_bp.route('/orders/my', methods=['GET'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def get_my_orders():
-    """获取买家的所有订单，包括商品名称和商家名"""
-    current_user = json.loads(get_jwt_identity())  # 获取当前用户信息
-    buyer_id = current_user['user_id']  # 获取买家 ID
-
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询当前买家的订单，包含商品名称和商家名称
-            sql = """
-            SELECT 
-                o.order_id, 
-                o.product_id, 
-                o.quantity, 
-                o.total_price, 
-                o.status, 
-                p.name AS product_name, 
-                u.username AS seller_name
-            FROM orders o
-            JOIN products p ON o.product_id = p.product_id
-            JOIN users u ON p.seller_id = u.user_id
-            WHERE o.buyer_id = %s
-            """
-            cursor.execute(sql, (buyer_id,))
-            orders = cursor.fetchall()
-        return jsonify(orders), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 卖家获取自己的销售订单
-@orders_bp.route('/orders/sales', methods=['GET'])
-@jwt_required()
-@role_required('seller')  # 仅卖家可访问
-def get_sales_orders():
-    """获取卖家的所有销售订单"""
-    current_user = json.loads(get_jwt_identity())  # 获取当前用户信息
-    seller_id = current_user['user_id']  # 获取卖家 ID
-
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询卖家相关的订单
-            sql = """
-            SELECT o.order_id, o.buyer_id, o.product_id, o.quantity, o.total_price, o.status, p.name AS product_name
-            FROM orders o
-            JOIN products p ON o.product_id = p.product_id
-            WHERE p.seller_id = %s
-            """
-            cursor.execute(sql, (seller_id,))
-            sales_orders = cursor.fetchall()
-        return jsonify(sales_orders), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 更新订单状态
-@orders_bp.route('/orders/<int:order_id>', methods=['PUT'])
-@jwt_required()
-@role_required('admin')  # 仅管理员可访问
-def update_order(order_id):
-    """更新订单状态"""
-    data = request.get_json()
-    status = data['status']
-
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = "UPDATE orders SET status=%s WHERE order_id=%s"
-            cursor.execute(sql, (status, order_id))
-            conn.commit()
-        return jsonify({'message': '订单状态更新成功'}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 删除订单
-@orders_bp.route('/orders/<int:order_id>', methods=['DELETE'])
-@jwt_required()
-@role_required('admin')  # 仅管理员可访问
-def delete_order(order_id):
-    """删除订单"""
-    current_user = json.loads(get_jwt_identity())  # 获取当前管理员身份信息
-    admin_id = current_user['user_id']  # 管理员 ID
-
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 检查订单是否存在
-            cursor.execute("SELECT * FROM orders WHERE order_id=%s", (order_id,))
-            order = cursor.fetchone()
-
-            if not order:
-                # 记录日志：订单不存在
-                action = "删除订单失败"
-                description = f"管理员 {admin_id} 尝试删除订单，但订单 {order_id} 不存在"
-                log_action(admin_id, action, description)
-                return jsonify({'error': '订单不存在'}), 404
-
-            # 删除订单
-            sql = "DELETE FROM orders WHERE order_id=%s"
-            cursor.execute(sql, (order_id,))
-            conn.commit()
-
-            # 记录日志：订单删除成功
-            action = "删除订单成功"
-            description = f"管理员 {admin_id} 成功删除订单 {order_id}"
-            log_action(admin_id, action, description)
-
-        return jsonify({'message': '订单删除成功'}), 200
-
-    except Exception as e:
-        # 记录日志：订单删除失败
-        action = "删除订单失败"
-        description = f"管理员 {admin_id} 删除订单 {order_id} 时发生错误：{str(e)}"
-        log_action(admin_id, action, description)
-        return jsonify({'error': str(e)}), 500
-
-    finally:
-        if conn:
-            conn.close()
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from db import get_connection
+from routes.permissions import role_required, current_user
+from routes.admin import log_action  # 导入日志记录函数
+from catalog_cache import bump_catalog_version
+from streaming import stream_format, stream_query, wants_gzip, EXPORT_FORMATS
+from leaderboard import sales_leaderboard
+from recommender import item_recommender
+from counters import platform_counters, order_deltas, merge
+from queries import execute, placeholders, where, query_budget
+from datetime import datetime
+
+orders_bp = Blueprint('orders', __name__)
+
+def _order_time(order):
+    """订单的下单时间戳，用于把取消/删除的销量从对应的时间桶中扣除"""
+    created_at = order.get('created_at')
+    return created_at.timestamp() if created_at else None
+
+ORDER_STATUSES = ('已支付', '已取消')
+
+def _parse_time(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} 时间格式错误，应为 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS')
+
+def _export_orders(user_id, seller_id=None):
+    """按 format、start、end、status 参数流式导出订单，seller_id 非空时只导出该卖家的订单
+
+    format=csv|ndjson（默认 csv）；start 含、end 不含，格式同日志查询；status 可用逗号分隔多个；
+    客户端接受 gzip（或 ?gzip=1）时边输出边压缩。
+    """
+    fmt = request.args.get('format', default='csv', type=str).lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': '导出格式只支持 csv 或 ndjson'}), 400
+
+    filters = []
+    params = []
+    parts = {}
+    try:
+        if seller_id is not None:
+            filters.append('seller_id')
+            params.append(seller_id)
+        status = request.args.get('status', type=str)
+        if status:
+            statuses = [item.strip() for item in status.split(',') if item.strip()]
+            unknown = [item for item in statuses if item not in ORDER_STATUSES]
+            if unknown or not statuses:
+                raise ValueError(f"未知的订单状态: {', '.join(unknown)}，可选: {', '.join(ORDER_STATUSES)}")
+            filters.append('status')
+            params.extend(statuses)
+            parts['statuses'] = placeholders(len(statuses))
+        start = request.args.get('start', type=str)
+        if start:
+            filters.append('start')
+            params.append(_parse_time(start, 'start'))
+        end = request.args.get('end', type=str)
+        if end:
+            filters.append('end')
+            params.append(_parse_time(end, 'end'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"{'sales' if seller_id is not None else 'orders'}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    response = stream_query('orders.export', params, fmt=fmt, compress=wants_gzip(), filename=filename,
+                            where=where('orders.export', *filters, **parts))
+
+    description = f"用户 {user_id} 导出订单（{fmt}），条件: {', '.join(filters) or '无'}"
+    log_action(user_id, "导出订单", description)
+    return response
+
+# 买家创建订单
+@orders_bp.route('/orders', methods=['POST'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+@query_budget(3)  # 预留库存 + 写订单 + 计数器；失败路径为预留库存 + 查库存
+def create_order():
+    """创建订单"""
+    buyer_id = current_user().user_id  # 获取买家 ID
+
+    data = request.get_json()
+    product_id = int(data['product_id'])
+    quantity = int(data['quantity'])
+    if quantity <= 0:
+        return jsonify({'error': '购买数量必须是正整数'}), 400
+
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 一条带条件的 UPDATE 预留库存：库存不足时不修改任何行，避免并发下单超卖
+            execute(cursor, 'products.reserve_stock', (quantity, product_id, quantity))
+            if cursor.rowcount == 0:
+                # 未扣减成功，区分商品不存在与库存不足（仅失败路径多一次查询）
+                conn.rollback()
+                execute(cursor, 'products.stock', (product_id,))
+                product = cursor.fetchone()
+
+                if not product:
+                    # 记录日志：产品不存在
+                    action = "创建订单失败"
+                    description = f"用户 {buyer_id} 尝试创建订单，但产品 {product_id} 不存在"
+                    log_action(buyer_id, action, description)
+                    return jsonify({'error': '产品不存在'}), 404
+
+                # 记录日志：库存不足
+                action = "创建订单失败"
+                description = f"用户 {buyer_id} 尝试创建订单，产品 {product_id} 库存不足。请求数量：{quantity}，库存：{product['stock']}"
+                log_action(buyer_id, action, description)
+                return jsonify({'error': '库存不足'}), 400
+
+            # 创建订单，总价在写入时按商品价格计算
+            execute(cursor, 'orders.insert', (buyer_id, quantity, quantity, product_id))
+            order_id = cursor.lastrowid
+
+            # 同一事务内更新平台计数器，金额与低库存变化同样由数据库计算
+            platform_counters.apply_order(cursor, order_id, product_id, quantity)
+
+            conn.commit()
+            platform_counters.expire()
+            bump_catalog_version()
+            sales_leaderboard.record(product_id, quantity, order_id=order_id)
+            item_recommender.record_purchase(buyer_id, product_id)
+
+            # 记录日志：订单创建成功
+            action = "创建订单成功"
+            description = f"用户 {buyer_id} 成功创建订单。订单ID：{order_id}，产品ID：{product_id}，数量：{quantity}"
+            log_action(buyer_id, action, description)
+
+        return jsonify({'message': '订单创建成功'}), 201
+
+    except Exception as e:
+        # 记录日志：订单创建失败
+        action = "创建订单失败"
+        description = f"用户 {buyer_id} 创建订单时发生错误：{str(e)}"
+        log_action(buyer_id, action, description)
+        return jsonify({'error': str(e)}), 500
+
+    finally:
+        if conn:
+            conn.close()
+
+# 获取所有订单
+@orders_bp.route('/orders', methods=['GET'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def get_orders():
+    """获取所有订单，包括买家ID和卖家ID（支持 ?stream=json|ndjson 流式返回）"""
+    conn = None
+    try:
+        # 查询所有订单，包含买家ID和卖家ID
+        fmt = stream_format()
+        if fmt:
+            return stream_query('orders.list', fmt=fmt)
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            execute(cursor, 'orders.list')
+            orders = cursor.fetchall()
+
+        # 返回包含所有订单的 JSON 数据
+        return jsonify(orders), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 管理员导出订单
+@orders_bp.route('/orders/export', methods=['GET'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def export_orders():
+    """流式导出全部订单（CSV 或 NDJSON），用于对账"""
+    try:
+        return _export_orders(current_user().user_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 买家获取自己的订单
+@orders_bp.route('/orders/my', methods=['GET'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+def get_my_orders():
+    """获取买家的所有订单，包括商品名称和商家名"""
+    buyer_id = current_user().user_id  # 获取买家 ID
+
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 查询当前买家的订单，包含商品名称和商家名称
+            execute(cursor, 'orders.by_buyer', (buyer_id,))
+            orders = cursor.fetchall()
+        return jsonify(orders), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 卖家获取自己的销售订单
+@orders_bp.route('/orders/sales', methods=['GET'])
+@jwt_required()
+@role_required('seller')  # 仅卖家可访问
+def get_sales_orders():
+    """获取卖家的所有销售订单"""
+    seller_id = current_user().user_id  # 获取卖家 ID
+
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 查询卖家相关的订单
+            execute(cursor, 'orders.by_seller', (seller_id,))
+            sales_orders = cursor.fetchall()
+        return jsonify(sales_orders), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 卖家导出销售订单
+@orders_bp.route('/orders/sales/export', methods=['GET'])
+@jwt_required()
+@role_required('seller')  # 仅卖家可访问
+def export_sales_orders():
+    """流式导出卖家的销售订单（CSV 或 NDJSON），用于对账"""
+    try:
+        seller_id = current_user().user_id
+        return _export_orders(seller_id, seller_id=seller_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 更新订单状态
+@orders_bp.route('/orders/<int:order_id>', methods=['PUT'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def update_order(order_id):
+    """更新订单状态"""
+    data = request.get_json()
+    status = data['status']
+
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            execute(cursor, 'orders.lock_summary', (order_id,))
+            order = cursor.fetchone()
+
+            execute(cursor, 'orders.set_status', (status, order_id))
+
+            deltas = {}
+            if order:
+                deltas = merge(order_deltas(order['status'], order['total_price'], -1),
+                               order_deltas(status, order['total_price']))
+                platform_counters.apply(cursor, deltas)
+            conn.commit()
+            platform_counters.publish(deltas)
+
+            # 支付状态变化时同步销量排行榜
+            if order and (order['status'] == '已支付') != (status == '已支付'):
+                delta = order['quantity'] if status == '已支付' else -order['quantity']
+                sales_leaderboard.record(order['product_id'], delta, _order_time(order))
+        return jsonify({'message': '订单状态更新成功'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 删除订单
+@orders_bp.route('/orders/<int:order_id>', methods=['DELETE'])
+@jwt_required()
+@role_required('admin')  # 仅管理员可访问
+def delete_order(order_id):
+    """删除订单"""
+    admin_id = current_user().user_id  # 管理员 ID
+
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 检查订单是否存在
+            execute(cursor, 'orders.lock', (order_id,))
+            order = cursor.fetchone()
+
+            if not order:
+                # 记录日志：订单不存在
+                action = "删除订单失败"
+                description = f"管理员 {admin_id} 尝试删除订单，但订单 {order_id} 不存在"
+                log_action(admin_id, action, description)
+                return jsonify({'error': '订单不存在'}), 404
+
+            # 删除订单
+            execute(cursor, 'orders.delete', (order_id,))
+            deltas = order_deltas(order['status'], order['total_price'], -1)
+            platform_counters.apply(cursor, deltas)
+            conn.commit()
+            platform_counters.publish(deltas)
+            if order['status'] == '已支付':
+                sales_leaderboard.record(order['product_id'], -order['quantity'], _order_time(order))
+
+            # 记录日志：订单删除成功
+            action = "删除订单成功"
+            description = f"管理员 {admin_id} 成功删除订单 {order_id}"
+            log_action(admin_id, action, description)
+
+        return jsonify({'message': '订单删除成功'}), 200
+
+    except Exception as e:
+        # 记录日志：订单删除失败
+        action = "删除订单失败"
+        description = f"管理员 {admin_id} 删除订单 {order_id} 时发生错误：{str(e)}"
+        log_action(admin_id, action, description)
+        return jsonify({'error': str(e)}), 500
+
+    finally:
+        if conn:
+            conn.close()
@@ -1,17 +1,57 @@
-import json
-from functools import wraps
-from flask_jwt_extended import get_jwt_identity
-from flask import jsonify
-
-def role_required(required_role):
-    """校验用户角色"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            # 反序列化 identity 字符串为字典
-            current_user = json.loads(get_jwt_identity())
-            if current_user.get('role') != required_role:
-                return jsonify({'error': '权限不足，无法访问此资源'}), 403
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+import json
+from functools import wraps
+from flask_jwt_extended import create_access_token, get_jwt
+from flask import g, jsonify
+
+
+class CurrentUser:
+    """当前请求的登录用户，每个请求只从 JWT 解析一次"""
+    __slots__ = ('user_id', 'role')
+
+    def __init__(self, user_id, role):
+        self.user_id = user_id
+        self.role = role
+
+    def __repr__(self):
+        return f'CurrentUser(user_id={self.user_id!r}, role={self.role!r})'
+
+
+def create_user_token(user_id, role):
+    """签发令牌：sub 为用户 ID，角色放在独立的 role 声明中"""
+    return create_access_token(identity=str(user_id), additional_claims={'role': role})
+
+
+def _parse_claims(claims):
+    role = claims.get('role')
+    if role is not None:
+        return CurrentUser(int(claims['sub']), role)
+    # 兼容升级前签发的令牌：identity 为 JSON 字符串
+    identity = json.loads(claims['sub'])
+    return CurrentUser(identity['user_id'], identity['role'])
+
+
+def current_user():
+    """返回当前请求的 CurrentUser，首次调用时解析并缓存在 flask.g 上
+
+    必须在 jwt_required 校验之后调用。
+    """
+    user = g.get('_current_user')
+    if user is None:
+        user = g._current_user = _parse_claims(get_jwt())
+    return user
+
+
+def role_required(required_roles):
+    """校验用户角色，required_roles 可以是单个角色或角色集合"""
+    if isinstance(required_roles, str):
+        required_roles = (required_roles,)
+    allowed = frozenset(required_roles)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_user().role not in allowed:
+                return jsonify({'error': '权限不足，无法访问此资源'}), 403
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
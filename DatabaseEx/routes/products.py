@@ -1,364 +1,474 @@
-import json
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import get_connection
-from routes.permissions import role_required
-from routes.admin import log_action
-
-products_bp = Blueprint('products', __name__)
-
-# 卖家添加产品
-@products_bp.route('/products', methods=['POST'])
-@jwt_required()
-@role_required('seller')
-def add_product():
-    """添加新产品"""
-    conn = None  # 初始化 conn 为 None
-    try:
-        data = request.get_json()
-        name = data['name']
-        price = data['price']
-        stock = data['stock']
-
-        # 解析当前用户身份信息
-        current_user = json.loads(get_jwt_identity())
-        seller_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 插入新产品
-            sql = "INSERT INTO products (name, price, stock, seller_id) VALUES (%s, %s, %s, %s)"
-            cursor.execute(sql, (name, price, stock, seller_id))
-            conn.commit()
-
-            # 获取新插入产品的 ID
-            product_id = cursor.lastrowid
-
-        # 记录日志
-        log_action(seller_id, "添加产品", f"添加了新产品: {name} (ID: {product_id}, 价格: {price}, 库存: {stock})")
-
-        return jsonify({'message': '产品添加成功'}), 201
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:  # 确保 conn 已初始化
-            conn.close()
-
-# 获取所有产品
-@products_bp.route('/products', methods=['GET'])
-@jwt_required()
-def get_products():
-    """获取所有产品，包括平均评分和评价数量"""
-    conn = None
-    try:
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = """
-                SELECT 
-                    p.product_id,
-                    p.name,
-                    p.price,
-                    p.stock,
-                    u.username AS seller_name,
-                    IFNULL(ar.average_stars, 0.00) AS average_rating,
-                    IFNULL(ar.review_count, 0) AS rating_count
-                FROM 
-                    products p
-                LEFT JOIN 
-                    average_ratings ar
-                ON 
-                    p.product_id = ar.product_id
-                LEFT JOIN
-                    users u
-                ON
-                    p.seller_id = u.user_id
-            """
-            cursor.execute(sql)
-            products = cursor.fetchall()
-        return jsonify(products), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 卖家更新产品信息
-@products_bp.route('/products/<int:product_id>', methods=['PUT'])
-@jwt_required()
-@role_required('seller')
-def update_product(product_id):
-    """更新产品信息"""
-    conn = None
-    try:
-        data = request.get_json()
-        name = data.get('name')
-        price = float(data.get('price'))  # 确保接受和存储小数
-        stock = int(data.get('stock'))
-
-        current_user = json.loads(get_jwt_identity())
-        seller_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = """
-                UPDATE products 
-                SET name=%s, price=%s, stock=%s 
-                WHERE product_id=%s AND seller_id=%s
-            """
-            cursor.execute(sql, (name, price, stock, product_id, seller_id))
-            if cursor.rowcount == 0:
-                return jsonify({'error': '无权更新此产品或产品不存在'}), 403
-            conn.commit()
-
-            # 添加日志记录
-            action = "更新产品"
-            description = f"卖家 {seller_id} 更新了产品 {product_id} 的信息：name={name}, price={price}, stock={stock}"
-            log_action(seller_id, action, description)
-
-        return jsonify({'message': '产品信息更新成功'}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 卖家删除产品
-@products_bp.route('/seller/products/<int:product_id>', methods=['DELETE'])
-@jwt_required()
-@role_required('seller')
-def delete_product(product_id):
-    """删除产品"""
-    conn = None
-    try:
-        current_user = json.loads(get_jwt_identity())
-        seller_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            sql = "DELETE FROM products WHERE product_id=%s AND seller_id=%s"
-            cursor.execute(sql, (product_id, seller_id))
-            if cursor.rowcount == 0:
-                return jsonify({'error': '无权删除此产品或产品不存在'}), 403
-            conn.commit()
-
-            # 添加日志记录
-            action = "删除产品"
-            description = f"卖家 {seller_id} 删除了产品 {product_id}"
-            log_action(seller_id, action, description)
-
-        return jsonify({'message': '产品删除成功'}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 管理员强制删除产品
-@products_bp.route('/admin/products/<int:product_id>', methods=['DELETE'])
-@jwt_required()
-@role_required('admin')  # 限制为管理员角色
-def admin_delete_product(product_id):
-    """管理员强制删除产品"""
-    conn = None
-    try:
-        current_user = json.loads(get_jwt_identity())
-        admin_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 检查产品是否存在
-            cursor.execute("SELECT * FROM products WHERE product_id=%s", (product_id,))
-            product = cursor.fetchone()
-            if not product:
-                return jsonify({'error': '产品不存在'}), 404
-
-            # 强制删除产品
-            cursor.execute("DELETE FROM products WHERE product_id=%s", (product_id,))
-            conn.commit()
-
-            # 添加日志记录
-            action = "强制删除产品"
-            description = f"管理员 {admin_id} 强制删除了产品 {product_id}"
-            log_action(admin_id, action, description)
-
-        return jsonify({'message': '产品已强制删除（管理员操作）'}), 200
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 搜索产品
-@products_bp.route('/products/search', methods=['GET'])
-@jwt_required()
-def search_products():
-    """根据条件搜索产品，返回平均评分、评分数量和商家名"""
-    conn = None
-    try:
-        # 获取查询参数
-        product_id = request.args.get('product_id', type=int)
-        seller_id = request.args.get('seller_id', type=int)
-        product_name = request.args.get('name', type=str)
-        seller_name = request.args.get('seller_name', type=str)
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 动态 SQL 查询构建
-            sql = """
-                SELECT 
-                    p.product_id, 
-                    p.name AS product_name, 
-                    p.price, 
-                    p.stock, 
-                    u.username AS seller_name, 
-                    IFNULL(ar.average_stars, 0.00) AS average_rating, 
-                    IFNULL(ar.review_count, 0) AS rating_count
-                FROM products p
-                JOIN users u ON p.seller_id = u.user_id
-                LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
-                WHERE 1=1
-            """
-            params = []
-
-            # 动态条件拼接
-            if product_id:
-                sql += " AND p.product_id = %s"
-                params.append(product_id)
-            if seller_id:
-                sql += " AND p.seller_id = %s"
-                params.append(seller_id)
-            if product_name:
-                sql += " AND p.name LIKE %s"
-                params.append(f"%{product_name}%")
-            if seller_name:
-                sql += " AND u.username LIKE %s"
-                params.append(f"%{seller_name}%")
-
-            # 按评分数从大到小，再按平均评分从大到小排序
-            sql += " ORDER BY rating_count DESC, average_rating DESC"
-
-            # 执行 SQL
-            cursor.execute(sql, params)
-            products = cursor.fetchall()
-
-        # 返回结果
-        return jsonify(products), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 查看卖家自己的商品
-@products_bp.route('/products/seller', methods=['GET'])
-@jwt_required()
-@role_required('seller')
-def get_seller_products():
-    """获取卖家自己的商品，包括评价数目和平均评分"""
-    conn = None
-    try:
-        # 获取当前登录卖家信息
-        current_user = json.loads(get_jwt_identity())
-        seller_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询商品信息并关联平均评分和评价数
-            sql = """
-                SELECT 
-                    p.product_id, 
-                    p.name, 
-                    p.price, 
-                    p.stock, 
-                    IFNULL(ar.average_stars, 0.00) AS average_rating, 
-                    IFNULL(ar.review_count, 0) AS rating_count
-                FROM products p
-                LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
-                WHERE p.seller_id = %s
-            """
-            cursor.execute(sql, (seller_id,))
-            products = cursor.fetchall()
-
-        return jsonify(products), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 获取单个商品信息
-@products_bp.route('/products/<int:product_id>', methods=['GET'])
-@jwt_required()
-@role_required('seller')
-def get_product(product_id):
-    """获取单个商品信息，包括评分数和平均评分"""
-    conn = None
-    try:
-        current_user = json.loads(get_jwt_identity())
-        seller_id = current_user['user_id']
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询商品信息并关联评分数和平均评分
-            sql = """
-                SELECT 
-                    p.product_id, 
-                    p.name, 
-                    p.price, 
-                    p.stock, 
-                    IFNULL(ar.average_stars, 0.00) AS average_rating, 
-                    IFNULL(ar.review_count, 0) AS rating_count
-                FROM products p
-                LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
-                WHERE p.product_id = %s AND p.seller_id = %s
-            """
-            cursor.execute(sql, (product_id, seller_id))
-            product = cursor.fetchone()
-            if not product:
-                return jsonify({'error': '商品不存在或无权限访问'}), 404
-        return jsonify(product), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
-
-# 推荐产品
-@products_bp.route('/products/recommend', methods=['GET'])
-@jwt_required()
-@role_required('buyer')  # 仅买家可访问
-def recommend_products():
-    """推荐产品（非个性化）"""
-    conn = None
-    try:
-        # 获取推荐数量参数，默认为 10
-        limit = request.args.get('limit', default=10, type=int)
-
-        conn = get_connection()
-        with conn.cursor() as cursor:
-            # 查询评价数和平均评分，并按综合排序
-            sql = """
-                SELECT 
-                    p.product_id,
-                    p.name AS product_name,
-                    p.price,
-                    p.stock,
-                    u.username AS seller_name,
-                    IFNULL(ar.average_stars, 0.00) AS average_rating,
-                    IFNULL(ar.review_count, 0) AS rating_count
-                FROM products p
-                JOIN users u ON p.seller_id = u.user_id
-                LEFT JOIN average_ratings ar ON p.product_id = ar.product_id
-                ORDER BY ar.review_count DESC, ar.average_stars DESC
-                LIMIT %s
-            """
-            cursor.execute(sql, (limit,))
-            products = cursor.fetchall()
-
-        return jsonify(products), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from db import get_connection
+from routes.permissions import role_required, current_user
+from routes.admin import log_action
+from catalog_cache import bump_catalog_version, cached_catalog_response
+from streaming import stream_format, stream_query
+from search_index import product_index, index_product, like_pattern, matches, normalize, MAX_CANDIDATES
+from leaderboard import sales_leaderboard
+from recommender import item_recommender
+from counters import platform_counters, is_low_stock
+from product_import import ProductImporter, ImportFormatError, read_csv, read_ndjson
+from queries import execute, placeholders, where
+
+products_bp = Blueprint('products', __name__)
+
+def product_delete_deltas(cursor, product_id, seller_id=None):
+    """锁定待删除商品并计算删除它（及级联删除的订单）对平台计数器的影响，商品不存在时返回 None"""
+    if seller_id is None:
+        execute(cursor, 'products.lock_stock', (product_id,))
+    else:
+        execute(cursor, 'products.lock_own_stock', (product_id, seller_id))
+    product = cursor.fetchone()
+    if not product:
+        return None
+
+    execute(cursor, 'products.order_totals', (product_id,))
+    orders = cursor.fetchone()
+    deltas = {name: -(value or 0) for name, value in orders.items()}
+    deltas['total_products'] = -1
+    deltas['low_stock_products'] = -int(is_low_stock(product['stock']))
+    return deltas
+
+# 卖家添加产品
+@products_bp.route('/products', methods=['POST'])
+@jwt_required()
+@role_required('seller')
+def add_product():
+    """添加新产品"""
+    conn = None  # 初始化 conn 为 None
+    try:
+        data = request.get_json()
+        name = data['name']
+        price = data['price']
+        stock = data['stock']
+
+        # 解析当前用户身份信息
+        seller_id = current_user().user_id
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 插入新产品
+            execute(cursor, 'products.insert', (name, price, stock, seller_id))
+            # 获取新插入产品的 ID（必须在同一游标执行计数器更新之前读取）
+            product_id = cursor.lastrowid
+
+            deltas = {'total_products': 1, 'low_stock_products': int(is_low_stock(int(stock)))}
+            platform_counters.apply(cursor, deltas)
+            conn.commit()
+            platform_counters.publish(deltas)
+            bump_catalog_version()
+
+            # 更新搜索索引
+            index_product(cursor, product_id, name, seller_id)
+
+        # 记录日志
+        log_action(seller_id, "添加产品", f"添加了新产品: {name} (ID: {product_id}, 价格: {price}, 库存: {stock})")
+
+        return jsonify({'message': '产品添加成功'}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:  # 确保 conn 已初始化
+            conn.close()
+
+# 卖家批量导入产品
+@products_bp.route('/products/bulk', methods=['POST'])
+@jwt_required()
+@role_required('seller')
+def bulk_import_products():
+    """批量新增或更新产品
+
+    请求体为 CSV（Content-Type: text/csv，表头 name,price,stock[,product_id]）或
+    NDJSON（Content-Type: application/x-ndjson），也可用 ?format=csv|ndjson 指定。
+    请求体边读边校验，每 PRODUCT_IMPORT_CONFIG['chunk_size'] 行一个事务写入；
+    带 product_id 的行更新该商品，否则按商品名匹配卖家已有商品，匹配不到则新增。
+    出错的行记入响应中的 errors，不影响其他行。
+    """
+    try:
+        seller_id = current_user().user_id
+
+        fmt = request.args.get('format', type=str)
+        if not fmt:
+            mimetype = request.mimetype
+            fmt = 'csv' if mimetype in ('text/csv', 'application/csv') else \
+                'ndjson' if mimetype in ('application/x-ndjson', 'application/jsonl') else None
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': '请使用 CSV（text/csv）或 NDJSON（application/x-ndjson）格式'}), 415
+
+        rows = read_csv(request.stream) if fmt == 'csv' else read_ndjson(request.stream)
+        importer = ProductImporter(seller_id, log_action)
+        try:
+            importer.run(rows)
+        except ImportFormatError as e:
+            return jsonify({'error': str(e), **importer.result()}), 400
+        finally:
+            if importer.inserted or importer.updated:
+                bump_catalog_version()
+
+        return jsonify({'message': '批量导入完成', **importer.result()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 获取所有产品
+@products_bp.route('/products', methods=['GET'])
+@jwt_required()
+@cached_catalog_response
+def get_products():
+    """获取所有产品，包括平均评分和评价数量（支持 ?stream=json|ndjson 流式返回）"""
+    conn = None
+    try:
+        fmt = stream_format()
+        if fmt:
+            return stream_query('products.list', fmt=fmt)
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            execute(cursor, 'products.list')
+            products = cursor.fetchall()
+        return jsonify(products), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 卖家更新产品信息
+@products_bp.route('/products/<int:product_id>', methods=['PUT'])
+@jwt_required()
+@role_required('seller')
+def update_product(product_id):
+    """更新产品信息"""
+    conn = None
+    try:
+        data = request.get_json()
+        name = data.get('name')
+        price = float(data.get('price'))  # 确保接受和存储小数
+        stock = int(data.get('stock'))
+
+        seller_id = current_user().user_id
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 锁定原商品行，取得修改前的库存用于计数器增量
+            execute(cursor, 'products.lock_own_stock', (product_id, seller_id))
+            product = cursor.fetchone()
+            if not product:
+                return jsonify({'error': '无权更新此产品或产品不存在'}), 403
+
+            execute(cursor, 'products.update_own', (name, price, stock, product_id, seller_id))
+            deltas = {'low_stock_products': int(is_low_stock(stock)) - int(is_low_stock(product['stock']))}
+            platform_counters.apply(cursor, deltas)
+            conn.commit()
+            platform_counters.publish(deltas)
+            bump_catalog_version()
+            index_product(cursor, product_id, name, seller_id)
+
+            # 添加日志记录
+            action = "更新产品"
+            description = f"卖家 {seller_id} 更新了产品 {product_id} 的信息：name={name}, price={price}, stock={stock}"
+            log_action(seller_id, action, description)
+
+        return jsonify({'message': '产品信息更新成功'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 卖家删除产品
+@products_bp.route('/seller/products/<int:product_id>', methods=['DELETE'])
+@jwt_required()
+@role_required('seller')
+def delete_product(product_id):
+    """删除产品"""
+    conn = None
+    try:
+        seller_id = current_user().user_id
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 删除前统计计数器增量（删除商品会级联删除其订单）
+            deltas = product_delete_deltas(cursor, product_id, seller_id)
+            if deltas is None:
+                return jsonify({'error': '无权删除此产品或产品不存在'}), 403
+
+            execute(cursor, 'products.delete_own', (product_id, seller_id))
+            platform_counters.apply(cursor, deltas)
+            conn.commit()
+            platform_counters.publish(deltas)
+            bump_catalog_version()
+            product_index.remove_product(product_id)
+            sales_leaderboard.remove_product(product_id)
+
+            # 添加日志记录
+            action = "删除产品"
+            description = f"卖家 {seller_id} 删除了产品 {product_id}"
+            log_action(seller_id, action, description)
+
+        return jsonify({'message': '产品删除成功'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 管理员强制删除产品
+@products_bp.route('/admin/products/<int:product_id>', methods=['DELETE'])
+@jwt_required()
+@role_required('admin')  # 限制为管理员角色
+def admin_delete_product(product_id):
+    """管理员强制删除产品"""
+    conn = None
+    try:
+        admin_id = current_user().user_id
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 检查产品是否存在，同时统计计数器增量（删除商品会级联删除其订单）
+            deltas = product_delete_deltas(cursor, product_id)
+            if deltas is None:
+                return jsonify({'error': '产品不存在'}), 404
+
+            # 强制删除产品
+            execute(cursor, 'products.delete', (product_id,))
+            platform_counters.apply(cursor, deltas)
+            conn.commit()
+            platform_counters.publish(deltas)
+            bump_catalog_version()
+            product_index.remove_product(product_id)
+            sales_leaderboard.remove_product(product_id)
+
+            # 添加日志记录
+            action = "强制删除产品"
+            description = f"管理员 {admin_id} 强制删除了产品 {product_id}"
+            log_action(admin_id, action, description)
+
+        return jsonify({'message': '产品已强制删除（管理员操作）'}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 搜索产品
+@products_bp.route('/products/search', methods=['GET'])
+@jwt_required()
+@cached_catalog_response
+def search_products():
+    """根据条件搜索产品，返回平均评分、评分数量和商家名
+
+    名称条件优先由内存 n 元组索引求出候选商品，数据库只按主键取这些商品；
+    索引未就绪或候选过多时退回 LIKE 模糊查询，匹配规则与索引相同（规范化空白和大小写，% 和 _ 按字面匹配）。
+    默认按排序分数（贝叶斯平均）从高到低，传 sort=relevance 按相关度排序；传 limit 只返回前 N 个。
+    """
+    conn = None
+    try:
+        # 获取查询参数
+        product_id = request.args.get('product_id', type=int)
+        seller_id = request.args.get('seller_id', type=int)
+        product_name = request.args.get('name', type=str)
+        seller_name = request.args.get('seller_name', type=str)
+        sort = request.args.get('sort', type=str)
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit <= 0:
+            return jsonify({'error': 'limit 必须为正整数'}), 400
+        if product_name is not None:
+            product_name = normalize(product_name)
+            if not product_name:
+                return jsonify({'error': '商品名称搜索词不能为空'}), 400
+        if seller_name is not None:
+            seller_name = normalize(seller_name)
+            if not seller_name:
+                return jsonify({'error': '卖家名称搜索词不能为空'}), 400
+        relevance = sort == 'relevance' and (product_name or seller_name) and product_index.ready
+
+        # 先用内存索引求候选商品
+        candidates = None
+        if (product_name or seller_name) and product_index.ready:
+            candidates = product_index.search(product_name, seller_name)
+            if not candidates:
+                return jsonify([]), 200
+            if len(candidates) > MAX_CANDIDATES:
+                candidates = None
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 从注册的条件片段中选出本次用到的过滤条件
+            filters = []
+            params = []
+            if product_id:
+                filters.append('product_id')
+                params.append(product_id)
+            if seller_id:
+                filters.append('seller_id')
+                params.append(seller_id)
+            if candidates is not None:
+                filters.append('candidates')
+                params.extend(sorted(candidates))
+            else:
+                if product_name:
+                    filters.append('name_like')
+                    params.append(like_pattern(product_name))
+                if seller_name:
+                    filters.append('seller_name_like')
+                    params.append(like_pattern(seller_name))
+            # 多个词的模式会匹配词间隔着多个空白的名称，取出后按规范化文本再过滤
+            refine = candidates is None and any(term and ' ' in term for term in (product_name, seller_name))
+
+            # 结果按排序分数从高到低；按相关度排序或需要再过滤时要先取全部结果，limit 在最后截取
+            condition = where(
+                'products.search', *filters,
+                ids=placeholders(len(candidates)) if candidates is not None else ''
+            )
+            limit_clause = ''
+            if limit and not relevance and not refine:
+                limit_clause = 'LIMIT %s'
+                params.append(limit)
+            execute(cursor, 'products.search', params, where=condition, limit=limit_clause)
+            products = cursor.fetchall()
+
+        if refine:
+            products = [
+                row for row in products
+                if (not product_name or matches(row['product_name'], product_name))
+                and (not seller_name or matches(row['seller_name'], seller_name))
+            ]
+            if not relevance:
+                products = products[:limit]
+
+        # 按相关度排序（稳定排序，相关度相同时保持评分顺序）
+        if relevance:
+            products = sorted(
+                products,
+                key=lambda row: product_index.relevance(row['product_id'], product_name, seller_name),
+                reverse=True
+            )[:limit]
+
+        # 返回结果
+        return jsonify(products), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 查看卖家自己的商品
+@products_bp.route('/products/seller', methods=['GET'])
+@jwt_required()
+@role_required('seller')
+def get_seller_products():
+    """获取卖家自己的商品，包括评价数目和平均评分"""
+    conn = None
+    try:
+        # 获取当前登录卖家信息
+        seller_id = current_user().user_id
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 查询商品信息并关联平均评分和评价数
+            execute(cursor, 'products.by_seller', (seller_id,))
+            products = cursor.fetchall()
+
+        return jsonify(products), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 获取单个商品信息
+@products_bp.route('/products/<int:product_id>', methods=['GET'])
+@jwt_required()
+@role_required('seller')
+def get_product(product_id):
+    """获取单个商品信息，包括评分数和平均评分"""
+    conn = None
+    try:
+        seller_id = current_user().user_id
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            # 查询商品信息并关联评分数和平均评分
+            execute(cursor, 'products.get_own', (product_id, seller_id))
+            product = cursor.fetchone()
+            if not product:
+                return jsonify({'error': '商品不存在或无权限访问'}), 404
+        return jsonify(product), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 推荐产品
+@products_bp.route('/products/recommend', methods=['GET'])
+@jwt_required()
+@role_required('buyer')  # 仅买家可访问
+def recommend_products():
+    """推荐产品
+
+    先按买家的购买和评价历史从内存推荐索引取相似商品，只按主键查询商品详情；
+    冷启动买家、索引未就绪或个性化结果不足 limit 个时，用按排序分数（贝叶斯平均）的全局排行补足。
+    结果因人而异，不走目录缓存。
+    """
+    conn = None
+    try:
+        # 获取推荐数量参数，默认为 10
+        limit = request.args.get('limit', default=10, type=int)
+        user_id = current_user().user_id
+
+        ranking = item_recommender.recommend(user_id, limit) if limit > 0 else []
+        products = []
+
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            if ranking:
+                ids = [product_id for product_id, _ in ranking]
+                execute(cursor, 'products.recommend_by_ids', ids, ids=placeholders(len(ids)))
+                found = {row['product_id']: row for row in cursor.fetchall()}
+                # 已删除的商品直接跳过
+                products = [found[product_id] for product_id in ids if product_id in found]
+
+            if len(products) < limit:
+                # 全局排行中排除已推荐和已买过的商品
+                exclude = {product['product_id'] for product in products} | item_recommender.history(user_id)
+                execute(cursor, 'products.recommend', (limit - len(products) + len(exclude),))
+                for product in cursor.fetchall():
+                    if len(products) >= limit:
+                        break
+                    if product['product_id'] not in exclude:
+                        products.append(product)
+
+        return jsonify(products), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# 管理员重建商品搜索索引
+@products_bp.route('/admin/search_index/rebuild', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def rebuild_search_index():
+    """从数据库全量重建商品搜索索引"""
+    try:
+        count = product_index.rebuild()
+        return jsonify({'message': '搜索索引已重建', 'products': count, 'stats': product_index.stats()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 管理员重建推荐索引
+@products_bp.route('/admin/recommender/rebuild', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def rebuild_recommender():
+    """从订单和评价重建商品相似度索引（默认每 rebuild_interval 秒自动重建一次）"""
+    try:
+        count = item_recommender.rebuild()
+        return jsonify({'message': '推荐索引已重建', 'users': count, 'stats': item_recommender.stats()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
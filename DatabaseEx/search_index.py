@@ -0,0 +1,245 @@
+import threading
+from collections import defaultdict
+
+from db import get_connection
+from queries import execute
+
+MAX_GRAM = 3              # 建立 1~3 元组索引，单字查询走一元组
+MAX_CANDIDATES = 5000     # 候选商品过多时 IN 列表过长，退回 SQL 模糊查询
+
+
+def normalize(text):
+    """统一大小写并把连续空白合并为一个空格，和 MySQL 的不区分大小写比较保持一致
+
+    空格本身保留在 n 元组中，"Gad get" 不会匹配 "Gadget"，与 LIKE 回退的结果一致。
+    """
+    return ' '.join((text or '').casefold().split())
+
+
+def like_pattern(term):
+    """LIKE 回退使用的模式：转义通配符，词与词之间用 % 连接（配合 ESCAPE '\\'）
+
+    库中名称未做空白合并，多个词之间可能隔着多个空白，模式因此会多匹配，
+    调用方需再用 matches 按规范化文本过滤一次。
+    """
+    words = normalize(term).split(' ')
+    escaped = [word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') for word in words]
+    return '%' + '%'.join(escaped) + '%'
+
+
+def matches(text, term):
+    """规范化后的 text 是否包含 term，与索引的匹配规则相同"""
+    return normalize(term) in normalize(text)
+
+
+def ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NgramIndex:
+    """字符 n 元组倒排索引，不依赖分词，适用于中文名称"""
+
+    def __init__(self):
+        self._postings = defaultdict(set)  # n 元组 -> 文档 ID 集合
+        self._docs = {}                    # 文档 ID -> 规范化后的文本
+
+    def add(self, doc_id, text):
+        self.remove(doc_id)
+        text = normalize(text)
+        self._docs[doc_id] = text
+        for n in range(1, MAX_GRAM + 1):
+            for gram in ngrams(text, n):
+                self._postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        text = self._docs.pop(doc_id, None)
+        if text is None:
+            return
+        for n in range(1, MAX_GRAM + 1):
+            for gram in ngrams(text, n):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._postings[gram]
+
+    def text(self, doc_id):
+        return self._docs.get(doc_id)
+
+    def search(self, term):
+        """返回文本包含 term 的文档 ID 集合（等价于 LIKE '%term%'）"""
+        term = normalize(term)
+        if not term:
+            return set(self._docs)
+        n = min(len(term), MAX_GRAM)
+        postings = sorted((self._postings.get(gram, set()) for gram in ngrams(term, n)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates &= other
+            if not candidates:
+                return candidates
+        if len(term) <= MAX_GRAM:
+            return candidates
+        # n 元组都命中不代表连续出现，长词需要再做一次子串校验
+        return {doc_id for doc_id in candidates if term in self._docs[doc_id]}
+
+
+def _match_score(term, text):
+    """完全匹配 > 前缀匹配 > 子串匹配，同级别下匹配部分占比越高越靠前"""
+    if not term or not text:
+        return 0.0
+    if text == term:
+        base = 3.0
+    elif text.startswith(term):
+        base = 2.0
+    else:
+        base = 1.0
+    return base + len(term) / len(text)
+
+
+class ProductSearchIndex:
+    """商品名称与卖家名称的内存倒排索引"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._names = NgramIndex()         # product_id -> 商品名
+        self._sellers = NgramIndex()       # seller_id -> 卖家用户名
+        self._product_seller = {}          # product_id -> seller_id
+        self._seller_products = defaultdict(set)
+        self._ready = False
+        self._building = False
+        self._pending = []                 # 重建期间发生的增量修改，重建完成后补上
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def has_seller(self, seller_id):
+        with self._lock:
+            return self._sellers.text(seller_id) is not None
+
+    def upsert_product(self, product_id, name, seller_id, seller_name=None):
+        """新增或修改商品时调用"""
+        with self._lock:
+            if self._building:
+                self._pending.append(('upsert', (product_id, name, seller_id, seller_name)))
+            self._upsert(product_id, name, seller_id, seller_name)
+
+    def remove_product(self, product_id):
+        """删除商品时调用"""
+        with self._lock:
+            if self._building:
+                self._pending.append(('remove', (product_id,)))
+            self._remove(product_id)
+
+    def _upsert(self, product_id, name, seller_id, seller_name):
+        old_seller = self._product_seller.get(product_id)
+        if old_seller is not None and old_seller != seller_id:
+            self._seller_products[old_seller].discard(product_id)
+        self._names.add(product_id, name)
+        self._product_seller[product_id] = seller_id
+        self._seller_products[seller_id].add(product_id)
+        if seller_name is not None:
+            self._sellers.add(seller_id, seller_name)
+
+    def _remove(self, product_id):
+        self._names.remove(product_id)
+        seller_id = self._product_seller.pop(product_id, None)
+        if seller_id is not None:
+            self._seller_products[seller_id].discard(product_id)
+
+    def search(self, name=None, seller_name=None):
+        """按商品名和卖家名子串匹配，返回候选商品 ID 集合"""
+        with self._lock:
+            result = None
+            if name:
+                result = self._names.search(name)
+            if seller_name:
+                by_seller = set()
+                for seller_id in self._sellers.search(seller_name):
+                    by_seller |= self._seller_products.get(seller_id, set())
+                result = by_seller if result is None else result & by_seller
+            return result if result is not None else set(self._product_seller)
+
+    def relevance(self, product_id, name=None, seller_name=None):
+        """相关度得分，用于 sort=relevance 排序"""
+        with self._lock:
+            score = 2 * _match_score(normalize(name), self._names.text(product_id))
+            seller_id = self._product_seller.get(product_id)
+            if seller_name and seller_id is not None:
+                score += _match_score(normalize(seller_name), self._sellers.text(seller_id))
+            return score
+
+    def rebuild(self):
+        """从数据库全量重建索引"""
+        with self._lock:
+            self._building = True
+            self._pending = []
+        conn = None
+        try:
+            conn = get_connection()
+            with conn.cursor() as cursor:
+                execute(cursor, 'products.index_all')
+                rows = cursor.fetchall()
+
+            fresh = ProductSearchIndex()
+            for row in rows:
+                fresh._upsert(row['product_id'], row['name'], row['seller_id'], row['seller_name'])
+
+            with self._lock:
+                self._names = fresh._names
+                self._sellers = fresh._sellers
+                self._product_seller = fresh._product_seller
+                self._seller_products = fresh._seller_products
+                for op, args in self._pending:
+                    if op == 'upsert':
+                        self._upsert(*args)
+                    else:
+                        self._remove(*args)
+                self._ready = True
+            return len(rows)
+        finally:
+            with self._lock:
+                self._building = False
+                self._pending = []
+            if conn:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self._ready,
+                'products': len(self._product_seller),
+                'sellers': len(self._seller_products),
+                'name_grams': len(self._names._postings),
+                'seller_grams': len(self._sellers._postings)
+            }
+
+
+product_index = ProductSearchIndex()
+
+
+def index_product(cursor, product_id, name, seller_id):
+    """商品写入后更新索引；卖家尚未被索引时用同一游标查一次用户名"""
+    seller_name = None
+    if not product_index.has_seller(seller_id):
+        execute(cursor, 'users.username', (seller_id,))
+        row = cursor.fetchone()
+        seller_name = row['username'] if row else None
+    product_index.upsert_product(product_id, name, seller_id, seller_name)
+
+
+def rebuild_in_background():
+    """启动时在后台线程构建索引，构建完成前搜索退回 SQL 模糊查询"""
+    def run():
+        try:
+            count = product_index.rebuild()
+            print(f"商品搜索索引构建完成，共 {count} 个商品")
+        except Exception as e:
+            print(f"商品搜索索引构建失败，搜索将使用 SQL 模糊查询: {e}")
+
+    thread = threading.Thread(target=run, name='search-index-rebuild', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,391 @@
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from config import RANKING_CONFIG
+
+# 建表语句与 db_create.txt 对应：ENUM 改为 CHECK 约束，AUTO_INCREMENT 改为 INTEGER PRIMARY KEY，
+# 时间默认值使用本地时间，与 MySQL 的 CURRENT_TIMESTAMP 保持一致。
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username VARCHAR(50) NOT NULL UNIQUE COLLATE NOCASE,  -- 与 MySQL 默认排序规则一样不区分大小写
+        password VARCHAR(255) NOT NULL,
+        role VARCHAR(10) NOT NULL CHECK (role IN ('buyer', 'seller', 'admin'))
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(100) NOT NULL,
+        price DECIMAL(10, 2) NOT NULL,
+        stock INT NOT NULL,
+        seller_id INT REFERENCES users(user_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        buyer_id INT REFERENCES users(user_id),
+        product_id INT REFERENCES products(product_id),
+        quantity INT NOT NULL,
+        total_price DECIMAL(10, 2) NOT NULL,
+        status VARCHAR(10) NOT NULL CHECK (status IN ('已支付', '已取消')),
+        created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cart (
+        cart_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INT NOT NULL REFERENCES products(product_id),
+        user_id INT NOT NULL REFERENCES users(user_id),
+        quantity INT NOT NULL CHECK (quantity > 0)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reviews (
+        product_id INT NOT NULL REFERENCES products(product_id),
+        user_id INT NOT NULL REFERENCES users(user_id),
+        stars INT NOT NULL CHECK (stars BETWEEN 1 AND 5),
+        comment TEXT,
+        PRIMARY KEY (product_id, user_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS average_ratings (
+        product_id INT PRIMARY KEY REFERENCES products(product_id),
+        average_stars DECIMAL(3, 2) NOT NULL DEFAULT 0.00 CHECK (average_stars BETWEEN 0 AND 5),
+        review_count INT NOT NULL DEFAULT 0 CHECK (review_count >= 0),
+        star_sum INT NOT NULL DEFAULT 0 CHECK (star_sum >= 0),
+        rank_score REAL NOT NULL DEFAULT 0  -- MySQL 中为 DECIMAL(7, 6)；REAL 避免按两位小数的 DECIMAL 转换
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS logs (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INT REFERENCES users(user_id) ON DELETE CASCADE,
+        action VARCHAR(255) NOT NULL,
+        description TEXT,
+        timestamp TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS platform_counters (
+        name VARCHAR(50) NOT NULL,
+        shard INT NOT NULL,
+        value DECIMAL(16, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (name, shard)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_seller_id ON products (seller_id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_time ON logs (timestamp, log_id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_user_time ON logs (user_id, timestamp, log_id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_action_time ON logs (action, timestamp, log_id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_ar_rank_score ON average_ratings (rank_score, product_id)",
+    # migrations/0001_workload_indexes.sql
+    "CREATE INDEX IF NOT EXISTS idx_cart_product ON cart (product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_buyer_product_status ON orders (buyer_id, product_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_product_status ON orders (product_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_reviews_user ON reviews (user_id)",
+    # migrations/0002_cart_unique.sql
+    "CREATE UNIQUE INDEX IF NOT EXISTS uk_cart_user_product ON cart (user_id, product_id)",
+]
+
+# 与 routes/average_ratings.py 中 MySQL 触发器等价的 SQLite 触发器。
+# SQLite 的 UPDATE 中所有表达式读取的都是修改前的值，平均星级和排序分数需要显式用新值计算。
+_PRIOR_COUNT = RANKING_CONFIG['prior_count']
+_PRIOR_SUM = float(RANKING_CONFIG['prior_count'] * RANKING_CONFIG['prior_mean'])
+RATING_TRIGGERS = ('before_insert_product', 'after_insert_review', 'after_update_review', 'after_delete_review')
+RANK_SCORE_SQL = f"UPDATE average_ratings SET rank_score = (star_sum + {_PRIOR_SUM}) / (review_count + {_PRIOR_COUNT})"
+
+TRIGGERS = [
+    ('before_insert_product', f"""
+        CREATE TRIGGER IF NOT EXISTS before_insert_product
+        AFTER INSERT ON products
+        BEGIN
+            INSERT INTO average_ratings (product_id, average_stars, review_count, star_sum, rank_score)
+            VALUES (NEW.product_id, 0.00, 0, 0, {_PRIOR_SUM} / {_PRIOR_COUNT});
+        END
+    """),
+    ('before_delete_product_reviews', """
+        CREATE TRIGGER IF NOT EXISTS before_delete_product_reviews
+        BEFORE DELETE ON products
+        BEGIN
+            DELETE FROM reviews WHERE product_id = OLD.product_id;
+        END
+    """),
+    ('before_delete_product_ratings', """
+        CREATE TRIGGER IF NOT EXISTS before_delete_product_ratings
+        BEFORE DELETE ON products
+        BEGIN
+            DELETE FROM average_ratings WHERE product_id = OLD.product_id;
+        END
+    """),
+    ('after_insert_review', f"""
+        CREATE TRIGGER IF NOT EXISTS after_insert_review
+        AFTER INSERT ON reviews
+        BEGIN
+            UPDATE average_ratings
+            SET star_sum = star_sum + NEW.stars,
+                review_count = review_count + 1,
+                average_stars = ROUND((star_sum + NEW.stars) * 1.0 / (review_count + 1), 2),
+                rank_score = (star_sum + NEW.stars + {_PRIOR_SUM}) / (review_count + 1 + {_PRIOR_COUNT})
+            WHERE product_id = NEW.product_id;
+        END
+    """),
+    ('after_update_review', f"""
+        CREATE TRIGGER IF NOT EXISTS after_update_review
+        AFTER UPDATE ON reviews
+        WHEN OLD.product_id <> NEW.product_id OR OLD.stars <> NEW.stars
+        BEGIN
+            UPDATE average_ratings
+            SET star_sum = star_sum - OLD.stars,
+                review_count = review_count - 1,
+                average_stars = CASE WHEN review_count = 1 THEN 0
+                                     ELSE ROUND((star_sum - OLD.stars) * 1.0 / (review_count - 1), 2) END,
+                rank_score = (star_sum - OLD.stars + {_PRIOR_SUM}) / (review_count - 1 + {_PRIOR_COUNT})
+            WHERE product_id = OLD.product_id;
+            UPDATE average_ratings
+            SET star_sum = star_sum + NEW.stars,
+                review_count = review_count + 1,
+                average_stars = ROUND((star_sum + NEW.stars) * 1.0 / (review_count + 1), 2),
+                rank_score = (star_sum + NEW.stars + {_PRIOR_SUM}) / (review_count + 1 + {_PRIOR_COUNT})
+            WHERE product_id = NEW.product_id;
+        END
+    """),
+    ('after_delete_review', f"""
+        CREATE TRIGGER IF NOT EXISTS after_delete_review
+        AFTER DELETE ON reviews
+        BEGIN
+            UPDATE average_ratings
+            SET star_sum = star_sum - OLD.stars,
+                review_count = review_count - 1,
+                average_stars = CASE WHEN review_count = 1 THEN 0
+                                     ELSE ROUND((star_sum - OLD.stars) * 1.0 / (review_count - 1), 2) END,
+                rank_score = (star_sum - OLD.stars + {_PRIOR_SUM}) / (review_count - 1 + {_PRIOR_COUNT})
+            WHERE product_id = OLD.product_id;
+        END
+    """),
+    ('before_delete_cascade_orders', """
+        CREATE TRIGGER IF NOT EXISTS before_delete_cascade_orders
+        BEFORE DELETE ON products
+        BEGIN
+            DELETE FROM orders WHERE product_id = OLD.product_id;
+        END
+    """),
+]
+
+_CENT = Decimal('0.01')
+
+
+def _convert_decimal(value):
+    # 建表语句中的 DECIMAL 列都是两位小数，按 MySQL 的返回形式统一保留两位
+    return Decimal(value.decode()).quantize(_CENT)
+
+
+def _convert_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _casefold_collation(left, right):
+    # NOCASE 只折叠 ASCII 字母，"Café" 与 "CAFÉ" 视为不同；按 Unicode casefold 比较才与 MySQL 一致
+    left, right = left.casefold(), right.casefold()
+    return (left > right) - (left < right)
+
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_converter('DECIMAL', _convert_decimal)
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+
+_PARAM = re.compile(r'%([%s])')
+_FOR_UPDATE = re.compile(r'\s+FOR\s+UPDATE\s*$', re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r'^\s*INSERT\s+IGNORE\b', re.IGNORECASE)
+_WRITE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def translate(sql):
+    """把 MySQL 方言的语句改写为 SQLite 语句，返回 (SQL, 是否需要写锁)
+
+    只处理通用差异：%s 占位符、FOR UPDATE、INSERT IGNORE、ESCAPE 中的反斜杠；
+    语义不同的语句在 queries.SQLITE_QUERIES 中单独给出 SQLite 版本。
+    """
+    sql, locking = _FOR_UPDATE.subn('', sql)
+    sql = _INSERT_IGNORE.sub('INSERT OR IGNORE', sql)
+    # MySQL 字符串中反斜杠需要转义，SQLite 不转义，'\\' 在 SQLite 中是两个字符
+    sql = sql.replace("ESCAPE '\\\\'", "ESCAPE '\\'")
+    sql = _PARAM.sub(lambda match: '?' if match.group(1) == 's' else '%', sql)
+    return sql, bool(locking) or bool(_WRITE.match(sql))
+
+
+class SQLiteCursor:
+    """提供 pymysql DictCursor 的常用接口：%s 占位符、字典行、rowcount、lastrowid
+
+    buffered=True 时 SELECT 结果在 execute 中一次取完，rowcount 为结果行数（与 pymysql 一致）；
+    buffered=False 用于流式输出，按需逐批读取。
+    """
+
+    def __init__(self, connection, buffered=True):
+        self._connection = connection
+        self._cursor = connection._raw.cursor()
+        self._buffered = buffered
+        self._rows = None
+        self._columns = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, sql, params=None):
+        sql, locking = translate(sql)
+        if locking:
+            self._connection._begin_immediate()
+        self._cursor.execute(sql, tuple(params) if params is not None else ())
+        return self._after_execute()
+
+    def executemany(self, sql, seq_of_params):
+        sql, locking = translate(sql)
+        if locking:
+            self._connection._begin_immediate()
+        self._cursor.executemany(sql, [tuple(params) for params in seq_of_params])
+        return self._after_execute()
+
+    def _after_execute(self):
+        self.lastrowid = self._cursor.lastrowid
+        description = self._cursor.description
+        if description is None:
+            self._rows = None
+            self._columns = None
+            self.rowcount = self._cursor.rowcount
+            return self.rowcount
+        self._columns = [column[0] for column in description]
+        if self._buffered:
+            self._rows = [dict(zip(self._columns, row)) for row in self._cursor.fetchall()]
+            self.rowcount = len(self._rows)
+        else:
+            self._rows = None
+            self.rowcount = -1
+        return self.rowcount
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        if self._columns is None:
+            return None
+        row = self._cursor.fetchone()
+        return dict(zip(self._columns, row)) if row is not None else None
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            rows, self._rows = self._rows[:size], self._rows[size:]
+            return rows
+        if self._columns is None:
+            return []
+        return [dict(zip(self._columns, row)) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        if self._columns is None:
+            return []
+        return [dict(zip(self._columns, row)) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """提供 pymysql 连接的常用接口：cursor、commit、rollback、ping、close
+
+    底层连接工作在自动提交模式，由本类显式管理事务：写语句和 FOR UPDATE 查询之前
+    执行 BEGIN IMMEDIATE 取得写锁，提交或回滚后释放。普通查询在 WAL 模式下不阻塞写入。
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, buffered=True):
+        return SQLiteCursor(self, buffered=buffered)
+
+    def _begin_immediate(self):
+        if not self._raw.in_transaction:
+            self._raw.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self._raw.in_transaction:
+            self._raw.execute('COMMIT')
+
+    def rollback(self):
+        if self._raw.in_transaction:
+            self._raw.execute('ROLLBACK')
+
+    def ping(self, reconnect=False):
+        self._raw.execute('SELECT 1').fetchone()
+
+    def close(self):
+        self._raw.close()
+
+
+_schema_lock = threading.Lock()
+_initialized = set()
+
+
+def connect(path, busy_timeout=30):
+    """打开 SQLite 数据库（WAL 模式），首次打开时建表和触发器"""
+    raw = sqlite3.connect(
+        path,
+        timeout=busy_timeout,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        isolation_level=None,       # 自动提交，事务由 SQLiteConnection 管理
+        check_same_thread=False     # 连接由连接池在线程间传递，同一时间只有一个线程使用
+    )
+    raw.execute('PRAGMA journal_mode=WAL')
+    raw.execute('PRAGMA synchronous=NORMAL')
+    raw.execute('PRAGMA foreign_keys=ON')
+    raw.create_collation('CASEFOLD', _casefold_collation)
+    with _schema_lock:
+        if path not in _initialized:
+            init_schema(raw)
+            _initialized.add(path)
+    return SQLiteConnection(raw)
+
+
+def init_schema(raw):
+    """建表、建索引并创建触发器，已存在的对象保持不变"""
+    _add_rank_score(raw)
+    for sql in SCHEMA:
+        raw.execute(sql)
+    create_triggers(raw)
+
+
+def _add_rank_score(raw):
+    """早期创建的库没有 rank_score 列：补齐并重算，删除旧的评分触发器以便按新定义重建"""
+    columns = {row[1] for row in raw.execute('PRAGMA table_info(average_ratings)')}
+    if not columns or 'rank_score' in columns:
+        return
+    raw.execute('ALTER TABLE average_ratings ADD COLUMN rank_score REAL NOT NULL DEFAULT 0')
+    raw.execute(RANK_SCORE_SQL)
+    for name in RATING_TRIGGERS:
+        raw.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def create_triggers(executor):
+    """创建缺失的触发器，executor 可以是 sqlite3 连接或 SQLiteCursor"""
+    for _, sql in TRIGGERS:
+        executor.execute(sql)
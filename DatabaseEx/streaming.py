@@ -0,0 +1,165 @@
+import csv
+import io
+import zlib
+
+from flask import Response, current_app, request
+
+from db import get_pool, unbuffered_cursor
+from queries import execute, query_stats
+
+STREAM_FORMATS = ('json', 'ndjson')
+EXPORT_FORMATS = ('csv', 'ndjson')
+FETCH_SIZE = 1000          # 每次从无缓冲游标读取的行数
+CHUNK_SIZE = 64 * 1024     # 攒够该字节数再向客户端输出一次
+GZIP_LEVEL = 6             # 边读边压缩的压缩级别，兼顾 CPU 与压缩率
+
+MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def stream_format():
+    """客户端选择的流式格式：?stream=json|ndjson 或 Accept: application/x-ndjson，未选择时返回 None"""
+    fmt = request.args.get('stream', type=str)
+    if fmt:
+        fmt = fmt.lower()
+        if fmt in ('1', 'true'):
+            return 'json'
+        return fmt if fmt in STREAM_FORMATS else None
+    if request.accept_mimetypes.best == 'application/x-ndjson':
+        return 'ndjson'
+    return None
+
+
+def wants_gzip():
+    """?gzip=1 或 Accept-Encoding 包含 gzip 时压缩响应"""
+    flag = request.args.get('gzip', type=str)
+    if flag is not None:
+        return flag.lower() in ('1', 'true')
+    return 'gzip' in request.accept_encodings
+
+
+def _csv_value(value):
+    # 时间统一输出到秒，Decimal 保持原样的小数位，NULL 输出空串
+    if value is None:
+        return ''
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+class _Encoder:
+    """把结果行编码为 JSON 数组、NDJSON 或 CSV 文本片段"""
+
+    def __init__(self, fmt, columns):
+        self.fmt = fmt
+        self.columns = columns
+        self.dumps = current_app.json.dumps
+        self.first = True
+        if fmt == 'csv':
+            self._buffer = io.StringIO()
+            self._writer = csv.writer(self._buffer, lineterminator='\r\n')
+
+    def head(self):
+        if self.fmt == 'json':
+            return '['
+        if self.fmt == 'csv':
+            # 带 BOM 便于 Excel 按 UTF-8 打开中文
+            return '\ufeff' + self.rows([self.columns], header=True)
+        return ''
+
+    def tail(self):
+        return ']' if self.fmt == 'json' else ''
+
+    def rows(self, rows, header=False):
+        if self.fmt == 'csv':
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            if header:
+                self._writer.writerows(rows)
+            else:
+                self._writer.writerows([_csv_value(row[column]) for column in self.columns] for row in rows)
+            return self._buffer.getvalue()
+        dumps = self.dumps
+        if self.fmt == 'ndjson':
+            return ''.join(dumps(row) + '\n' for row in rows)
+        text = ','.join(dumps(row) for row in rows)
+        if not self.first:
+            text = ',' + text
+        self.first = False
+        return text
+
+
+def stream_query(name, params=None, fmt='json', compress=False, filename=None, **parts):
+    """用无缓冲游标执行具名查询，并以 JSON 数组、NDJSON 或 CSV 增量输出结果
+
+    内存占用与结果集大小无关，第一行取到后即可开始输出；响应不带 Content-Length，按分块传输。
+    compress 为 True 时边输出边 gzip 压缩，filename 非空时作为附件下载。
+    连接单独从连接池取出，响应结束后归还；客户端中途断开时直接关闭连接，避免读完剩余结果。
+    """
+    conn = get_pool().acquire()
+    try:
+        cursor = unbuffered_cursor(conn)
+        execute(cursor, name, params, **parts)
+        columns = [column[0] for column in cursor.description]
+    except Exception:
+        conn.discard()
+        raise
+
+    encoder = _Encoder(fmt, columns)
+    state = {'finished': False}
+
+    def generate_text():
+        # 开头和第一批结果立即输出，之后的结果攒够 CHUNK_SIZE 再输出
+        rows = cursor.fetchmany(FETCH_SIZE)
+        total = len(rows)
+        yield encoder.head() + (encoder.rows(rows) if rows else '')
+        buffer = []
+        size = 0
+        while rows:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            total += len(rows)
+            text = encoder.rows(rows)
+            buffer.append(text)
+            size += len(text)
+            if size >= CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        buffer.append(encoder.tail())
+        yield ''.join(buffer)
+        state['finished'] = True
+        query_stats.add_rows(name, total)
+
+    def generate_gzip():
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 输出 gzip 格式
+        first = True
+        for text in generate_text():
+            data = compressor.compress(text.encode('utf-8'))
+            if first:
+                # 第一块同步刷出，否则压缩器会把它留在内部缓冲区
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                first = False
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def cleanup():
+        if state['finished']:
+            cursor.close()
+            conn.release()
+        else:
+            conn.discard()
+
+    response = Response(generate_gzip() if compress else generate_text(), mimetype=MIMETYPES[fmt])
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.call_on_close(cleanup)
+    return response
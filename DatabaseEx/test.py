@@ -0,0 +1,146 @@
+"""接口语句条数测试：在临时 SQLite 库上通过 Flask 测试客户端调用评价接口，
+断言每条路径执行的具名语句条数，并开启 QUERY_BUDGET_CONFIG['enforce'] 让超出声明上限的请求直接失败。
+
+在 DatabaseEx 目录下运行：
+
+    python -m unittest test -v
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import config
+
+_tmpdir = tempfile.mkdtemp(prefix='dbex-test-')
+config.DB_CONFIG.update(backend='sqlite', sqlite_path=os.path.join(_tmpdir, 'test.db'))
+config.CART_CONFIG['journal_path'] = os.path.join(_tmpdir, 'cart_journal.jsonl')
+config.QUERY_BUDGET_CONFIG['enforce'] = True
+
+from app import app  # noqa: E402
+from db import get_connection  # noqa: E402
+from queries import query_count  # noqa: E402
+
+PASSWORD = 'pw123456'
+
+
+def tearDownModule():
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+
+class ReviewQueryCountTest(unittest.TestCase):
+    """add_review、update_review、admin_delete_review 各条路径的语句条数"""
+
+    @classmethod
+    def setUpClass(cls):
+        app.testing = True
+        cls.client = app.test_client()
+        seller = cls.login('rq_seller', 'seller')
+        cls.buyer = cls.login('rq_buyer', 'buyer')
+        cls.admin = cls.login('rq_admin', 'admin')
+        cls.buyer_id = cls.user_id('rq_buyer')
+
+        cls.bought = cls.create_product(seller, 'rq_bought')
+        cls.not_bought = cls.create_product(seller, 'rq_not_bought')
+        response = cls.client.post('/api/orders', json={'product_id': cls.bought, 'quantity': 1}, headers=cls.buyer)
+        assert response.status_code == 201, response.get_json()
+
+    @classmethod
+    def login(cls, username, role):
+        if role == 'admin':
+            # 注册接口不允许创建管理员，直接写库
+            conn = get_connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("INSERT INTO users (username, password, role) VALUES (%s, %s, 'admin')",
+                                   (username, PASSWORD))
+                conn.commit()
+            finally:
+                conn.close()
+        else:
+            cls.client.post('/api/users/register', json={'username': username, 'password': PASSWORD, 'role': role})
+        response = cls.client.post('/api/users/login', json={'username': username, 'password': PASSWORD})
+        return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+    @classmethod
+    def user_id(cls, username):
+        conn = get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT user_id FROM users WHERE username = %s", (username,))
+                return cursor.fetchone()['user_id']
+        finally:
+            conn.close()
+
+    @classmethod
+    def create_product(cls, headers, name):
+        response = cls.client.post('/api/products', json={'name': name, 'price': 9.9, 'stock': 100}, headers=headers)
+        assert response.status_code == 201, response.get_json()
+        products = cls.client.get('/api/products/seller', headers=headers).get_json()
+        return next(product['product_id'] for product in products if product['name'] == name)
+
+    def call(self, method, path, headers, json=None):
+        """发出请求，返回 (响应, 本次请求执行的具名语句条数)"""
+        start = query_count()
+        response = self.client.open(path, method=method, json=json, headers=headers)
+        return response, query_count() - start
+
+    def add_review(self, product_id, stars):
+        return self.call('POST', '/api/reviews', self.buyer,
+                         {'product_id': product_id, 'stars': stars, 'comment': f'{stars} 星'})
+
+    def test_add_review(self):
+        # 新增与更新都是一条 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE
+        response, count = self.add_review(self.bought, 4)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(count, 1)
+
+        response, count = self.add_review(self.bought, 5)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(count, 1)
+
+    def test_add_review_log_action(self):
+        # SQLite 的影响行数不区分新增和更新，更新不能记成“新增评价成功”
+        self.add_review(self.bought, 4)
+        with mock.patch('routes.reviews.log_action') as log_action:
+            self.add_review(self.bought, 5)
+        self.assertEqual(log_action.call_args.args[1], '提交评价成功')
+
+    def test_add_review_not_purchased(self):
+        # 没有写入时再查一次区分原因
+        response, count = self.add_review(self.not_bought, 4)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(count, 2)
+
+    def test_add_review_missing_product(self):
+        response, count = self.add_review(999999, 4)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(count, 2)
+
+    def test_update_review(self):
+        self.add_review(self.bought, 3)
+        response, count = self.call('PUT', f'/api/reviews/{self.bought}', self.buyer, {'stars': 2, 'comment': '改'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(count, 1)
+
+    def test_update_review_missing(self):
+        response, count = self.call('PUT', f'/api/reviews/{self.not_bought}', self.buyer, {'stars': 2})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(count, 2)
+
+    def test_admin_delete_review(self):
+        self.add_review(self.bought, 3)
+        path = f'/api/reviews/admin/{self.bought}/{self.buyer_id}'
+        response, count = self.call('DELETE', path, self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(count, 1)
+
+        # 评价已不存在，按影响行数判断，不再多查
+        response, count = self.call('DELETE', path, self.admin)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()